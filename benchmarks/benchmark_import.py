@@ -0,0 +1,53 @@
+'''
+Utility functions for "Data Mining for Business Analytics: Concepts, Techniques, and
+Applications in Python"
+
+(c) 2019-2023 Galit Shmueli, Peter C. Bruce, Peter Gedeck
+
+Measure the cold-start time of `import dmba` and of typical first uses in new interpreters.
+The heavy dependencies (matplotlib, scikit-learn, scipy) are only imported when needed.
+
+    python benchmarks/benchmark_import.py --repeat 5
+'''
+import argparse
+import math
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parents[1] / 'src'
+
+SCENARIOS = {
+    'import dmba': 'import dmba',
+    'regressionSummary': 'import dmba; dmba.regressionSummary([1, 2, 3], [1, 2, 4])',
+    'load_data': 'import dmba; dmba.load_data("Amtrak")',
+    'liftChart': 'import dmba; dmba.liftChart(__import__("pandas").Series([0.9, 0.5, 0.1]))',
+}
+
+
+def coldstart(code: str, repeat: int) -> float:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(SRC), os.environ.get('PYTHONPATH', '')]))
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True, env=env, stdout=subprocess.DEVNULL)  # noqa: S603
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    baseline = coldstart('pass', args.repeat)
+    print(f'{"scenario":>20} {"time [s]":>10}')
+    print(f'{"interpreter":>20} {baseline:10.3f}')
+    for name, code in SCENARIOS.items():
+        print(f'{name:>20} {coldstart(code, args.repeat) - baseline:10.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+'''
+Utility functions for "Data Mining for Business Analytics: Concepts, Techniques, and
+Applications in Python"
+
+(c) 2019-2023 Galit Shmueli, Peter C. Bruce, Peter Gedeck
+
+Compare the vectorized regression_metrics with the element-wise implementation used by
+regressionSummary up to version 0.2.4.
+
+    python benchmarks/benchmark_metric.py --sizes 10000 1000000
+'''
+import argparse
+import math
+import time
+from typing import Any, Callable, Dict
+
+import numpy as np
+from sklearn.metrics import mean_squared_error
+
+from dmba.metric import regression_metrics
+
+
+def legacy_regression_metrics(y_true: np.ndarray, y_pred: np.ndarray) -> Dict[str, float]:
+    y_res = y_true - y_pred
+    metrics = {
+        'ME': sum(y_res) / len(y_res),
+        'RMSE': math.sqrt(mean_squared_error(y_true, y_pred)),
+        'MAE': sum(abs(y_res)) / len(y_res),
+    }
+    if all(yt != 0 for yt in y_true):
+        metrics['MPE'] = 100 * sum(y_res / y_true) / len(y_res)
+        metrics['MAPE'] = 100 * sum(abs(y_res / y_true) / len(y_res))
+    return metrics
+
+
+def timeit(function: Callable[..., Any], *args: Any, repeat: int = 3) -> float:
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--legacy-limit', type=int, default=1_000_000,
+                        help='skip the element-wise implementation for larger sizes')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f'{"rows":>12} {"dtype":>8} {"legacy [s]":>12} {"vectorized [s]":>15} {"speedup":>8}')
+    for size in args.sizes:
+        y_true = rng.uniform(1, 100, size=size)
+        y_pred = y_true + rng.normal(size=size)
+        for dtype in (np.float64, np.float32):
+            yt = y_true.astype(dtype)
+            yp = y_pred.astype(dtype)
+            vectorized = timeit(regression_metrics, yt, yp)
+            if size <= args.legacy_limit:
+                legacy = timeit(legacy_regression_metrics, yt, yp, repeat=1)
+                print(f'{size:12d} {np.dtype(dtype).name:>8} {legacy:12.4f} {vectorized:15.4f} '
+                      f'{legacy / vectorized:8.0f}x')
+            else:
+                print(f'{size:12d} {np.dtype(dtype).name:>8} {"-":>12} {vectorized:15.4f} {"-":>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+'''
+Utility functions for "Data Mining for Business Analytics: Concepts, Techniques, and
+Applications in Python"
+
+(c) 2019-2023 Galit Shmueli, Peter C. Bruce, Peter Gedeck
+
+Benchmark cases for the public functions of dmba. Each case creates its input for a given number
+of rows in setup; only run is measured.
+'''
+from pathlib import Path
+from typing import Any, Callable, List, NamedTuple, Optional, Tuple
+
+import generators
+import numpy as np
+from sklearn.linear_model import LinearRegression
+from sklearn.tree import DecisionTreeRegressor
+
+import dmba
+from dmba import metric
+
+
+class Benchmark(NamedTuple):
+    name: str
+    setup: Callable[[int], Tuple[Any, ...]]
+    run: Callable[..., Any]
+    max_rows: int = 10 ** 8
+    sizes: Optional[Tuple[int, ...]] = None  # fixed sizes, independent of the preset
+
+
+def _stepwise(X: Any, y: Any) -> Any:
+    return dmba.stepwise_selection(list(X.columns), dmba.LinearSubsetModel(X, y), verbose=False)
+
+
+def _stepwise_sklearn(X: Any, y: Any) -> Any:
+    def train_model(variables: List[str]) -> Any:
+        return None if not variables else LinearRegression().fit(X[variables], y)
+
+    def score_model(model: Any, variables: List[str]) -> float:
+        if not variables:
+            return dmba.AIC_score(y, [y.mean()] * len(y), df=1)
+        return dmba.AIC_score(y, model.predict(X[variables]), model)
+
+    return dmba.stepwise_selection(list(X.columns), train_model, score_model, verbose=False)
+
+
+def _stepwise_cv(X: Any, y: Any, halving: Optional[int] = None) -> Any:
+    model = dmba.CrossValidatedSubsetModel(LinearRegression(), X, y, cv=3, scoring='neg_mean_squared_error')
+    return dmba.stepwise_selection(list(X.columns), model, verbose=False, halving=halving)
+
+
+def _exhaustive(X: Any, y: Any) -> Any:
+    return dmba.exhaustive_search(list(X.columns), dmba.LinearSubsetModel(X, y))
+
+
+def _tree(size: int) -> Tuple[Any]:
+    X, y = generators.regression_data(size, 10)
+    return (DecisionTreeRegressor(min_samples_leaf=5, random_state=0).fit(X, y),)
+
+
+def _load_data(name: str) -> Any:
+    dmba.data.clear_cache()
+    return dmba.load_data(name)
+
+
+def _load_data_iter(name: str) -> int:
+    return sum(len(chunk) for chunk in dmba.load_data_iter(name, chunksize=100_000))
+
+
+def _sketch(scores: np.ndarray, actual: np.ndarray) -> Any:
+    sketch = dmba.GainsSketch()
+    for start in range(0, len(scores), 1_000_000):
+        sketch.update(scores[start:start + 1_000_000], actual[start:start + 1_000_000])
+    return sketch
+
+
+def _corpus() -> int:
+    return sum(counts.shape[0] for _, counts in dmba.CorpusVectorizer(batch_size=500))
+
+
+class _HashedTerms:
+    """ Vectorizer without vocabulary like HashingVectorizer """
+
+
+def benchmarks(data_dir: Path) -> List[Benchmark]:
+    """ All benchmark cases; data files for load_data are written to data_dir """
+    def data_file(size: int) -> Tuple[str]:
+        return (generators.csv_file(data_dir, size),)
+
+    cases = [
+        # metric
+        Benchmark('regression_metrics', generators.predictions, metric.regression_metrics),
+        Benchmark('regression_metrics[float32]', lambda size: generators.predictions(size, dtype=np.float32),
+                  metric.regression_metrics),
+        Benchmark('information_criteria', generators.predictions,
+                  lambda y_true, y_pred: dmba.information_criteria(y_true, y_pred, df=5)),
+        Benchmark('AIC_scores[50 models]', lambda size: generators.prediction_matrix(size, 50),
+                  lambda y_true, y_pred: dmba.AIC_scores(y_true, y_pred, 5), max_rows=10 ** 6),
+        Benchmark('sparse_confusion_matrix[10 classes]', lambda size: generators.class_labels(size, 10),
+                  metric.sparse_confusion_matrix),
+        Benchmark('top_confused_pairs[1000 classes]', lambda size: generators.class_labels(size, 1000),
+                  metric.top_confused_pairs),
+        Benchmark('ClassificationMetricsAccumulator', lambda size: generators.class_labels(size, 10),
+                  lambda y_true, y_pred: metric.ClassificationMetricsAccumulator().update(y_true, y_pred).metrics()),
+        # graphs
+        Benchmark('liftChart[scores]', generators.scores_and_outcomes,
+                  lambda scores, actual: dmba.liftChart(actual, scores=scores, compute_only=True)),
+        Benchmark('gainsChart[scores]', generators.scores_and_outcomes,
+                  lambda scores, actual: dmba.gainsChart(actual, scores=scores, compute_only=True)),
+        Benchmark('GainsSketch', generators.scores_and_outcomes, _sketch),
+        Benchmark('textDecisionTree', _tree, dmba.textDecisionTree, max_rows=10 ** 6),
+        # featureSelection
+        Benchmark('stepwise_selection[p=10]', lambda size: generators.regression_data(size, 10), _stepwise),
+        Benchmark('stepwise_selection[p=50]', lambda size: generators.regression_data(size, 50), _stepwise,
+                  max_rows=10 ** 6),
+        Benchmark('stepwise_selection[p=200]', lambda size: generators.regression_data(size, 200), _stepwise,
+                  max_rows=10 ** 5),
+        Benchmark('stepwise_selection[sklearn p=10]', lambda size: generators.regression_data(size, 10),
+                  _stepwise_sklearn, max_rows=10 ** 5),
+        Benchmark('stepwise_selection[cv p=10]', lambda size: generators.regression_data(size, 10),
+                  _stepwise_cv, max_rows=10 ** 5),
+        Benchmark('stepwise_selection[cv halving p=10]', lambda size: generators.regression_data(size, 10),
+                  lambda X, y: _stepwise_cv(X, y, halving=1000), max_rows=10 ** 6),
+        Benchmark('exhaustive_search[p=15]', lambda size: generators.regression_data(size, 15), _exhaustive,
+                  max_rows=10 ** 6),
+        # data
+        Benchmark('load_data', data_file, _load_data, max_rows=10 ** 6),
+        Benchmark('load_data[memory cache]', data_file, dmba.load_data, max_rows=10 ** 6),
+        Benchmark('load_data_iter', data_file, _load_data_iter, max_rows=10 ** 6),
+        # textMining
+        Benchmark('termDocumentMatrix[top_n=20]', lambda size: (None, generators.term_document_matrix(size, 50_000)),
+                  lambda _, counts: dmba.termDocumentMatrix(_HashedTerms(), counts, top_n=20), max_rows=10 ** 6),
+        Benchmark('CorpusVectorizer[AutoAndElectronics]', lambda _: (), _corpus, sizes=(2000,)),
+    ]
+    return cases
+
@@ -0,0 +1,81 @@
+'''
+Utility functions for "Data Mining for Business Analytics: Concepts, Techniques, and
+Applications in Python"
+
+(c) 2019-2023 Galit Shmueli, Peter C. Bruce, Peter Gedeck
+
+Synthetic data for the benchmarks; all generators are deterministic for a given seed.
+'''
+from pathlib import Path
+from typing import Any, Tuple
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+
+def regression_data(n_rows: int, n_features: int, seed: int = 0) -> Tuple[pd.DataFrame, np.ndarray]:
+    """ Predictors with correlated columns and an outcome that depends on the first half of them """
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_rows, n_features))
+    X[:, 1:] += 0.3 * X[:, :-1]
+    coef = np.where(np.arange(n_features) < n_features // 2, rng.uniform(0.5, 2, n_features), 0)
+    y = X @ coef + rng.normal(size=n_rows)
+    return pd.DataFrame(X, columns=[f'x{i}' for i in range(n_features)]), y
+
+
+def predictions(n_rows: int, seed: int = 0, dtype: Any = np.float64) -> Tuple[np.ndarray, np.ndarray]:
+    """ Positive actual values and predictions with normal errors """
+    rng = np.random.default_rng(seed)
+    y_true = rng.uniform(1, 100, size=n_rows).astype(dtype)
+    y_pred = (y_true + rng.normal(size=n_rows)).astype(dtype)
+    return y_true, y_pred
+
+
+def prediction_matrix(n_rows: int, n_models: int, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """ Actual values and the predictions of n_models models with increasing errors """
+    rng = np.random.default_rng(seed)
+    y_true = rng.normal(size=n_rows)
+    y_pred = y_true[:, np.newaxis] + rng.normal(size=(n_rows, n_models)) * np.linspace(0.5, 2, n_models)
+    return y_true, y_pred
+
+
+def class_labels(n_rows: int, n_classes: int, seed: int = 0, accuracy: float = 0.8) -> Tuple[np.ndarray, np.ndarray]:
+    """ Actual and predicted class labels; misclassifications are spread over all classes """
+    rng = np.random.default_rng(seed)
+    y_true = rng.integers(0, n_classes, size=n_rows)
+    wrong = rng.random(n_rows) > accuracy
+    y_pred = np.where(wrong, rng.integers(0, n_classes, size=n_rows), y_true)
+    return y_true, y_pred
+
+
+def scores_and_outcomes(n_rows: int, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """ Unsorted model scores and binary outcomes with P(outcome = 1) = score """
+    rng = np.random.default_rng(seed)
+    scores = rng.random(n_rows)
+    return scores, (rng.random(n_rows) < scores).astype(np.int8)
+
+
+def term_document_matrix(n_documents: int, n_terms: int, terms_per_document: int = 50,
+                         seed: int = 0) -> sp.csr_matrix:
+    """ Term counts with a Zipf-like distribution of the term frequencies """
+    rng = np.random.default_rng(seed)
+    nnz = n_documents * terms_per_document
+    rows = np.repeat(np.arange(n_documents), terms_per_document)
+    cols = np.minimum(rng.zipf(1.3, size=nnz) - 1, n_terms - 1)
+    return sp.csr_matrix((np.ones(nnz, dtype=np.int64), (rows, cols)), shape=(n_documents, n_terms))
+
+
+def csv_file(directory: Path, n_rows: int, n_features: int = 10, seed: int = 0) -> str:
+    """ Write a data file with numeric and categorical columns in the format of the bundled data
+
+    Returns the absolute path without suffix, which load_data accepts in place of a name.
+    """
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame(rng.normal(size=(n_rows, n_features)).round(4),
+                        columns=[f'x{i}' for i in range(n_features)])
+    data['category'] = rng.choice(['low', 'medium', 'high'], size=n_rows)
+    data['count'] = rng.integers(0, 1000, size=n_rows)
+    name = directory / f'Synthetic{n_rows}x{n_features}'
+    data.to_csv(f'{name}.csv.gz', index=False)
+    return str(name.resolve())
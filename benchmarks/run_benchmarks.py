@@ -0,0 +1,149 @@
+'''
+Utility functions for "Data Mining for Business Analytics: Concepts, Techniques, and
+Applications in Python"
+
+(c) 2019-2023 Galit Shmueli, Peter C. Bruce, Peter Gedeck
+
+Run the benchmarks of the public dmba functions on synthetic data and compare with a baseline.
+For each case and number of rows, the best time of several runs, the throughput in rows per
+second, and the peak memory allocated during a run (tracemalloc) are reported.
+
+    python benchmarks/run_benchmarks.py                    # quick preset, compare with the baseline
+    python benchmarks/run_benchmarks.py --preset full --filter metric
+    python benchmarks/run_benchmarks.py --save-baseline    # store the results as new baseline
+
+Presets: quick (10^3 - 10^5 rows), full (10^3 - 10^7 rows), huge (10^3 - 10^8 rows); cases
+with expensive setup are limited to fewer rows.
+'''
+import argparse
+import gc
+import io
+import json
+import math
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import matplotlib as mpl
+import numpy as np
+import pandas as pd
+from cases import Benchmark, benchmarks
+
+import dmba
+
+BASELINE = Path(__file__).parent / 'baseline.json'
+MIN_SECONDS = 0.001
+PRESETS = {
+    'quick': [10 ** 3, 10 ** 4, 10 ** 5],
+    'full': [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7],
+    'huge': [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7, 10 ** 8],
+}
+
+
+def measure(case: Benchmark, size: int, repeat: int) -> Dict[str, Any]:
+    args = case.setup(size)
+    with redirect_stdout(io.StringIO()):
+        if size <= 10 ** 5:
+            case.run(*args)  # warm up, e.g. lazy imports
+        best = math.inf
+        for _ in range(repeat):
+            gc.collect()
+            start = time.perf_counter()
+            case.run(*args)
+            best = min(best, time.perf_counter() - start)
+
+        gc.collect()
+        tracemalloc.start()
+        try:
+            case.run(*args)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return {'name': case.name, 'size': size, 'seconds': best, 'throughput': size / best, 'peak_mb': peak / 2 ** 20}
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> int:
+    """ Print the results with the ratio to the baseline; returns the number of regressions """
+    reference = {(r['name'], r['size']): r for r in baseline['results']}
+    regressions = 0
+    print(f'\n{"benchmark":<40} {"rows":>10} {"time [s]":>10} {"rows/s":>10} {"peak [MB]":>10} '
+          f'{"time ratio":>10} {"mem ratio":>10}')
+    for result in results:
+        base = reference.get((result['name'], result['size']))
+        timeRatio = memoryRatio = ''
+        status = ''
+        if base is not None:
+            ratio = result['seconds'] / base['seconds']
+            timeRatio = f'{ratio:.2f}'
+            if base['peak_mb'] > 0.1:
+                memoryRatio = f'{result["peak_mb"] / base["peak_mb"]:.2f}'
+            # timings below a millisecond are too noisy to compare
+            if ratio > 1 + tolerance and result['seconds'] > MIN_SECONDS:
+                status = '  slower'
+                regressions += 1
+        print(f'{result["name"]:<40} {result["size"]:>10} {result["seconds"]:10.4f} {result["throughput"]:10.3g} '
+              f'{result["peak_mb"]:10.1f} {timeRatio:>10} {memoryRatio:>10}{status}')
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='quick')
+    parser.add_argument('--filter', default='', help='only run benchmarks whose name contains this text')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', type=Path, help='write the results to this JSON file')
+    parser.add_argument('--baseline', type=Path, default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='report runs that are slower than the baseline by more than this fraction')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+    mpl.use('Agg')
+
+    results = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        for case in benchmarks(Path(data_dir)):
+            if args.filter not in case.name:
+                continue
+            sizes = case.sizes or [size for size in PRESETS[args.preset] if size <= case.max_rows]
+            for size in sizes:
+                result = measure(case, size, repeat=1 if size >= 10 ** 7 else args.repeat)
+                print(f'{case.name:<40} {size:>10} {result["seconds"]:10.4f} s', flush=True)
+                results.append(result)
+
+    output = {
+        'meta': {
+            'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'preset': args.preset,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'dmba': dmba.__version__,
+            'machine': platform.machine(),
+        },
+        'results': results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(output, indent=2))
+
+    baseline: Optional[Dict[str, Any]] = None
+    if args.baseline.exists() and not args.save_baseline:
+        baseline = json.loads(args.baseline.read_text())
+    regressions = compare(results, baseline or {'results': []}, args.tolerance)
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(output, indent=2) + '\n')
+        print(f'\nBaseline written to {args.baseline}')
+    elif baseline is not None:
+        print(f'\nCompared with baseline from {baseline["meta"]["date"]} ({regressions} slower)')
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -35,7 +35,7 @@ setuptools.setup(
         "dmba": ["csvFiles/*.csv.gz", "csvFiles/*.zip"],
     },
     install_requires=[
-        'graphviz',
+        'graphviz>=0.19',
         'matplotlib',
         'numpy',
         'pandas',
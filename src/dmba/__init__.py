@@ -4,21 +4,74 @@ Applications in Python"
 
 (c) 2019-2023 Galit Shmueli, Peter C. Bruce, Peter Gedeck
 '''
-import os
-import sys
+import importlib
+from typing import TYPE_CHECKING, Any, List
 
-import matplotlib as mpl
-
-from .data import get_data_file, load_data
-from .featureSelection import backward_elimination, exhaustive_search, forward_selection, stepwise_selection
-from .graphs import gainsChart, liftChart, plotDecisionTree, textDecisionTree
-from .metric import AIC_score, BIC_score, adjusted_r2_score, classificationSummary, regressionSummary
-from .textMining import printTermDocumentMatrix
 from .version import __version__
 
-if 'google.colab' in sys.modules:
-    print('Colab environment detected.')
-else:
-    if os.environ.get('DISPLAY', '') == '' and os.name != 'nt':
-        print('no display found. Using non-interactive Agg backend')
-        mpl.use('Agg')
+if TYPE_CHECKING:
+    from .data import get_data_file, load_data, load_data_iter
+    from .featureSelection import (SubsetCache, backward_elimination, exhaustive_search, forward_selection,
+                                   stepwise_selection)
+    from .graphs import GainsSketch, gainsChart, liftChart, plotDecisionTree, textDecisionTree
+    from .metric import (AIC_score, AIC_scores, BIC_score, BIC_scores, ClassificationMetricsAccumulator,
+                         RegressionMetricsAccumulator, adjusted_r2_score, adjusted_r2_scores, classificationSummary,
+                         information_criteria, per_class_metrics, regression_metrics, regressionSummary,
+                         sparse_confusion_matrix, top_confused_pairs)
+    from .subsetModels import CrossValidatedSubsetModel, LinearSubsetModel
+    from .textMining import CorpusVectorizer, printTermDocumentMatrix, termDocumentMatrix
+
+# The submodules are imported on first access of one of their functions (PEP 562). This keeps
+# `import dmba` fast; e.g. matplotlib is only imported when a chart is created.
+_LAZY_ATTRIBUTES = {
+    'get_data_file': 'data',
+    'load_data': 'data',
+    'load_data_iter': 'data',
+    'SubsetCache': 'featureSelection',
+    'backward_elimination': 'featureSelection',
+    'exhaustive_search': 'featureSelection',
+    'forward_selection': 'featureSelection',
+    'stepwise_selection': 'featureSelection',
+    'GainsSketch': 'graphs',
+    'gainsChart': 'graphs',
+    'liftChart': 'graphs',
+    'plotDecisionTree': 'graphs',
+    'textDecisionTree': 'graphs',
+    'AIC_score': 'metric',
+    'AIC_scores': 'metric',
+    'BIC_score': 'metric',
+    'BIC_scores': 'metric',
+    'ClassificationMetricsAccumulator': 'metric',
+    'RegressionMetricsAccumulator': 'metric',
+    'adjusted_r2_score': 'metric',
+    'adjusted_r2_scores': 'metric',
+    'classificationSummary': 'metric',
+    'information_criteria': 'metric',
+    'per_class_metrics': 'metric',
+    'regressionSummary': 'metric',
+    'regression_metrics': 'metric',
+    'sparse_confusion_matrix': 'metric',
+    'top_confused_pairs': 'metric',
+    'CrossValidatedSubsetModel': 'subsetModels',
+    'LinearSubsetModel': 'subsetModels',
+    'CorpusVectorizer': 'textMining',
+    'printTermDocumentMatrix': 'textMining',
+    'termDocumentMatrix': 'textMining',
+}
+_SUBMODULES = {'data', 'featureSelection', 'graphs', 'metric', 'subsetModels', 'textMining'}
+
+__all__ = ['__version__', *_LAZY_ATTRIBUTES]
+
+
+def __getattr__(name: str) -> Any:
+    if name in _SUBMODULES:
+        return importlib.import_module(f'.{name}', __name__)
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(f'.{_LAZY_ATTRIBUTES[name]}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES) | _SUBMODULES)
@@ -4,25 +4,138 @@ Applications in Python"
 
 (c) 2019-2023 Galit Shmueli, Peter C. Bruce, Peter Gedeck
 '''
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
 from pathlib import Path
-from typing import Any, Union
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
 
+import numpy as np
 import pandas as pd
 
 DATA_DIR = Path(__file__).parent / 'csvFiles'
 
+# Directory of the on-disk cache; the cache is disabled if not set
+_settings: Dict[str, Any] = {
+    'cache_dir': Path(os.environ['DMBA_CACHE_DIR']) if os.environ.get('DMBA_CACHE_DIR') else None,
+}
+CACHE_SUFFIX = '.dmbacache'
+CACHE_VERSION = 1
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    currsize: int
+    nbytes: int
+    maxbytes: int
+
+
+# file name, modification time, size, and keyword arguments of read_csv
+MemoryCacheKey = Tuple[str, int, int, str]
+
+
+class _MemoryCache:
+    """ Thread-safe least recently used cache of data frames with a limit on their total size in bytes """
+    def __init__(self, maxbytes: int) -> None:
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        self._nbytes = 0
+        self._entries: OrderedDict[MemoryCacheKey, Tuple[pd.DataFrame, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: MemoryCacheKey) -> Optional[pd.DataFrame]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: MemoryCacheKey, data: pd.DataFrame) -> None:
+        nbytes = int(data.memory_usage(index=True, deep=True).sum())
+        with self._lock:
+            if nbytes > self.maxbytes:
+                return
+            if key in self._entries:
+                self._nbytes -= self._entries.pop(key)[1]
+            self._entries[key] = (data, nbytes)
+            self._nbytes += nbytes
+            self._evict()
+
+    def resize(self, maxbytes: int) -> None:
+        with self._lock:
+            self.maxbytes = maxbytes
+            self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, len(self._entries), self._nbytes, self.maxbytes)
+
+    def _evict(self) -> None:
+        while self._entries and self._nbytes > self.maxbytes:
+            self._nbytes -= self._entries.popitem(last=False)[1][1]
+
+
+# data frames returned by load_data are shared copies of the cached data frames
+_memoryCache = _MemoryCache(maxbytes=256 * 1024 ** 2)
+
 
 def load_data(name: str, **kwargs: Any) -> Union[pd.DataFrame, pd.Series]:
     """ Returns the data either as a Pandas data frame or series """
     data_file = get_data_file(name)
     if not data_file.exists():
         raise ValueError('Data file {name} not found')
-    data = pd.read_csv(data_file, **kwargs)
+    data = _read_csv(data_file, kwargs)
     if data.shape[1] == 1:
         return data[data.columns[0]]  # pylint: disable=E1136
     return data
 
 
+def load_data_iter(name: str, chunksize: int = 10000, columns: Optional[Sequence[str]] = None,
+                   dtypes: Any = None, **kwargs: Any) -> Iterator[pd.DataFrame]:
+    """ Returns an iterator over the data in data frames of at most chunksize rows
+
+    Only one chunk is kept in memory at a time. Unlike load_data, single column data is also
+    returned as data frames. For zipped text corpora, e.g. AutoAndElectronics.zip, each row
+    describes one document with the columns member (name of the file in the archive) and text.
+
+    Input:
+        name: name of the data file
+        chunksize: maximum number of rows per data frame
+        columns (optional): subset of the columns to read; other columns are skipped while parsing
+        dtypes (optional): dtype or dictionary of column dtypes used while parsing, e.g. {'Price': 'float32'}
+        kwargs: additional keyword arguments for pandas.read_csv; for zipped corpora, the encoding
+                of the documents (default latin-1)
+    """
+    if chunksize < 1:
+        raise ValueError('chunksize must be a positive integer')
+    data_file = get_data_file(name)
+    if not data_file.exists():
+        raise ValueError(f'Data file {name} not found')
+    if data_file.suffix == '.zip':
+        yield from _iter_zip_corpus(data_file, chunksize, columns, dtypes, **kwargs)
+        return
+    usecols = None if columns is None else list(columns)
+    with pd.read_csv(data_file, chunksize=chunksize, usecols=usecols, dtype=dtypes, **kwargs) as reader:
+        yield from reader
+
+
 def get_data_file(name: str) -> Path:
     if name.endswith('.zip'):
         return DATA_DIR / name
@@ -31,3 +144,217 @@ def get_data_file(name: str) -> Path:
     if name.endswith('.csv'):
         name = name[:-4]
     return DATA_DIR / f'{name}.csv.gz'
+
+
+def set_cache_dir(cache_dir: Optional[Union[str, os.PathLike]]) -> None:
+    """ Set the directory of the on-disk cache used by load_data; None disables the cache
+
+    The cache directory can also be set using the environment variable DMBA_CACHE_DIR. On first
+    use, each data file is converted into typed columns that are loaded memory-mapped on later calls.
+    """
+    _settings['cache_dir'] = None if cache_dir is None else Path(cache_dir)
+
+
+def get_cache_dir() -> Optional[Path]:
+    """ Returns the directory of the on-disk cache or None if caching is disabled """
+    return _settings['cache_dir']
+
+
+def set_memory_cache_size(maxbytes: int) -> None:
+    """ Set the maximum total size of the data frames kept in memory by load_data; 0 disables the cache
+
+    Repeated calls of load_data with the same arguments return copies of the cached data frame.
+    With pandas copy-on-write, these copies share the data until they are modified.
+    """
+    _memoryCache.resize(maxbytes)
+
+
+def cache_info() -> CacheInfo:
+    """ Returns the statistics of the in-memory cache of load_data """
+    return _memoryCache.info()
+
+
+def clear_cache() -> None:
+    """ Remove all data frames from the in-memory cache and all cached data files from the cache directory """
+    _memoryCache.clear()
+    cache_dir = get_cache_dir()
+    if cache_dir is None or not cache_dir.exists():
+        return
+    for entry in cache_dir.glob(f'*{CACHE_SUFFIX}'):
+        shutil.rmtree(entry, ignore_errors=True)
+
+
+def _read_csv(data_file: Path, kwargs: Dict[str, Any]) -> pd.DataFrame:
+    """ Read the data file using the in-memory and the on-disk cache """
+    try:
+        # only keyword arguments that can be represented exactly are used in the cache key
+        key = json.dumps(kwargs, sort_keys=True)
+    except TypeError:
+        return pd.read_csv(data_file, **kwargs)
+    stat = data_file.stat()
+    memoryKey = (str(data_file), stat.st_mtime_ns, stat.st_size, key)
+    data = _memoryCache.get(memoryKey)
+    if data is None:
+        data = _read_csv_cached(data_file, kwargs, key)
+        _memoryCache.put(memoryKey, data)
+    return _shared_copy(data)
+
+
+def _read_csv_cached(data_file: Path, kwargs: Dict[str, Any], key: str) -> pd.DataFrame:
+    """ Read the data file using the on-disk cache if it is enabled """
+    cache_dir = get_cache_dir()
+    if cache_dir is None:
+        return pd.read_csv(data_file, **kwargs)
+    cache_entry = cache_dir / f'{data_file.name}-{hashlib.sha256(key.encode()).hexdigest()[:16]}{CACHE_SUFFIX}'
+    data = _load_cache_entry(cache_entry, data_file)
+    if data is None:
+        data = pd.read_csv(data_file, **kwargs)
+        _write_cache_entry(cache_entry, data_file, data)
+    return data
+
+
+def _shared_copy(data: pd.DataFrame) -> pd.DataFrame:
+    """ Copy of a cached data frame; modifications of the copy don't change the cache """
+    if int(pd.__version__.split('.')[0]) >= 3 or pd.options.mode.copy_on_write is True:
+        # with copy-on-write, the data is only copied once the copy is modified
+        return data.copy(deep=False)
+    return data.copy(deep=True)
+
+
+def _iter_zip_members(data_file: Path, chunksize: int, *,
+                      read: bool = True) -> Iterator[List[Tuple[str, Optional[bytes]]]]:
+    """ Returns an iterator over batches of (member name, content) of the files in a zip archive
+
+    Directories are skipped. Members are read one batch at a time; with read=False, the content is None.
+    """
+    with zipfile.ZipFile(data_file) as archive:
+        batch: List[Tuple[str, Optional[bytes]]] = []
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            batch.append((info.filename, archive.read(info) if read else None))
+            if len(batch) == chunksize:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def _iter_zip_corpus(data_file: Path, chunksize: int, columns: Optional[Sequence[str]], dtypes: Any,
+                     encoding: str = 'latin-1') -> Iterator[pd.DataFrame]:
+    columns = list(columns) if columns is not None else ['member', 'text']
+    unknown = set(columns) - {'member', 'text'}
+    if unknown:
+        raise ValueError(f'Unknown columns {sorted(unknown)}; zipped corpora have the columns member and text')
+    for batch in _iter_zip_members(data_file, chunksize, read='text' in columns):
+        chunk = pd.DataFrame({
+            'member': [member for member, _ in batch],
+            'text': [content.decode(encoding) if content is not None else None for _, content in batch],
+        }, columns=columns)
+        yield chunk if dtypes is None else chunk.astype(dtypes)
+
+
+def _file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open('rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_cache_entry(cache_entry: Path, data_file: Path) -> Optional[pd.DataFrame]:
+    """ Returns the cached data frame or None if there is no valid cache entry
+
+    The entry is valid if the modification time and size of the source file are unchanged.
+    Otherwise, the hash of the source file decides and the entry is updated if it is still valid.
+    """
+    metaFile = cache_entry / 'meta.json'
+    try:
+        meta = json.loads(metaFile.read_text())
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != CACHE_VERSION:
+        return None
+    stat = data_file.stat()
+    source = meta['source']
+    if (source['mtime_ns'], source['size']) != (stat.st_mtime_ns, stat.st_size):
+        if source['sha256'] != _file_hash(data_file):
+            return None
+        source.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+        metaFile.write_text(json.dumps(meta))
+
+    # copy-on-write memory maps: modifications of the data frame are not written to the cache
+    blocks = {dtype: np.load(cache_entry / f'{dtype}.npy', mmap_mode='c').view(np.ndarray)
+              for dtype in meta['dtypes']}
+    if meta['strings']:
+        codes = np.load(cache_entry / 'string-codes.npy', mmap_mode='c')
+        # the last entry is used for missing values
+        values = np.append(np.load(cache_entry / 'string-values.npy').astype(object), np.nan)
+    columns = {}
+    for i, column in enumerate(meta['columns']):
+        if column['dtype'] in blocks:
+            columns[i] = blocks[column['dtype']][column['position']]
+        else:
+            columns[i] = pd.array(values[codes[column['position']]], dtype=column['dtype'])
+    data = pd.DataFrame(columns, copy=False)
+    data.columns = pd.Index([column['name'] for column in meta['columns']])
+    return data
+
+
+def _write_cache_entry(cache_entry: Path, data_file: Path, data: pd.DataFrame) -> None:
+    """ Store the data frame in the cache; data frames with unsupported column types are not cached
+
+    The columns are grouped by type and stored as one array per numpy dtype. String columns are
+    dictionary encoded and stored as an array of integer codes and an array of distinct values.
+    """
+    if not isinstance(data.index, pd.RangeIndex) or data.index.start != 0 or data.index.step != 1:
+        return
+    columns: List[Dict[str, Any]] = []
+    blocks: Dict[str, List[np.ndarray]] = {}
+    strings: List[Tuple[np.ndarray, np.ndarray]] = []
+    for name, series in data.items():
+        if not isinstance(name, (str, int)):
+            return
+        if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biufcmM':
+            dtype = series.dtype.str
+            blocks.setdefault(dtype, []).append(series.to_numpy())
+            columns.append({'name': name, 'dtype': dtype, 'position': len(blocks[dtype]) - 1})
+        elif pd.api.types.infer_dtype(series, skipna=True) in ('string', 'empty'):
+            missing = series.isna().to_numpy()
+            strings.append((series.to_numpy()[~missing], missing))
+            columns.append({'name': name, 'dtype': str(series.dtype), 'position': len(strings) - 1})
+        else:
+            return
+
+    arrays = {f'{dtype}.npy': np.stack(block) for dtype, block in blocks.items()}
+    if strings:
+        values = np.unique(np.concatenate([present for present, _ in strings]).astype(str))
+        codes = np.full((len(strings), len(data)), len(values), dtype=np.int32)
+        for position, (present, missing) in enumerate(strings):
+            codes[position, ~missing] = np.searchsorted(values, present.astype(str))
+        arrays['string-codes.npy'] = codes
+        arrays['string-values.npy'] = values
+
+    stat = data_file.stat()
+    meta = {
+        'version': CACHE_VERSION,
+        'source': {'name': data_file.name, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size,
+                   'sha256': _file_hash(data_file)},
+        'dtypes': list(blocks),
+        'strings': bool(strings),
+        'columns': columns,
+    }
+    # write to a temporary directory first so that concurrent readers never see incomplete entries
+    cache_entry.parent.mkdir(parents=True, exist_ok=True)
+    tempdir = Path(tempfile.mkdtemp(dir=cache_entry.parent, prefix='.tmp-'))
+    try:
+        for filename, values in arrays.items():
+            np.save(tempdir / filename, values, allow_pickle=False)
+        (tempdir / 'meta.json').write_text(json.dumps(meta))
+        if cache_entry.exists():
+            shutil.rmtree(cache_entry, ignore_errors=True)
+        tempdir.rename(cache_entry)
+    except OSError:
+        pass
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
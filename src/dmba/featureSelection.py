@@ -4,12 +4,44 @@ Applications in Python"
 
 (c) 2019-2023 Galit Shmueli, Peter C. Bruce, Peter Gedeck
 '''
-import itertools
-from typing import Any, Callable, Iterable, List, NamedTuple, Optional, Tuple, TypedDict, TypeVar
+import heapq
+import json
+import math
+import time
+import warnings
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TypedDict,
+    TypeVar,
+    Union,
+)
+
+from .parallel import worker_executor
+
+# the subset models are imported when a selection function is called, not with the module
+if TYPE_CHECKING:
+    import os
+
+    from .subsetModels import CrossValidatedSubsetModel, LinearSubsetModel
 
 Model = TypeVar('Model')
 TrainModel = Callable[[List[str]], Model]
 ScoreModel = Callable[[Model, List[str]], float]
+SubsetBackend = Union['LinearSubsetModel', 'CrossValidatedSubsetModel']
 
 
 class ExhaustivSearchResult(TypedDict):
@@ -19,46 +51,338 @@ class ExhaustivSearchResult(TypedDict):
     model: Any  # should be Model
 
 
+# successive halving keeps a third of the candidates and triples the number of rows in each round
+HALVING_FACTOR = 3
+
+# exhaustive_search writes its checkpoint at most every CHECKPOINT_INTERVAL seconds and after each size
+CHECKPOINT_INTERVAL = 60
+
+# exhaustive_search evaluates the combinations of each size in ranges of consecutive combinations
+COMBINATIONS_PER_TASK = 256
+
+# exhaustive_search keeps the models of the best subsets, refits them at the end, or returns no models
+MODEL_POLICIES = ('keep', 'refit', 'none')
+
+# placeholder for models that were scored but not fitted; they are fitted once they are selected
+_NOT_FITTED: Any = object()
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: Optional[int]
+    currsize: int
+
+
+class SubsetCache:
+    """ Least recently used cache of trained and scored models keyed by the set of variables
+
+    Pass the same cache to several selection functions, e.g. forward_selection followed by
+    backward_elimination, to avoid refitting subsets that were already evaluated. A cache must
+    only be used with one combination of train_model and score_model; the score of a subset
+    may not depend on the order of its variables. Cached models are only reused for the same
+    order of variables, otherwise they are refitted if they are selected.
+
+    Input:
+        maxsize (optional): maximum number of cached models (default 1024); None for no limit
+    """
+    def __init__(self, maxsize: Optional[int] = 1024) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[FrozenSet[str], Tuple[List[str], float, Any]] = OrderedDict()
+
+    def lookup(self, variables: List[str]) -> Optional[Tuple[float, Any]]:
+        """ Returns (score, model) for the variables or None if the subset is not cached """
+        key = frozenset(variables)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        cached_variables, score, model = entry
+        return score, model if cached_variables == variables else _NOT_FITTED
+
+    def store(self, variables: List[str], score: float, model: Any) -> None:
+        """ Add the score and model of the variables to the cache """
+        if self.maxsize is not None and self.maxsize <= 0:
+            return
+        key = frozenset(variables)
+        self._entries[key] = (list(variables), score, model)
+        self._entries.move_to_end(key)
+        if self.maxsize is not None and len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def cache_info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._entries))
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class _Checkpoint:
+    """ Progress of a selection run that is stored in a JSON file to resume the run after an interruption
+
+    Subsets are stored as indices into variables. The file is replaced atomically, so that an
+    interrupted write leaves the previous checkpoint intact.
+    """
+    def __init__(self, path: Union[str, 'os.PathLike[str]'], function: str, variables: List[str],
+                 **settings: Any) -> None:
+        self.path = Path(path)
+        self.variables = list(variables)
+        self._index = {name: i for i, name in enumerate(self.variables)}
+        self.header = {'function': function, 'variables': self.variables, 'settings': settings}
+        self.state: Dict[str, Any] = {}
+        if self.path.exists():
+            stored = json.loads(self.path.read_text())
+            if any(stored.get(key) != value for key, value in self.header.items()):
+                raise ValueError(f'Checkpoint {self.path} was written by a different selection run')
+            self.state = stored['state']
+
+    def indices(self, subset: List[str]) -> List[int]:
+        return [self._index[name] for name in subset]
+
+    def names(self, indices: List[int]) -> List[str]:
+        return [self.variables[i] for i in indices]
+
+    def save(self, **state: Any) -> None:
+        self.state.update(state)
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        tmp.write_text(json.dumps({**self.header, 'state': self.state}, separators=(',', ':')))
+        tmp.replace(self.path)
+
+
 def exhaustive_search(variables: List[str], train_model: TrainModel,
-                      score_model: ScoreModel) -> List[ExhaustivSearchResult]:
+                      score_model: Union[ScoreModel, str, None] = None, *,
+                      cache: Optional[SubsetCache] = None,
+                      checkpoint: Union[str, 'os.PathLike[str]', None] = None,
+                      top_k: int = 1, models: str = 'keep', n_jobs: Optional[int] = None,
+                      executor: Optional[Executor] = None) -> List[ExhaustivSearchResult]:
     """ Variable selection using backward elimination
 
     Input:
         variables: complete list of variables to consider in model building
         train_model: function that returns a fitted model for a given set of variables
         score_model: function that returns the score of a model; better models have lower scores
+            If train_model is a LinearSubsetModel, leave score_model unset to use its criterion; with
+            top_k=1, the best subsets are then found using leaps and bounds without fitting most of the
+            subsets. This search runs in the calling thread; n_jobs and executor are not used.
+            If train_model is a CrossValidatedSubsetModel, the subsets are scored by cross-validation
+            and only the returned subsets are fitted on all rows; n_jobs and executor evaluate the folds.
+        cache (optional): SubsetCache with models that don't need to be refitted; the models found by
+            leaps and bounds are added to the cache
+        checkpoint (optional): path of a JSON file that records the progress; if the file exists, the
+            search resumes where it stopped. Only the scores of the best subsets are stored; their
+            models are refitted when the search resumes.
+        top_k (optional): number of best subsets returned for each number of variables
+        models (optional): 'keep' keeps the models of the top_k subsets of each size during the search,
+            'refit' only keeps their scores and refits the returned subsets at the end, and 'none'
+            returns the results without models
+        n_jobs (optional): number of threads used to evaluate the combinations (-1 uses all cores); threads
+            only speed up train_model and score_model if they release the GIL, e.g. numpy or scikit-learn
+            estimators that run compiled code; use a ProcessPoolExecutor as executor otherwise
+        executor (optional): concurrent.futures executor used instead of n_jobs, e.g. a ProcessPoolExecutor;
+            train_model and score_model need to be picklable in this case. The combinations of each
+            size are split into ranges of COMBINATIONS_PER_TASK consecutive combinations that are
+            searched independently; the results are identical to the serial search.
 
     Returns:
-        List of best subset models for increasing number of variables
+        List of best subset models for increasing number of variables; for each number of variables,
+        the top_k best subsets in the order of increasing score
     """
+    from .subsetModels import CrossValidatedSubsetModel, LinearSubsetModel  # noqa: PLC0415
+    if top_k < 1:
+        raise ValueError('top_k must be a positive integer')
+    if models not in MODEL_POLICIES:
+        raise ValueError(f'models must be one of {", ".join(MODEL_POLICIES)}')
+    score_model, backend = _resolve_score_model(train_model, score_model)
+    progress = None
+    if checkpoint is not None:
+        progress = _Checkpoint(checkpoint, 'exhaustive_search', variables, top_k=top_k)
+    # a checkpoint is resumed below; the results of leaps and bounds are stored as a completed search
+    if isinstance(backend, LinearSubsetModel) and top_k == 1 and not (progress is not None and progress.state):
+        if n_jobs is not None or executor is not None:
+            warnings.warn('exhaustive_search uses leaps and bounds for a LinearSubsetModel; '
+                          'n_jobs and executor are not used', stacklevel=2)
+        return _linear_best_subsets(variables, backend, progress=progress, cache=cache, models=models)
+
+    result: List[ExhaustivSearchResult] = []
+    # the top_k subsets of the current size as a heap of (-score, -position, subset, model); the root is
+    # the worst subset, of subsets with the same score the one that was found last
+    heap: List[Tuple[float, int, List[str], Any]] = []
+    nvariables, position = 1, 0  # position counts the combinations of the current size that were evaluated
+    if progress is not None and progress.state:
+        result = [_restore_result(progress, entry) for entry in progress.state['results']]
+        nvariables, position = progress.state['size'], progress.state['position']
+        heap = [(-entry['score'], -entry['position'], progress.names(entry['variables']), _NOT_FITTED)
+                for entry in progress.state['candidates']]
+        heapq.heapify(heap)
+
+    def save() -> None:
+        if progress is not None:
+            progress.save(results=[_stored_result(progress, r) for r in result], size=nvariables, position=position,
+                          candidates=[{'variables': progress.indices(subset), 'score': -negScore, 'position': -negPosition}
+                                      for negScore, negPosition, subset, _ in heap])
+
     # create models of increasing size and determine the best models in each case
+    with worker_executor(n_jobs, executor, ThreadPoolExecutor) as pool:
+        while nvariables <= len(variables):
+            lastSave = time.monotonic()
+            starts = range(position, math.comb(len(variables), nvariables), COMBINATIONS_PER_TASK)
+            # a cross-validated backend scores the ranges in turn and evaluates their folds in parallel
+            # without fitting the subsets on all rows; a cache can't be shared with other threads or processes
+            mapper = map if pool is None or isinstance(backend, CrossValidatedSubsetModel) else pool.map
+            search = partial(_search_combinations, train_model, score_model, variables, nvariables,
+                             count=COMBINATIONS_PER_TASK, top_k=top_k, keep=models == 'keep',
+                             cache=cache if mapper is map else None, backend=backend,
+                             executor=pool if mapper is map else None)
+            # the ranges are merged in order, so that a checkpoint covers all combinations before position
+            for entries in mapper(search, starts):
+                for subset_score, rank, indices, model, fitted in entries:
+                    _push_top_k(heap, (-subset_score, -rank, [variables[i] for i in indices],
+                                       model if fitted else _NOT_FITTED), top_k)
+                position = min(position + COMBINATIONS_PER_TASK, math.comb(len(variables), nvariables))
+                if progress is not None and time.monotonic() - lastSave >= CHECKPOINT_INTERVAL:
+                    save()
+                    lastSave = time.monotonic()
+            result.extend(ExhaustivSearchResult(n=nvariables, variables=subset, score=-negScore, model=model)
+                          for negScore, _, subset, model in sorted(heap, key=lambda entry: entry[:2], reverse=True))
+            heap, nvariables, position = [], nvariables + 1, 0
+            save()
+    for best in result:
+        best['model'] = None if models == 'none' else _fitted(best['model'], best['variables'], train_model)
+    return result
+
+
+def _search_combinations(train_model: TrainModel, score_model: ScoreModel, variables: List[str], nvariables: int,
+                         start: int, *, count: int, top_k: int, keep: bool, cache: Optional[SubsetCache],
+                         backend: Optional[SubsetBackend] = None,
+                         executor: Optional[Executor] = None) -> List[Tuple[float, int, Tuple[int, ...], Any, bool]]:
+    """ Search count combinations of nvariables variables starting with the combination of rank start
+
+    A CrossValidatedSubsetModel backend scores all combinations of the range at once using the
+    executor; other models are trained and scored one at a time.
+
+    Returns:
+        top_k entries (score, rank, variable indices, model, fitted); the model is None unless it is
+        kept and fitted, as the placeholder for models that were not fitted doesn't survive pickling
+    """
+    from .subsetModels import CrossValidatedSubsetModel  # noqa: PLC0415
+    heap: List[Tuple[float, int, Tuple[int, ...], Any]] = []
+    combinations = enumerate(_combination_range(len(variables), nvariables, start, count), start)
+    if isinstance(backend, CrossValidatedSubsetModel):
+        ranked = list(combinations)
+        subsets = [[variables[i] for i in indices] for _, indices in ranked]
+        evaluated = _evaluate_subsets(subsets, train_model, score_model, executor, cache,
+                                      score_subsets=backend.score_subsets)
+        for (rank, indices), (subset_score, subset_model) in zip(ranked, evaluated):
+            _push_top_k(heap, (-subset_score, -rank, indices, subset_model if keep else _NOT_FITTED), top_k)
+    else:
+        for rank, indices in combinations:
+            subset = [variables[i] for i in indices]
+            subset_score, subset_model = _evaluate_subsets([subset], train_model, score_model, None, cache)[0]
+            _push_top_k(heap, (-subset_score, -rank, indices, subset_model if keep else _NOT_FITTED), top_k)
+    return [(-negScore, -negRank, indices, None if model is _NOT_FITTED else model, model is not _NOT_FITTED)
+            for negScore, negRank, indices, model in heap]
+
+
+def _push_top_k(heap: List[Any], entry: Tuple[float, int, Any, Any], top_k: int) -> None:
+    """ Add the entry (-score, -rank, ...) to the heap of the top_k entries with the lowest (score, rank) """
+    if len(heap) < top_k:
+        heapq.heappush(heap, entry)
+    else:
+        heapq.heappushpop(heap, entry)
+
+
+def _unrank_combination(rank: int, n: int, k: int) -> List[int]:
+    """ Combination of k out of range(n) at position rank in the lexicographic order of itertools.combinations """
+    combination = []
+    x = 0
+    for i in range(k, 0, -1):
+        # skip the combinations that start with x; there are comb(n - x - 1, i - 1) of them
+        while math.comb(n - x - 1, i - 1) <= rank:
+            rank -= math.comb(n - x - 1, i - 1)
+            x += 1
+        combination.append(x)
+        x += 1
+    return combination
+
+
+def _combination_range(n: int, k: int, start: int, count: int) -> Iterator[Tuple[int, ...]]:
+    """ Up to count combinations of k out of range(n) starting at rank start in the order of itertools.combinations """
+    if start >= math.comb(n, k):
+        return
+    indices = _unrank_combination(start, n, k)
+    for _ in range(count):
+        yield tuple(indices)
+        # advance to the next combination like itertools.combinations
+        i = k - 1
+        while i >= 0 and indices[i] == i + n - k:
+            i -= 1
+        if i < 0:
+            return
+        indices[i] += 1
+        for j in range(i + 1, k):
+            indices[j] = indices[j - 1] + 1
+
+
+def _stored_result(progress: _Checkpoint, result: ExhaustivSearchResult) -> Dict[str, Any]:
+    return {'variables': progress.indices(result['variables']), 'score': result['score']}
+
+
+def _restore_result(progress: _Checkpoint, stored: Dict[str, Any]) -> ExhaustivSearchResult:
+    variables = progress.names(stored['variables'])
+    return ExhaustivSearchResult(n=len(variables), variables=variables, score=stored['score'], model=_NOT_FITTED)
+
+
+def _linear_best_subsets(variables: List[str], linear_model: 'LinearSubsetModel', *, progress: Optional[_Checkpoint],
+                         cache: Optional[SubsetCache], models: str) -> List[ExhaustivSearchResult]:
+    """ Exhaustive search for a linear regression using leaps and bounds """
     result = []
-    for nvariables in range(1, len(variables) + 1):
-        best: Optional[ExhaustivSearchResult] = None
-        for varcombo in itertools.combinations(variables, nvariables):
-            subset = list(varcombo)
-            subset_model = train_model(subset)
-            subset_score = score_model(subset_model, subset)
-            if best is None or best['score'] > subset_score:
-                best = ExhaustivSearchResult(
-                    n=nvariables,
-                    variables=subset,
-                    score=subset_score,
-                    model=subset_model,
-                )
-        assert best is not None  # noqa: S101
-        result.append(best)
+    for subset in linear_model.best_subsets(variables):
+        subset_model = linear_model(subset)
+        subset_score = linear_model.score(subset_model, subset)
+        if cache is not None:
+            cache.store(subset, subset_score, subset_model)
+        result.append(ExhaustivSearchResult(
+            n=len(subset),
+            variables=subset,
+            score=subset_score,
+            model=None if models == 'none' else subset_model,
+        ))
+    if progress is not None:
+        progress.save(results=[_stored_result(progress, r) for r in result], size=len(variables) + 1, position=0,
+                      candidates=[])
     return result
 
 
-def backward_elimination(variables: Iterable[str], train_model: TrainModel, score_model: ScoreModel, *,
-                         verbose: bool = False) -> Tuple[Model, List[str]]:
+def backward_elimination(variables: Iterable[str], train_model: TrainModel,
+                         score_model: Union[ScoreModel, str, None] = None, *,
+                         verbose: bool = False, n_jobs: Optional[int] = None,
+                         executor: Optional[Executor] = None,
+                         cache: Optional[SubsetCache] = None) -> Tuple[Model, List[str]]:
     """ Variable selection using backward elimination
 
     Input:
         variables: complete list of variables to consider in model building
         train_model: function that returns a fitted model for a given set of variables
         score_model: function that returns the score of a model; better models have lower scores
+            If train_model is a LinearSubsetModel, leave score_model unset to score the candidates
+            of each step using incremental updates of the linear regression model. If train_model
+            is a CrossValidatedSubsetModel, use score_model='cv' or leave it unset to score the
+            candidates by cross-validation; the folds of all candidates are evaluated in parallel.
+        n_jobs (optional): number of threads used to evaluate the candidates of a step (-1 uses all cores);
+            threads only speed up train_model and score_model if they release the GIL, e.g. numpy or
+            scikit-learn estimators that run compiled code; use a ProcessPoolExecutor as executor otherwise
+        executor (optional): concurrent.futures executor used instead of n_jobs, e.g. a ProcessPoolExecutor;
+            train_model and score_model need to be picklable in this case
+        cache (optional): SubsetCache with models that don't need to be refitted
 
     Returns:
         (best_model, best_variables)
@@ -68,45 +392,61 @@ def backward_elimination(variables: Iterable[str], train_model: TrainModel, scor
         variable: Optional[str]
         model: Any
 
+    score_model, backend = _resolve_score_model(train_model, score_model)
+
     # we start with a model that contains all variables
     best_variables = list(variables)
-    best_model = train_model(best_variables)
-    best_score = score_model(best_model, best_variables)
+    best_score, best_model = _evaluate_subsets([best_variables], train_model, score_model, None, cache)[0]
+    best_model = _fitted(best_model, best_variables, train_model)
     if verbose:
         print('Variables: ' + ', '.join(variables))
         print(f'Start: score={best_score:.2f}')
 
-    while len(best_variables) > 1:
-        step = [Step(best_score, None, best_model)]
-        for removeVar in best_variables:
-            step_var = list(best_variables)
-            step_var.remove(removeVar)
-            step_model = train_model(step_var)
-            step_score = score_model(step_model, step_var)
-            step.append(Step(step_score, removeVar, step_model))
-
-        # sort by ascending score
-        step.sort(key=lambda x: x[0])
-
-        # the first entry is the model with the lowest score
-        best_score, removed_step, best_model = step[0]
-        if verbose:
-            print(f'Step: score={best_score:.2f}, remove {removed_step}')
-        if removed_step is None:
-            # step here, as removing more variables is detrimental to performance
-            break
-        best_variables.remove(removed_step)
+    with worker_executor(n_jobs, executor, ThreadPoolExecutor) as pool:
+        while len(best_variables) > 1:
+            step = [Step(best_score, None, best_model)]
+            evaluated = _evaluate_step(best_variables, [], best_variables, train_model=train_model,
+                                       score_model=score_model, backend=backend, executor=pool,
+                                       cache=cache)
+            for removeVar, (step_score, step_model) in zip(best_variables, evaluated):
+                step.append(Step(step_score, removeVar, step_model))
+
+            # sort by ascending score
+            step.sort(key=lambda x: x[0])
+
+            # the first entry is the model with the lowest score
+            best_score, removed_step, best_model = step[0]
+            if verbose:
+                print(f'Step: score={best_score:.2f}, remove {removed_step}')
+            if removed_step is None:
+                # step here, as removing more variables is detrimental to performance
+                break
+            best_variables.remove(removed_step)
+            best_model = _fitted(best_model, best_variables, train_model)
     return best_model, best_variables
 
 
-def forward_selection(variables: Iterable[str], train_model: TrainModel, score_model: ScoreModel, *,
-                      verbose: bool = False) -> Tuple[Model, List[str]]:
+def forward_selection(variables: Iterable[str], train_model: TrainModel,
+                      score_model: Union[ScoreModel, str, None] = None, *,
+                      verbose: bool = False, n_jobs: Optional[int] = None,
+                      executor: Optional[Executor] = None,
+                      cache: Optional[SubsetCache] = None) -> Tuple[Model, List[str]]:
     """ Variable selection using forward selection
 
     Input:
         variables: complete list of variables to consider in model building
         train_model: function that returns a fitted model for a given set of variables
         score_model: function that returns the score of a model; better models have lower scores
+            If train_model is a LinearSubsetModel, leave score_model unset to score the candidates
+            of each step using incremental updates of the linear regression model. If train_model
+            is a CrossValidatedSubsetModel, use score_model='cv' or leave it unset to score the
+            candidates by cross-validation; the folds of all candidates are evaluated in parallel.
+        n_jobs (optional): number of threads used to evaluate the candidates of a step (-1 uses all cores);
+            threads only speed up train_model and score_model if they release the GIL, e.g. numpy or
+            scikit-learn estimators that run compiled code; use a ProcessPoolExecutor as executor otherwise
+        executor (optional): concurrent.futures executor used instead of n_jobs, e.g. a ProcessPoolExecutor;
+            train_model and score_model need to be picklable in this case
+        cache (optional): SubsetCache with models that don't need to be refitted
 
     Returns:
         (best_model, best_variables)
@@ -116,45 +456,70 @@ def forward_selection(variables: Iterable[str], train_model: TrainModel, score_m
         variable: Optional[str]
         model: Any
 
+    score_model, backend = _resolve_score_model(train_model, score_model)
+
     # we start with a model that contains no variables
+    variables = list(variables)
     best_variables: List[str] = []
-    best_model = train_model(best_variables)
-    best_score = score_model(best_model, best_variables)
+    best_score, best_model = _evaluate_subsets([best_variables], train_model, score_model, None, cache)[0]
+    best_model = _fitted(best_model, best_variables, train_model)
     if verbose:
         print('Variables: ' + ', '.join(variables))
         print(f'Start: score={best_score:.2f}, constant')
-    while True:
-        step = [Step(best_score, None, best_model)]
-        for addVar in variables:
-            if addVar in best_variables:
-                continue
-            step_var = list(best_variables)
-            step_var.append(addVar)
-            step_model = train_model(step_var)
-            step_score = score_model(step_model, step_var)
-            step.append(Step(step_score, addVar, step_model))
-        step.sort(key=lambda x: x[0])
-
-        # the first entry in step is now the model that improved most
-        best_score, added_step, best_model = step[0]
-        if verbose:
-            print(f'Step: score={best_score:.2f}, add {added_step}')
-        if added_step is None:
-            # stop here, as adding more variables is detrimental to performance
-            break
-        best_variables.append(added_step)
+    with worker_executor(n_jobs, executor, ThreadPoolExecutor) as pool:
+        while True:
+            step = [Step(best_score, None, best_model)]
+            addVars = [v for v in variables if v not in best_variables]
+            evaluated = _evaluate_step(best_variables, addVars, [], train_model=train_model,
+                                       score_model=score_model, backend=backend, executor=pool,
+                                       cache=cache)
+            for addVar, (step_score, step_model) in zip(addVars, evaluated):
+                step.append(Step(step_score, addVar, step_model))
+            step.sort(key=lambda x: x[0])
+
+            # the first entry in step is now the model that improved most
+            best_score, added_step, best_model = step[0]
+            if verbose:
+                print(f'Step: score={best_score:.2f}, add {added_step}')
+            if added_step is None:
+                # stop here, as adding more variables is detrimental to performance
+                break
+            best_variables.append(added_step)
+            best_model = _fitted(best_model, best_variables, train_model)
     return best_model, best_variables
 
 
-def stepwise_selection(variables: List[str], train_model: TrainModel, score_model: ScoreModel, *,
-                       direction: str = 'both', verbose: bool = True) -> Tuple[Model, List[str]]:
+def stepwise_selection(variables: List[str], train_model: TrainModel,
+                       score_model: Union[ScoreModel, str, None] = None, *,
+                       direction: str = 'both', verbose: bool = True, n_jobs: Optional[int] = None,
+                       executor: Optional[Executor] = None, cache: Optional[SubsetCache] = None,
+                       halving: Optional[int] = None,
+                       checkpoint: Union[str, 'os.PathLike[str]', None] = None) -> Tuple[Model, List[str]]:
     """ Variable selection using forward and/or backward selection
 
     Input:
         variables: complete list of variables to consider in model building
         train_model: function that returns a fitted model for a given set of variables
         score_model: function that returns the score of a model; better models have lower scores
+            If train_model is a LinearSubsetModel, leave score_model unset to score the candidates
+            of each step using incremental updates of the linear regression model. If train_model
+            is a CrossValidatedSubsetModel, use score_model='cv' or leave it unset to score the
+            candidates by cross-validation; the folds of all candidates are evaluated in parallel.
         direction: use it to limit stepwise selection to either 'forward' or 'backward'
+        n_jobs (optional): number of threads used to evaluate the candidates of a step (-1 uses all cores);
+            threads only speed up train_model and score_model if they release the GIL, e.g. numpy or
+            scikit-learn estimators that run compiled code; use a ProcessPoolExecutor as executor otherwise
+        executor (optional): concurrent.futures executor used instead of n_jobs, e.g. a ProcessPoolExecutor;
+            train_model and score_model need to be picklable in this case
+        cache (optional): SubsetCache with models that don't need to be refitted
+        halving (optional): number of rows used to score the candidates of a step in the first round
+            of successive halving; requires a CrossValidatedSubsetModel as train_model. In each round,
+            the best third of the candidates is scored again on three times as many rows; the
+            remaining candidates are scored on all rows and compared with the current model. Samples
+            have at least CrossValidatedSubsetModel.min_sample_rows rows.
+        checkpoint (optional): path of a JSON file that records the selected variables and the scores
+            of the evaluated subsets after each step; if the file exists, the selection resumes from
+            the last completed step. Models are not stored; the selected model is refitted.
 
     Returns:
         (best_model, best_variables)
@@ -167,52 +532,199 @@ def stepwise_selection(variables: List[str], train_model: TrainModel, score_mode
 
     FORWARD = 'forward'
     BACKWARD = 'backward'
-    directions = [FORWARD, BACKWARD]
-    if direction.lower() == FORWARD:
-        directions = [FORWARD]
-    if direction.lower() == BACKWARD:
-        directions = [BACKWARD]
-
-    # we start with a model that contains no variables
-    best_variables: List[str] = [] if 'forward' in directions else list(variables)
-    best_model = train_model(best_variables)
-    best_score = score_model(best_model, best_variables)
+    directions = [direction.lower()] if direction.lower() in (FORWARD, BACKWARD) else [FORWARD, BACKWARD]
+
+    score_model, backend = _resolve_score_model(train_model, score_model)
+    _check_halving(halving, backend)
+
+    progress = None if checkpoint is None else _Checkpoint(checkpoint, 'stepwise_selection', variables,
+                                                           direction=direction.lower())
+    scores: Dict[Tuple[int, ...], float] = {}
+    known: Dict[FrozenSet[str], float] = {}
+    if progress is not None and progress.state:
+        # subsets that were scored before the interruption are not evaluated again
+        scores, known = _restore_scores(progress)
+        best_variables = progress.names(progress.state['variables'])
+        best_score, best_model = progress.state['score'], _NOT_FITTED
+    else:
+        # we start with a model that contains no variables
+        best_variables = [] if FORWARD in directions else list(variables)
+        best_score, best_model = _evaluate_subsets([best_variables], train_model, score_model, None, cache)[0]
+    best_model = _fitted(best_model, best_variables, train_model)
     if verbose:
         print('Variables: ' + ', '.join(variables))
-        print(f'Start: score={best_score:.2f}, constant')
-
-    while True:
-        step = [Step(best_score, None, best_model, 'unchanged')]
-        if FORWARD in directions:
-            for variable in variables:
-                if variable in best_variables:
-                    continue
-                step_var = list(best_variables)
-                step_var.append(variable)
-                step_model = train_model(step_var)
-                step_score = score_model(step_model, step_var)
-                step.append(Step(step_score, variable, step_model, 'add'))
-
-        if 'backward' in directions:
-            for variable in best_variables:
-                step_var = list(best_variables)
-                step_var.remove(variable)
-                step_model = train_model(step_var)
-                step_score = score_model(step_model, step_var)
-                step.append(Step(step_score, variable, step_model, 'remove'))
-
-        # sort by ascending score
-        step.sort(key=lambda x: x[0])
-
-        # the first entry is the model with the lowest score
-        best_score, chosen_variable, best_model, direction = step[0]
-        if verbose:
-            print(f'Step: score={best_score:.2f}, {direction} {chosen_variable}')
-        if chosen_variable is None:
-            # step here, as adding or removing more variables is detrimental to performance
-            break
-        if direction == 'add':
-            best_variables.append(chosen_variable)
+        if progress is not None and progress.state:
+            print(f'Resume: score={best_score:.2f}, ' + (', '.join(best_variables) or 'constant'))
         else:
-            best_variables.remove(chosen_variable)
+            print(f'Start: score={best_score:.2f}, constant')
+    if progress is not None and progress.state.get('done'):
+        return best_model, best_variables
+
+    with worker_executor(n_jobs, executor, ThreadPoolExecutor) as pool:
+        while True:
+            step = [Step(best_score, None, best_model, 'unchanged')]
+            # collect the candidates of this step in the order of the serial algorithm
+            addVars = [v for v in variables if v not in best_variables] if FORWARD in directions else []
+            removeVars = list(best_variables) if BACKWARD in directions else []
+            actions = [('add', v) for v in addVars] + [('remove', v) for v in removeVars]
+
+            evaluated = _evaluate_step(best_variables, addVars, removeVars, train_model=train_model,
+                                       score_model=score_model, backend=backend, executor=pool,
+                                       cache=cache, halving=halving, known=known)
+            for (action, variable), (step_score, step_model) in zip(actions, evaluated):
+                step.append(Step(step_score, variable, step_model, action))
+
+            if progress is not None:
+                _record_scores(progress, scores, best_variables, actions, evaluated)
+
+            # the first model with the lowest score
+            best_score, chosen_variable, best_model, direction = min(step, key=lambda x: x[0])
+            if verbose:
+                print(f'Step: score={best_score:.2f}, {direction} {chosen_variable}')
+            if chosen_variable is not None:
+                if direction == 'add':
+                    best_variables.append(chosen_variable)
+                else:
+                    best_variables.remove(chosen_variable)
+                best_model = _fitted(best_model, best_variables, train_model)
+            if progress is not None:
+                progress.save(variables=progress.indices(best_variables), score=best_score,
+                              scores=[[list(indices), score] for indices, score in scores.items()],
+                              done=chosen_variable is None)
+            if chosen_variable is None:
+                # step here, as adding or removing more variables is detrimental to performance
+                break
     return best_model, best_variables
+
+
+def _restore_scores(progress: _Checkpoint) -> Tuple[Dict[Tuple[int, ...], float], Dict[FrozenSet[str], float]]:
+    """ Scores of the subsets stored in the checkpoint by variable indices and by sets of variables """
+    scores = {tuple(indices): score for indices, score in progress.state['scores']}
+    return scores, {frozenset(progress.names(list(indices))): score for indices, score in scores.items()}
+
+
+def _record_scores(progress: _Checkpoint, scores: Dict[Tuple[int, ...], float], variables: List[str],
+                   actions: List[Tuple[str, str]], evaluated: List[Tuple[float, Any]]) -> None:
+    """ Add the scores of the candidates of a step; candidates eliminated by successive halving are skipped """
+    for (action, variable), (score, _) in zip(actions, evaluated):
+        subset = [*variables, variable] if action == 'add' else [v for v in variables if v != variable]
+        if math.isfinite(score):
+            scores[tuple(sorted(progress.indices(subset)))] = score
+
+
+def _resolve_score_model(train_model: TrainModel,
+                         score_model: Union[ScoreModel, str, None]) -> Tuple[ScoreModel, Optional[SubsetBackend]]:
+    """ Returns the score_model and the LinearSubsetModel or CrossValidatedSubsetModel if it scores the subsets """
+    from .subsetModels import CrossValidatedSubsetModel, LinearSubsetModel  # noqa: PLC0415
+    if isinstance(score_model, str):
+        if score_model != 'cv' or not isinstance(train_model, CrossValidatedSubsetModel):
+            raise ValueError("score_model must be a function or 'cv' with a CrossValidatedSubsetModel as train_model")
+        return train_model.score, train_model
+    if score_model is not None:
+        return score_model, None
+    if isinstance(train_model, (LinearSubsetModel, CrossValidatedSubsetModel)):
+        return train_model.score, train_model
+    raise ValueError('score_model is required unless train_model is a LinearSubsetModel or CrossValidatedSubsetModel')
+
+
+def _evaluate_step(variables: List[str], add: List[str], remove: List[str], *, train_model: TrainModel,
+                   score_model: ScoreModel, backend: Optional[SubsetBackend],
+                   executor: Optional[Executor], cache: Optional[SubsetCache],
+                   halving: Optional[int] = None,
+                   known: Optional[Dict[FrozenSet[str], float]] = None) -> List[Tuple[float, Any]]:
+    """ Scores and models for adding each variable in add and removing each variable in remove
+
+    A LinearSubsetModel or CrossValidatedSubsetModel scores the candidates without fitting them on
+    all rows; their models are fitted if selected. Candidates eliminated by successive halving
+    get an infinite score.
+    """
+    from .subsetModels import CrossValidatedSubsetModel, LinearSubsetModel  # noqa: PLC0415
+    if isinstance(backend, LinearSubsetModel):
+        addScores, removeScores = backend.score_step(variables, add, remove)
+        return [(score, _NOT_FITTED) for score in addScores + removeScores]
+    candidates = [[*variables, v] for v in add]
+    candidates.extend([x for x in variables if x != v] for v in remove)
+    if halving is not None and isinstance(backend, CrossValidatedSubsetModel):
+        survivors = _halving_survivors(candidates, backend, executor, halving)
+        evaluated = _evaluate_subsets([candidates[i] for i in survivors], train_model, score_model, executor, cache,
+                                      score_subsets=backend.score_subsets, known=known)
+        results: List[Tuple[float, Any]] = [(math.inf, _NOT_FITTED)] * len(candidates)
+        for i, result in zip(survivors, evaluated):
+            results[i] = result
+        return results
+    score_subsets = None if backend is None else backend.score_subsets
+    return _evaluate_subsets(candidates, train_model, score_model, executor, cache, score_subsets=score_subsets,
+                             known=known)
+
+
+def _check_halving(halving: Optional[int], backend: Optional[SubsetBackend]) -> None:
+    from .subsetModels import CrossValidatedSubsetModel  # noqa: PLC0415
+    if halving is not None and not isinstance(backend, CrossValidatedSubsetModel):
+        raise ValueError('halving requires a CrossValidatedSubsetModel as train_model')
+    if halving is not None and (not isinstance(halving, int) or halving < 1):
+        raise ValueError('halving must be a positive number of rows')
+
+
+def _halving_survivors(candidates: List[List[str]], backend: 'CrossValidatedSubsetModel',
+                       executor: Optional[Executor], nrows: int) -> List[int]:
+    """ Indices of the candidates that are scored on all rows after successive halving
+
+    The candidates are scored on growing samples of rows, starting with at least min_sample_rows
+    of the backend; after each round, the best third is kept. Undefined (NaN) scores rank last.
+    At least two candidates are kept, so that the choice is confirmed on all rows.
+    """
+    survivors = list(range(len(candidates)))
+    nrows = max(nrows, backend.min_sample_rows)
+    while len(survivors) > 2 and nrows < backend.n_samples:
+        scores = backend.score_subsets([candidates[i] for i in survivors], executor, nrows=nrows)
+        ranked = sorted((math.inf if math.isnan(score) else score, i) for score, i in zip(scores, survivors))
+        keep = max(2, math.ceil(len(survivors) / HALVING_FACTOR))
+        survivors = sorted(i for _, i in ranked[:keep])
+        nrows *= HALVING_FACTOR
+    return survivors
+
+
+def _fit_and_score(train_model: TrainModel, score_model: ScoreModel, subset: List[str]) -> Tuple[float, Any]:
+    """ Train and score the model for a single subset of variables """
+    model = train_model(subset)
+    return score_model(model, subset), model
+
+
+def _evaluate_subsets(subsets: List[List[str]], train_model: TrainModel, score_model: ScoreModel,
+                      executor: Optional[Executor], cache: Optional[SubsetCache] = None, *,
+                      score_subsets: Optional[Callable[[List[List[str]], Optional[Executor]], List[float]]] = None,
+                      known: Optional[Dict[FrozenSet[str], float]] = None) -> List[Tuple[float, Any]]:
+    """ Train and score the models for all subsets; subsets found in the cache are not refitted
+
+    The results are returned in the order of subsets, independent of the executor, so that
+    sorting the candidates of a step breaks ties the same way as the serial algorithm. If given,
+    score_subsets scores all missing subsets at once and their models are only fitted if selected.
+    Subsets with known scores, e.g. from a checkpoint, are neither fitted nor scored.
+    """
+    def lookup(subset: List[str]) -> Optional[Tuple[float, Any]]:
+        if known and frozenset(subset) in known:
+            return known[frozenset(subset)], _NOT_FITTED
+        return None if cache is None else cache.lookup(subset)
+
+    cached = [lookup(subset) for subset in subsets]
+    missing = [subset for subset, result in zip(subsets, cached) if result is None]
+    if score_subsets is not None:
+        evaluated = iter([(score, _NOT_FITTED) for score in score_subsets(missing, executor)])
+    elif executor is None:
+        evaluated = iter([_fit_and_score(train_model, score_model, subset) for subset in missing])
+    else:
+        evaluated = executor.map(partial(_fit_and_score, train_model, score_model), missing)
+    results = []
+    for subset, result in zip(subsets, cached):
+        if result is not None:
+            results.append(result)
+            continue
+        results.append(next(evaluated))
+        if cache is not None:
+            cache.store(subset, *results[-1])
+    return results
+
+
+def _fitted(model: Any, variables: List[str], train_model: TrainModel) -> Any:
+    """ Fit the model for the variables if it was only scored so far """
+    return train_model(variables) if model is _NOT_FITTED else model
@@ -4,45 +4,60 @@ Applications in Python"
 
 (c) 2019-2023 Galit Shmueli, Peter C. Bruce, Peter Gedeck
 '''
+import hashlib
+import importlib.util
 import io
+import json
 import os
-from tempfile import TemporaryDirectory
-from typing import Any, List, Optional
+import sys
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import lru_cache, partial
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple, overload
 
 import numpy as np
 import pandas as pd
-from sklearn.tree import export_graphviz
-
-hasGraphviz = False
-try:
-    import graphviz
-    hasGraphviz = True
-except ImportError:
-    pass
-
-try:
-    from IPython.display import Image
-    hasImage = True
-except ImportError:
-    hasImage = False
-
-def liftChart(predicted: pd.Series, *, title: str = 'Decile Lift Chart', labelBars: bool = True,
-              ax: Any = None, figsize: Any = None) -> Any:
+
+from .parallel import worker_executor
+
+# graphviz, IPython, matplotlib, and scikit-learn are only imported when they are used
+hasGraphviz = importlib.util.find_spec('graphviz') is not None
+hasImage = importlib.util.find_spec('IPython') is not None
+
+
+@lru_cache(maxsize=None)
+def _configure_matplotlib() -> None:
+    """ Use the non-interactive Agg backend if no display is available; called before the first chart """
+    if 'google.colab' in sys.modules:
+        print('Colab environment detected.')
+    elif os.environ.get('DISPLAY', '') == '' and os.name != 'nt':
+        import matplotlib as mpl  # noqa: PLC0415
+        print('no display found. Using non-interactive Agg backend')
+        mpl.use('Agg')
+
+
+def liftChart(predicted: Any, *, title: str = 'Decile Lift Chart', labelBars: bool = True,
+              ax: Any = None, figsize: Any = None, compute_only: bool = False, scores: Any = None) -> Any:
     """ Create a lift chart using predicted values
 
     Input:
-        predictions: must be sorted by probability
+        predictions: must be sorted by probability, unless scores are given; or a GainsSketch
         ax (optional): axis for matplotlib graph
         title (optional): set to None to suppress title
         labelBars (optional): set to False to avoid mean response labels on bar chart
+        compute_only (optional): return the lift for each decile as a series instead of creating the chart
+        scores (optional): model scores of the unsorted predictions; the deciles are determined
+            by partial sorting of the scores
     """
-    # group the sorted predictions into 10 roughly equal groups and calculate the mean
-    groups = [int(10 * i / len(predicted)) for i in range(len(predicted))]
-    meanPercentile = predicted.groupby(groups).mean()
-    # divide by the mean prediction to get the mean response
-    meanResponse = meanPercentile / predicted.mean()  # type: ignore
-    meanResponse.index = (meanResponse.index + 1) * 10
+    records, cumGains = _cumulativeGains(predicted, scores, _decileRecords)
+    # divide the mean of each decile by the overall mean to get the mean response
+    meanResponse = pd.Series((np.diff(cumGains) / np.diff(records)) / (cumGains[-1] / records[-1]),
+                             index=_decilePercentiles(records))
+    if compute_only:
+        return meanResponse
 
+    _configure_matplotlib()
     ax = meanResponse.plot.bar(color='C0', ax=ax, figsize=figsize)
     ax.set_ylim(0, 1.12 * meanResponse.max() if labelBars else None)
     ax.set_xlabel('Percentile')
@@ -56,39 +71,166 @@ def liftChart(predicted: pd.Series, *, title: str = 'Decile Lift Chart', labelBa
     return ax
 
 
-def gainsChart(gains: pd.Series, color: str = 'C0', label: Optional[str] = None,
-               ax: Any = None, figsize: Any = None) -> Any:
+def gainsChart(gains: Any, color: str = 'C0', label: Optional[str] = None,
+               ax: Any = None, figsize: Any = None, *, resolution: Optional[int] = 1000,
+               compute_only: bool = False, scores: Any = None) -> Any:
     """ Create a gains chart using predicted values
 
     Input:
-        gains: must be sorted by probability
+        gains: must be sorted by probability, unless scores are given; or a GainsSketch
         color (optional): color of graph
         ax (optional): axis for matplotlib graph
         figsize (optional): size of matplotlib graph
+        resolution (optional): maximum number of line segments of the curve (default 1000); None plots
+            every record. The curve deviates from the exact curve by at most max(gains) * len(gains) / resolution.
+        compute_only (optional): return the curve as a data frame with the columns records and cumGains
+            instead of creating the chart
+        scores (optional): model scores of the unsorted gains; the records are ranked by decreasing score
     """
-    nTotal = len(gains)  # number of records
-    nActual = gains.sum()  # number of desired records
-
-    # get cumulative sum of gains and convert to percentage
-    cumGains = pd.concat([pd.Series([0]), gains.cumsum()])  # Note the additional 0 at the front
-    gains_df = pd.DataFrame({'records': list(range(len(gains) + 1)), 'cumGains': cumGains})
+    records, cumGains = _cumulativeGains(gains, scores, partial(_curveRecords, resolution=resolution))
+    gains_df = pd.DataFrame({'records': records, 'cumGains': cumGains})
+    if compute_only:
+        return gains_df
 
+    _configure_matplotlib()
     ax = gains_df.plot(x='records', y='cumGains', color=color, label=label, legend=False,
                        ax=ax, figsize=figsize)
 
     # Add line for random gain
-    ax.plot([0, nTotal], [0, nActual], linestyle='--', color='k')
+    ax.plot([0, records[-1]], [0, cumGains[-1]], linestyle='--', color='k')
     ax.set_xlabel('# records')
     ax.set_ylabel('# cumulative gains')
     return ax
 
 
+class GainsSketch:
+    """ Mergeable summary of (score, actual) pairs for lift and gains charts of data that doesn't fit in memory
+
+    The records are kept in buckets of consecutive scores with their number and the sum of the
+    actual values. Buckets contain at most 2 n / size records and there are at most about 3 * size
+    buckets. Within a bucket, the gains are interpolated linearly, so that the cumulative gains
+    differ from the exact values by about max(actual) * 2 n / size or less. Sketches of parts of
+    the data, e.g. computed in separate processes, are combined using merge.
+
+    Example:
+        sketch = GainsSketch()
+        for chunk in load_data_iter(name, chunksize=100_000):
+            sketch.update(model.predict_proba(chunk[predictors])[:, 1], chunk[outcome])
+        gainsChart(sketch)
+    """
+    def __init__(self, size: int = 1000) -> None:
+        if size < 1:
+            raise ValueError('size must be a positive integer')
+        self.size = size
+        self.n = 0
+        # buckets ordered by decreasing mean score
+        self._scores = np.zeros(0)
+        self._counts = np.zeros(0, dtype=np.int64)
+        self._gains = np.zeros(0)
+
+    def update(self, scores: Any, actual: Any) -> 'GainsSketch':
+        """ Add records with the model scores and the actual values """
+        scores = np.asarray(scores, dtype=float).ravel()
+        actual = np.asarray(actual, dtype=float).ravel()
+        if scores.shape != actual.shape:
+            raise ValueError('scores and actual must have the same shape')
+        self._add(scores, np.ones(len(scores), dtype=np.int64), actual)
+        return self
+
+    def merge(self, other: 'GainsSketch') -> 'GainsSketch':
+        """ Add the records summarized by another sketch """
+        self._add(other._scores, other._counts, other._gains)
+        return self
+
+    def cumulative_gains(self, records: Any) -> np.ndarray:
+        """ Approximate sum of the actual values of the given numbers of records with the highest scores """
+        counts = np.concatenate([[0], np.cumsum(self._counts)])
+        gains = np.concatenate([[0], np.cumsum(self._gains)])
+        return np.interp(records, counts, gains)
+
+    def _add(self, scores: np.ndarray, counts: np.ndarray, gains: np.ndarray) -> None:
+        scores = np.concatenate([self._scores, scores])
+        counts = np.concatenate([self._counts, counts])
+        gains = np.concatenate([self._gains, gains])
+        order = np.argsort(-scores, kind='stable')
+        scores, counts, gains = scores[order], counts[order], gains[order]
+        self.n = int(counts.sum())
+
+        # combine consecutive buckets whose first record falls into the same interval of capacity
+        # records; buckets that already reach the capacity are kept
+        capacity = max(self.n / self.size, 1)
+        first = (np.cumsum(counts) - counts) // capacity
+        full = counts >= capacity
+        newBucket = np.ones(len(counts), dtype=bool)
+        newBucket[1:] = full[1:] | full[:-1] | (first[1:] != first[:-1])
+        starts = np.flatnonzero(newBucket)
+        if len(starts) == len(counts):
+            self._scores, self._counts, self._gains = scores, counts, gains
+            return
+        self._counts = np.add.reduceat(counts, starts)
+        self._gains = np.add.reduceat(gains, starts)
+        self._scores = np.add.reduceat(scores * counts, starts) / self._counts
+
+
+_PARTITION_LIMIT = 16
+
+
+def _cumulativeGains(gains: Any, scores: Any,
+                     getRecords: Callable[[int], np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """ Sum of the gains of the first r records for each r in records, records = getRecords(n)
+
+    Without scores, the gains must be sorted. With scores, the records are ordered by decreasing
+    score only as far as needed: np.argpartition places the boundaries given by records. Partitioning
+    at many boundaries is slower than sorting, so curves with many points use a full sort.
+    """
+    if isinstance(gains, GainsSketch):
+        records = getRecords(gains.n)
+        return records, gains.cumulative_gains(records)
+    values = np.asarray(gains)
+    if values.dtype == bool:
+        values = values.astype(np.int64)
+    records = getRecords(len(values))
+    if scores is not None:
+        scores = np.asarray(scores, dtype=float).ravel()
+        if scores.shape != values.shape:
+            raise ValueError('scores and gains must have the same shape')
+        kth = records[1:-1]
+        order = np.argsort(-scores) if len(kth) > _PARTITION_LIMIT else np.argpartition(-scores, kth)
+        values = values[order]
+    if len(records) == 1:
+        return records, np.zeros(1, dtype=values.dtype)
+    # sums of the segments between consecutive records
+    cumGains = np.concatenate([[0], np.cumsum(np.add.reduceat(values, records[:-1]))])
+    return records, cumGains
+
+
+def _decileRecords(n: int) -> np.ndarray:
+    """ Start of the non-empty deciles and n; record i belongs to decile floor(10 i / n) """
+    return np.unique(-(-np.arange(11) * n // 10))  # ceil(k * n / 10) is the first record of decile k
+
+
+def _decilePercentiles(records: np.ndarray) -> np.ndarray:
+    n = records[-1]
+    # decile k starts at ceil(k * n / 10), so k is the largest integer with k * n <= 10 * start
+    return (10 * records[:-1] // n + 1) * 10
+
+
+def _curveRecords(n: int, resolution: Optional[int]) -> np.ndarray:
+    """ Numbers of records at which the gains curve is evaluated: all or resolution + 1 evenly spaced """
+    if resolution is None or n <= resolution:
+        return np.arange(n + 1)
+    return np.unique(np.linspace(0, n, resolution + 1).round().astype(np.int64))
+
+
 def plotDecisionTree(decisionTree: Any, *, feature_names: Optional[List[str]] = None,
                      class_names: Optional[List[str]] = None, impurity: bool = False,
                      label: str = 'root', max_depth: Optional[int] = None, rotate: bool = False,
-                     pdfFile: Optional[os.PathLike] = None) -> Any:
+                     pdfFile: Optional[os.PathLike] = None, max_nodes: Optional[int] = None) -> Any:
     """ Create a plot of the scikit-learn decision tree and show in the Jupyter notebook
 
+    The graph is laid out once and rendered in memory. Renderings are cached by the tree and the
+    options, so showing the same tree again doesn't run graphviz.
+
     Input:
         decisionTree: scikit-learn decision tree
         feature_names (optional): variable names
@@ -98,6 +240,7 @@ def plotDecisionTree(decisionTree: Any, *, feature_names: Optional[List[str]] =
         max_depth (optional): limit
         rotate (optional): rotate the layout of the graph
         pdfFile (optional): provide pathname to create a PDF file of the graph
+        max_nodes (optional): collapse the deepest levels of the tree so that at most max_nodes nodes are shown
     """
     if not hasGraphviz:
         return 'You need to install graphviz to visualize decision trees'
@@ -105,58 +248,163 @@ def plotDecisionTree(decisionTree: Any, *, feature_names: Optional[List[str]] =
         return 'You need to install Image and/or graphviz to visualize decision trees'
     if class_names is not None:
         class_names = [str(s) for s in class_names]  # convert to strings
-    dot_data = io.StringIO()
-    export_graphviz(decisionTree, feature_names=feature_names, class_names=class_names, impurity=impurity,
-                    label=label, out_file=dot_data, filled=True, rounded=True, special_characters=True,
-                    max_depth=max_depth, rotate=rotate)
-    graph = graphviz.Source(dot_data.getvalue())
-    with TemporaryDirectory() as tempdir:
-        if pdfFile is not None:
-            graph.render('dot', directory=tempdir, format='pdf', outfile=pdfFile)
-        if hasImage:
-            return Image(graph.render('dot', directory=tempdir, format='png'))
-        return None
-
-# Taken from scikit-learn documentation
-
-
-def textDecisionTree(decisionTree: Any, indent: str = '  ', as_ratio: bool = True) -> str:  # noqa: FBT001,FBT002
+    if max_nodes is not None:
+        depth = _maxDepthForNodes(decisionTree.tree_, max_nodes)
+        max_depth = depth if max_depth is None else min(max_depth, depth)
+    formats = (['pdf'] if pdfFile is not None else []) + (['png'] if hasImage else [])
+    options = {'feature_names': feature_names, 'class_names': class_names, 'impurity': impurity,
+               'label': label, 'max_depth': max_depth, 'rotate': rotate}
+
+    key = _treeHash(decisionTree, options, formats)
+    rendered = _renderCache.get(key)
+    if rendered is None:
+        from sklearn.tree import export_graphviz  # noqa: PLC0415
+        dot_data = io.StringIO()
+        export_graphviz(decisionTree, out_file=dot_data, filled=True, rounded=True, special_characters=True,
+                        **options)
+        rendered = _renderGraph(dot_data.getvalue(), formats)
+        _renderCache[key] = rendered
+        while len(_renderCache) > RENDER_CACHE_SIZE:
+            _renderCache.popitem(last=False)
+    else:
+        _renderCache.move_to_end(key)
+
+    if pdfFile is not None:
+        Path(pdfFile).write_bytes(rendered['pdf'])
+    if hasImage:
+        from IPython.display import Image  # noqa: PLC0415
+        return Image(data=rendered['png'], format='png')
+    return None
+
+
+# renderings of decision trees by hash of the tree and the plot options
+RENDER_CACHE_SIZE = 32
+_renderCache: 'OrderedDict[str, Dict[str, bytes]]' = OrderedDict()
+
+
+def _treeHash(decisionTree: Any, options: Dict[str, Any], formats: List[str]) -> str:
+    """ Hash of everything that determines the rendering of a tree """
+    tree = decisionTree.tree_
+    digest = hashlib.sha256()
+    digest.update(json.dumps([type(decisionTree).__name__, str(getattr(decisionTree, 'criterion', '')),
+                              options, formats], default=str).encode())
+    for values in (tree.children_left, tree.children_right, tree.feature, tree.threshold, tree.value,
+                   tree.impurity, tree.n_node_samples, tree.weighted_n_node_samples):
+        digest.update(np.ascontiguousarray(values).tobytes())
+    return digest.hexdigest()
+
+
+def _renderGraph(dotSource: str, formats: List[str]) -> Dict[str, bytes]:
+    """ Render the graph in memory; with several formats, the layout is computed only once """
+    import graphviz  # noqa: PLC0415
+    if len(formats) == 1:
+        return {formats[0]: graphviz.Source(dotSource).pipe(format=formats[0])}
+    # the dot output contains the node positions; neato -n2 renders it without a new layout
+    layout = graphviz.Source(dotSource).pipe(format='dot', encoding='utf-8')
+    return {fmt: graphviz.Source(layout, engine='neato').pipe(format=fmt, neato_no_op=2) for fmt in formats}
+
+
+def _maxDepthForNodes(tree: Any, max_nodes: int) -> int:
+    """ Largest depth so that the tree shows at most max_nodes nodes; collapsed subtrees are shown as one node """
+    nodesPerDepth = np.bincount(_nodeDepth(tree.children_left, tree.children_right))
+    # with max_depth d, the nodes up to depth d are shown and the children of nodes at depth d are collapsed
+    shown = np.cumsum(nodesPerDepth) + np.append(nodesPerDepth[1:], 0)
+    return max(int(np.searchsorted(shown, max_nodes, side='right')) - 1, 0)
+
+
+@overload
+def textDecisionTree(decisionTree: Any, indent: str = ..., as_ratio: bool = ..., *,  # noqa: FBT001
+                     file: None = ..., n_jobs: Optional[int] = ..., executor: Optional[Executor] = ...) -> str:
+    ...
+
+
+@overload
+def textDecisionTree(decisionTree: Any, indent: str = ..., as_ratio: bool = ..., *,  # noqa: FBT001
+                     file: TextIO, n_jobs: Optional[int] = ..., executor: Optional[Executor] = ...) -> None:
+    ...
+
+
+def textDecisionTree(decisionTree: Any, indent: str = '  ', as_ratio: bool = True, *,  # noqa: FBT001,FBT002
+                     file: Optional[TextIO] = None, n_jobs: Optional[int] = None,
+                     executor: Optional[Executor] = None) -> Optional[str]:
     """ Create a text representation of the scikit-learn decision tree
 
     Input:
-        decisionTree: scikit-learn decision tree
+        decisionTree: scikit-learn decision tree or tree ensemble, e.g. a random forest or gradient boosting model
         as_ratio: show the composition of the leaf nodes as ratio (default) instead of counts
         indent: indentation (default two spaces)
+        file (optional): text stream; the representation is written in chunks and not returned
+        n_jobs (optional): number of processes used to render the trees of an ensemble; -1 uses all processors
+        executor (optional): concurrent.futures executor used to render the trees of an ensemble
+
+    Returns:
+        the text representation or None if file is given
+    """
+    parts: Iterable[str]
+    if hasattr(decisionTree, 'tree_'):
+        parts = _iterTreeText(decisionTree.tree_, indent, as_ratio)
+    else:
+        # ensembles: render the trees independently and in order
+        trees = [estimator.tree_ for estimator in np.asarray(decisionTree.estimators_, dtype=object).ravel()]
+        parts = _iterEnsembleText(trees, indent, as_ratio, n_jobs, executor)
+    if file is None:
+        return '\n'.join(parts)
+    for part in parts:
+        file.write(part)
+        file.write('\n')
+    return None
+
+
+def _iterEnsembleText(trees: List[Any], indent: str, as_ratio: bool, n_jobs: Optional[int],  # noqa: FBT001
+                      executor: Optional[Executor]) -> Iterator[str]:
+    render = partial(_treeText, indent=indent, as_ratio=as_ratio)
+    with worker_executor(n_jobs, executor, ProcessPoolExecutor) as pool:
+        texts = map(render, trees) if pool is None else pool.map(render, trees)
+        for i, text in enumerate(texts):
+            yield f'tree={i}\n{text}'
+
+
+def _treeText(tree: Any, indent: str, as_ratio: bool) -> str:  # noqa: FBT001
+    return '\n'.join(_iterTreeText(tree, indent, as_ratio))
+
+
+def _iterTreeText(tree: Any, indent: str, as_ratio: bool, chunksize: int = 10000) -> Iterator[str]:  # noqa: FBT001
+    """ Text representation of the nodes of a tree_ object in chunks of chunksize lines
+
+    The depth of the nodes and the leaf compositions are computed with numpy for all nodes at once.
     """
-    n_nodes = decisionTree.tree_.node_count
-    children_left = decisionTree.tree_.children_left
-    children_right = decisionTree.tree_.children_right
-    feature = decisionTree.tree_.feature
-    threshold = decisionTree.tree_.threshold
-    node_value = decisionTree.tree_.value
-
-    node_depth = np.zeros(shape=n_nodes, dtype=np.int64)
-    is_leaves = np.zeros(shape=n_nodes, dtype=bool)
-    stack = [(0, -1)]  # seed is the root node id and its parent depth
-    while len(stack) > 0:
-        node_id, parent_depth = stack.pop()
-        node_depth[node_id] = parent_depth + 1
-        # If we have a test node
-        if children_left[node_id] != children_right[node_id]:
-            stack.append((children_left[node_id], parent_depth + 1))
-            stack.append((children_right[node_id], parent_depth + 1))
-        else:
-            is_leaves[node_id] = True
-
-    rep = []
-    for i in range(n_nodes):
-        common = f'{node_depth[i] * indent}node={i}'
-        if is_leaves[i]:
-            value = node_value[i]
-            if as_ratio:
-                value = [[round(vi / sum(v), 3) for vi in v] for v in value]
-            rep.append(f'{common} leaf node: {value}')
-        else:
-            rule = f'{children_left[i]} if {feature[i]} <= {threshold[i]} else to node {children_right[i]}'
-            rep.append(f'{common} test node: go to node {rule}')
-    return '\n'.join(rep)
+    children_left = tree.children_left
+    children_right = tree.children_right
+    is_leaves = children_left == children_right
+    node_depth = _nodeDepth(children_left, children_right)
+    node_value = tree.value
+    if as_ratio:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            node_value = np.round(node_value / node_value.sum(axis=-1, keepdims=True), 3)
+
+    for start in range(0, tree.node_count, chunksize):
+        nodes = range(start, min(start + chunksize, tree.node_count))
+        rep = []
+        for i, depth, leaf, left, right, feature, threshold in zip(
+                nodes, node_depth[nodes.start:nodes.stop].tolist(), is_leaves[nodes.start:nodes.stop].tolist(),
+                children_left[nodes.start:nodes.stop].tolist(), children_right[nodes.start:nodes.stop].tolist(),
+                tree.feature[nodes.start:nodes.stop].tolist(), tree.threshold[nodes.start:nodes.stop].tolist()):
+            common = f'{depth * indent}node={i}'
+            if leaf:
+                value = node_value[i].tolist() if as_ratio else node_value[i]
+                rep.append(f'{common} leaf node: {value}')
+            else:
+                rep.append(f'{common} test node: go to node {left} if {feature} <= {threshold} else to node {right}')
+        yield '\n'.join(rep)
+
+
+def _nodeDepth(children_left: np.ndarray, children_right: np.ndarray) -> np.ndarray:
+    """ Depth of each node; the tree is traversed one level at a time starting at the root """
+    node_depth = np.zeros(len(children_left), dtype=np.int64)
+    nodes = np.zeros(1, dtype=np.int64)
+    while len(nodes) > 0:
+        nodes = nodes[children_left[nodes] != children_right[nodes]]
+        depth = node_depth[nodes] + 1
+        nodes = np.concatenate([children_left[nodes], children_right[nodes]])
+        node_depth[nodes] = np.concatenate([depth, depth])
+    return node_depth
@@ -5,13 +5,26 @@ Applications in Python"
 (c) 2019-2023 Galit Shmueli, Peter C. Bruce, Peter Gedeck
 '''
 import math
-from typing import Any, List, Optional
+from collections import Counter
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 
 import numpy as np
-from sklearn.metrics import accuracy_score, confusion_matrix, mean_squared_error, r2_score
+
+# pandas, scipy, and scikit-learn are only imported when needed; importing them takes longer than the metrics
+if TYPE_CHECKING:
+    import pandas as pd
+    import scipy.sparse as sp
 
 Vector = Any
 
+REGRESSION_METRICS = {
+    'ME': 'Mean Error (ME)',
+    'RMSE': 'Root Mean Squared Error (RMSE)',
+    'MAE': 'Mean Absolute Error (MAE)',
+    'MPE': 'Mean Percentage Error (MPE)',
+    'MAPE': 'Mean Absolute Percentage Error (MAPE)',
+}
+
 
 def adjusted_r2_score(y_true: Vector, y_pred: Vector, model: Any) -> float:
     """ calculate adjusted R2
@@ -24,26 +37,25 @@ def adjusted_r2_score(y_true: Vector, y_pred: Vector, model: Any) -> float:
     p = len(model.coef_)
     if p >= n - 1:
         return 0
+    from sklearn.metrics import r2_score  # noqa: PLC0415
     r2 = r2_score(y_true, y_pred)
     return 1 - (1 - r2) * (n - 1) / (n - p - 1)
 
 
-def AIC_score(y_true: Vector, y_pred: Vector, model: Optional[Any] = None, df: Optional[int] = None) -> float:
+def AIC_score(y_true: Optional[Vector] = None, y_pred: Optional[Vector] = None, model: Optional[Any] = None,
+              df: Optional[int] = None, *, sse: Optional[float] = None, n: Optional[int] = None) -> float:
     """ calculate Akaike Information Criterion (AIC)
     Input:
         y_true: actual values
         y_pred: predicted values
         model (optional): predictive model
         df (optional): degrees of freedom of model
+        sse (optional): sum of squared errors; if given, y_true and y_pred are not used
+        n (optional): number of records, required if sse is given without y_pred
 
     One of model or df is requried
     """
-    p = getDegreesOfFreedom(model=model, df=df)
-    n = len(y_pred)
-    resid = np.array(y_true) - np.array(y_pred)
-    sse = np.sum(resid ** 2)
-    constant = n + n * np.log(2 * np.pi)
-    return n * math.log(sse / n) + constant + 2 * (p + 1)
+    return information_criteria(y_true, y_pred, model=model, df=df, sse=sse, n=n)['AIC']
 
 
 def getDegreesOfFreedom(model: Optional[Any] = None, df: Optional[int] = None) -> int:
@@ -56,45 +68,274 @@ def getDegreesOfFreedom(model: Optional[Any] = None, df: Optional[int] = None) -
     return p
 
 
-def BIC_score(y_true: Vector, y_pred: Vector, model: Optional[Any] = None, df: Optional[int] = None) -> float:
+def BIC_score(y_true: Optional[Vector] = None, y_pred: Optional[Vector] = None, model: Optional[Any] = None,
+              df: Optional[int] = None, *, sse: Optional[float] = None, n: Optional[int] = None) -> float:
     """ calculate Schwartz's Bayesian Information Criterion (AIC)
     Input:
         y_true: actual values
         y_pred: predicted values
         model: predictive model
         df (optional): degrees of freedom of model
+        sse (optional): sum of squared errors; if given, y_true and y_pred are not used
+        n (optional): number of records, required if sse is given without y_pred
+    """
+    return information_criteria(y_true, y_pred, model=model, df=df, sse=sse, n=n)['BIC']
+
+
+def information_criteria(y_true: Optional[Vector] = None, y_pred: Optional[Vector] = None,
+                         model: Optional[Any] = None, df: Optional[int] = None, *,
+                         sse: Optional[float] = None, n: Optional[int] = None) -> Dict[str, float]:
+    """ calculate the sum of squared errors, AIC, and BIC in one pass over the data
+
+    The squared errors are summed in chunks, so that no full-size copies of the data are created.
+    float32 data are not converted to float64; the sums are accumulated in float64.
+
+    Input:
+        see AIC_score
+
+    Returns:
+        dictionary with the keys sse, AIC, and BIC
     """
     p = getDegreesOfFreedom(model=model, df=df)
-    aic = AIC_score(y_true, y_pred, model=model, df=df)
-    n = len(y_pred)
-    return aic - 2 * (p + 1) + math.log(n) * (p + 1)
+    if n is None:
+        if y_pred is None:
+            raise ValueError('You need to provide either y_pred or n')
+        n = len(y_pred)
+    if sse is None:
+        if y_true is None or y_pred is None:
+            raise ValueError('You need to provide either y_true and y_pred or sse')
+        sse = _sumSquaredErrors(y_true, y_pred)
+    loglik = _logLikelihoodTerm(sse, n)
+    return {
+        'sse': float(sse),
+        'AIC': loglik + 2 * (p + 1),
+        'BIC': loglik + math.log(n) * (p + 1),
+    }
+
+
+def _sumSquaredErrors(y_true: Vector, y_pred: Vector, chunksize: int = 65536) -> float:
+    y_true = _toArray(y_true)
+    y_pred = _toArray(y_pred)
+    if y_true.shape != y_pred.shape:
+        raise ValueError('y_true and y_pred must have the same shape')
+    dtype = np.result_type(y_true.dtype, y_pred.dtype, np.float32)
+    if dtype.kind != 'f':
+        dtype = np.dtype(np.float64)
+    sse = 0.0
+    for start in range(0, len(y_true), chunksize):
+        resid = np.subtract(y_true[start:start + chunksize], y_pred[start:start + chunksize], dtype=dtype)
+        sse += float(np.einsum('i,i->', resid, resid, dtype=np.float64))
+    return sse
+
+
+def AIC_scores(y_true: Vector, y_pred: Any, df: Vector) -> np.ndarray:
+    """ calculate Akaike Information Criterion (AIC) for many models at once
+    Input:
+        y_true: actual values
+        y_pred: predicted values as a matrix with one column per model
+        df: degrees of freedom of each model, or one value for all models
+
+    Returns:
+        array with the AIC_score of each model
+    """
+    y_true, y_pred = _toPredictionMatrix(y_true, y_pred)
+    n = len(y_true)
+    p = np.broadcast_to(np.asarray(df, dtype=float), (y_pred.shape[1],))
+    return _logLikelihoodTerm(_columnSSE(y_true, y_pred), n) + 2 * (p + 1)
+
+
+def BIC_scores(y_true: Vector, y_pred: Any, df: Vector) -> np.ndarray:
+    """ calculate Schwartz's Bayesian Information Criterion (BIC) for many models at once
+    Input:
+        y_true: actual values
+        y_pred: predicted values as a matrix with one column per model
+        df: degrees of freedom of each model, or one value for all models
+
+    Returns:
+        array with the BIC_score of each model
+    """
+    y_true, y_pred = _toPredictionMatrix(y_true, y_pred)
+    n = len(y_true)
+    p = np.broadcast_to(np.asarray(df, dtype=float), (y_pred.shape[1],))
+    return _logLikelihoodTerm(_columnSSE(y_true, y_pred), n) + math.log(n) * (p + 1)
 
 
-def regressionSummary(y_true: Vector, y_pred: Vector) -> None:
+def adjusted_r2_scores(y_true: Vector, y_pred: Any, nvariables: Vector) -> np.ndarray:
+    """ calculate adjusted R2 for many models at once
+    Input:
+        y_true: actual values
+        y_pred: predicted values as a matrix with one column per model
+        nvariables: number of coefficients of each model (len(model.coef_)), or one value for all models
+
+    Returns:
+        array with the adjusted_r2_score of each model
+    """
+    y_true, y_pred = _toPredictionMatrix(y_true, y_pred)
+    n = len(y_true)
+    p = np.broadcast_to(np.asarray(nvariables, dtype=float), (y_pred.shape[1],))
+    sse = _columnSSE(y_true, y_pred)
+    sst = float(np.sum((y_true - y_true.mean()) ** 2))
+    # same convention as sklearn.metrics.r2_score for constant y_true
+    r2 = 1 - sse / sst if sst > 0 else np.where(sse == 0, 1.0, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        adjusted = 1 - (1 - r2) * (n - 1) / (n - p - 1)
+    return np.where(p >= n - 1, 0.0, adjusted)
+
+
+def _toPredictionMatrix(y_true: Vector, y_pred: Any) -> Tuple[np.ndarray, np.ndarray]:
+    y_true = _toArray(y_true).astype(float, copy=False)
+    y_pred = np.asarray(y_pred, dtype=float)
+    if y_pred.ndim == 1:
+        y_pred = y_pred[:, np.newaxis]
+    if y_pred.ndim != 2 or y_pred.shape[0] != len(y_true):
+        raise ValueError('y_pred must be a matrix with one row per value of y_true')
+    return y_true, y_pred
+
+
+def _columnSSE(y_true: np.ndarray, y_pred: np.ndarray, chunksize: int = 65536) -> np.ndarray:
+    """ Sum of squared errors of each column of y_pred; the residuals are computed in chunks of rows """
+    sse = np.zeros(y_pred.shape[1])
+    for start in range(0, len(y_true), chunksize):
+        resid = y_pred[start:start + chunksize] - y_true[start:start + chunksize, np.newaxis]
+        sse += np.einsum('ij,ij->j', resid, resid)
+    return sse
+
+
+def _logLikelihoodTerm(sse: Any, n: int) -> Any:
+    """ Part of AIC and BIC that depends on the data: -2 log-likelihood of a model with normal errors """
+    if np.ndim(sse) == 0:
+        return n * math.log(sse / n) + n + n * math.log(2 * math.pi)
+    return n * np.log(sse / n) + n + n * np.log(2 * np.pi)
+
+
+def regressionSummary(y_true: Vector, y_pred: Vector, sample_weight: Optional[Vector] = None) -> None:
     """ print regression performance metrics
 
     Input:
         y_true: actual values
         y_pred: predicted values
+        sample_weight (optional): weights of the individual records
     """
-    y_true = _toArray(y_true)
-    y_pred = _toArray(y_pred)
-    y_res = y_true - y_pred
-    metrics = [
-        ('Mean Error (ME)', sum(y_res) / len(y_res)),
-        ('Root Mean Squared Error (RMSE)', math.sqrt(mean_squared_error(y_true, y_pred))),
-        ('Mean Absolute Error (MAE)', sum(abs(y_res)) / len(y_res)),
-    ]
-    if all(yt != 0 for yt in y_true):
-        metrics.extend([
-            ('Mean Percentage Error (MPE)', 100 * sum(y_res / y_true) / len(y_res)),
-            ('Mean Absolute Percentage Error (MAPE)', 100 * sum(abs(y_res / y_true) / len(y_res))),
-        ])
-    maxlength = max(len(m[0]) for m in metrics)
+    _printRegressionMetrics(regression_metrics(y_true, y_pred, sample_weight=sample_weight))
+
+
+def regression_metrics(y_true: Vector, y_pred: Vector, sample_weight: Optional[Vector] = None) -> Dict[str, float]:
+    """ Returns the regression performance metrics printed by regressionSummary
+
+    The metrics are calculated in a single vectorized pass over the data. float32 input is
+    processed as float32, the sums are accumulated in float64.
+
+    Input:
+        y_true: actual values
+        y_pred: predicted values
+        sample_weight (optional): weights of the individual records
+
+    Returns:
+        dictionary with the keys ME, RMSE, MAE, and, if no actual value is zero, MPE and MAPE
+    """
+    return RegressionMetricsAccumulator().update(y_true, y_pred, sample_weight=sample_weight).metrics()
+
+
+def _printRegressionMetrics(metrics: Dict[str, float]) -> None:
+    maxlength = max(len(REGRESSION_METRICS[key]) for key in metrics)
     fmt1 = f'{{:>{maxlength}}} : {{:.4f}}'
     print('\nRegression statistics\n')
-    for metric, value in metrics:
-        print(fmt1.format(metric, value))
+    for key, value in metrics.items():
+        print(fmt1.format(REGRESSION_METRICS[key], value))
+
+
+class RegressionMetricsAccumulator:
+    """ Accumulate regression performance metrics over chunks of data
+
+    Use update for each chunk of actual and predicted values. Accumulators of chunks processed
+    separately, e.g. in worker processes, are combined using merge. The result is identical to
+    regressionSummary on the complete data, up to floating point rounding.
+
+    Example:
+        acc = RegressionMetricsAccumulator()
+        for batch in batches:
+            acc.update(batch['actual'], batch['predicted'])
+        acc.summary()
+    """
+    def __init__(self) -> None:
+        self.n = 0
+        self.sum_weight = 0.0
+        self.sum_error = 0.0
+        self.sum_abs_error = 0.0
+        self.sum_squared_error = 0.0
+        self.sum_pct_error = 0.0
+        self.sum_abs_pct_error = 0.0
+        self.n_zero = 0  # number of actual values that are zero; MPE and MAPE are undefined in this case
+
+    def update(self, y_true: Vector, y_pred: Vector,
+               sample_weight: Optional[Vector] = None) -> 'RegressionMetricsAccumulator':
+        """ Add a chunk of actual and predicted values and optionally their weights """
+        y_true = _toArray(y_true)
+        y_pred = _toArray(y_pred)
+        if y_true.shape != y_pred.shape:
+            raise ValueError('y_true and y_pred must have the same shape')
+        # float32 stays float32, everything else is processed as float64
+        dtype = np.result_type(y_true.dtype, y_pred.dtype, np.float32)
+        weight = None
+        if sample_weight is not None:
+            weight = _toArray(sample_weight).astype(dtype, copy=False)
+            if weight.shape != y_true.shape:
+                raise ValueError('sample_weight must have the same shape as y_true')
+
+        def weightedSum(values: np.ndarray) -> float:
+            if weight is None:
+                return float(np.sum(values, dtype=np.float64))
+            return float(np.einsum('i,i->', weight, values, dtype=np.float64))
+
+        # the residuals are the only full size temporary array besides the percentage errors
+        y_res = np.subtract(y_true, y_pred, dtype=dtype)
+        self.n += len(y_res)
+        self.sum_weight += len(y_res) if weight is None else float(np.sum(weight, dtype=np.float64))
+        self.sum_error += weightedSum(y_res)
+        if weight is None:
+            self.sum_squared_error += float(np.einsum('i,i->', y_res, y_res, dtype=np.float64))
+        else:
+            self.sum_squared_error += float(np.einsum('i,i,i->', weight, y_res, y_res, dtype=np.float64))
+        self.n_zero += len(y_true) - int(np.count_nonzero(y_true))
+        if self.n_zero == 0:
+            pct = np.divide(y_res, y_true, dtype=dtype)
+            self.sum_pct_error += weightedSum(pct)
+            self.sum_abs_pct_error += weightedSum(np.abs(pct, out=pct))
+        self.sum_abs_error += weightedSum(np.abs(y_res, out=y_res))
+        return self
+
+    def merge(self, other: 'RegressionMetricsAccumulator') -> 'RegressionMetricsAccumulator':
+        """ Add the results of another accumulator """
+        self.n += other.n
+        self.sum_weight += other.sum_weight
+        self.sum_error += other.sum_error
+        self.sum_abs_error += other.sum_abs_error
+        self.sum_squared_error += other.sum_squared_error
+        self.sum_pct_error += other.sum_pct_error
+        self.sum_abs_pct_error += other.sum_abs_pct_error
+        self.n_zero += other.n_zero
+        return self
+
+    def metrics(self) -> Dict[str, float]:
+        """ Returns the metrics as dictionary using the keys ME, RMSE, MAE, and, if defined, MPE and MAPE """
+        if self.n == 0:
+            raise ValueError('No data accumulated')
+        n = self.sum_weight
+        result = {
+            'ME': self.sum_error / n,
+            'RMSE': math.sqrt(self.sum_squared_error / n),
+            'MAE': self.sum_abs_error / n,
+        }
+        if self.n_zero == 0:
+            result['MPE'] = 100 * self.sum_pct_error / n
+            result['MAPE'] = 100 * self.sum_abs_pct_error / n
+        return result
+
+    def summary(self) -> Dict[str, float]:
+        """ Print the regression performance metrics like regressionSummary and return them """
+        metrics = self.metrics()
+        _printRegressionMetrics(metrics)
+        return metrics
 
 
 def _toArray(y: Vector) -> np.ndarray:
@@ -104,17 +345,127 @@ def _toArray(y: Vector) -> np.ndarray:
     return ya
 
 
-def classificationSummary(y_true: Vector, y_pred: Vector, class_names: Optional[List[str]] = None) -> None:
+def classificationSummary(y_true: Vector, y_pred: Vector, class_names: Optional[List[str]] = None, *,
+                          top_k: Optional[int] = None, max_classes: Optional[int] = None) -> None:
     """ Print a summary of classification performance
 
     Input:
         y_true: actual values
         y_pred: predicted values
         class_names (optional): list of class names
+        top_k (optional): print the top_k most confused pairs of classes instead of the confusion matrix
+        max_classes (optional): print the 10 most confused pairs instead of the confusion matrix if
+            there are more classes; by default, the confusion matrix is always printed
+    """
+    labels, rows, cols, counts = _confusionCounts(y_true, y_pred)
+    accuracy = counts[rows == cols].sum() / counts.sum()
+    if top_k is None and (max_classes is None or len(labels) <= max_classes):
+        cm = np.zeros((len(labels), len(labels)), dtype=np.int64)
+        cm[rows, cols] = counts
+        _printConfusionMatrix(cm, accuracy, class_names)
+        return
+
+    print(f'Confusion Matrix (Accuracy {accuracy:.4f}, {len(labels)} classes)\n')
+    names = np.asarray(labels if class_names is None else class_names, dtype=object)
+    confused = _topConfusedPairs(rows, cols, counts, names, 10 if top_k is None else top_k)
+    print('Most confused pairs of classes\n')
+    print(confused.to_string(index=False))
+
+
+def sparse_confusion_matrix(y_true: Vector, y_pred: Vector) -> Tuple[np.ndarray, 'sp.csr_matrix']:
+    """ Confusion matrix as sparse matrix
+
+    The labels are encoded as integers and the (actual, predicted) pairs are counted. Memory use
+    scales with the number of records and non-zero cells, not the square of the number of classes.
+
+    Input:
+        y_true: actual values
+        y_pred: predicted values
+
+    Returns:
+        (labels, confusion matrix with actual classes as rows and predicted classes as columns)
+    """
+    import scipy.sparse as sp  # noqa: PLC0415
+    labels, rows, cols, counts = _confusionCounts(y_true, y_pred)
+    cm = sp.csr_matrix((counts, (rows, cols)), shape=(len(labels), len(labels)), dtype=np.int64)
+    return labels, cm
+
+
+def top_confused_pairs(y_true: Vector, y_pred: Vector, top_k: int = 10) -> 'pd.DataFrame':
+    """ The most frequent misclassifications
+
+    Input:
+        y_true: actual values
+        y_pred: predicted values
+        top_k (optional): number of pairs (default 10)
+
+    Returns:
+        data frame with the columns actual, predicted, and count sorted by decreasing count
     """
-    confusionMatrix = confusion_matrix(y_true, y_pred)
-    accuracy = accuracy_score(y_true, y_pred)
+    labels, rows, cols, counts = _confusionCounts(y_true, y_pred)
+    return _topConfusedPairs(rows, cols, counts, labels, top_k)
 
+
+def per_class_metrics(y_true: Vector, y_pred: Vector) -> 'pd.DataFrame':
+    """ Precision, recall, and support for each class
+
+    Input:
+        y_true: actual values
+        y_pred: predicted values
+
+    Returns:
+        data frame indexed by class with the columns precision, recall, and support
+    """
+    import pandas as pd  # noqa: PLC0415
+    labels, cm = sparse_confusion_matrix(y_true, y_pred)
+    correct = cm.diagonal().astype(float)
+    support = np.asarray(cm.sum(axis=1)).ravel()
+    predicted = np.asarray(cm.sum(axis=0)).ravel()
+    precision = np.divide(correct, predicted, out=np.zeros_like(correct), where=predicted > 0)
+    recall = np.divide(correct, support, out=np.zeros_like(correct), where=support > 0)
+    return pd.DataFrame({'precision': precision, 'recall': recall, 'support': support}, index=labels)
+
+
+def _confusionCounts(y_true: Vector, y_pred: Vector) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """ Count the distinct (actual, predicted) pairs
+
+    Returns:
+        (sorted labels, row index, column index, and count of the non-zero cells of the confusion matrix)
+    """
+    y_true = _toArray(y_true)
+    y_pred = _toArray(y_pred)
+    if y_true.shape != y_pred.shape:
+        raise ValueError('y_true and y_pred must have the same shape')
+    labels, codes = np.unique(np.concatenate([y_true, y_pred]), return_inverse=True)
+    nlabels = len(labels)
+    n = len(y_true)
+    pairs = codes[:n].astype(np.int64) * nlabels + codes[n:]
+    if nlabels * nlabels <= 4 * n:
+        # small label space, counting is cheaper than sorting
+        counts = np.bincount(pairs, minlength=nlabels * nlabels)
+        pairs = np.flatnonzero(counts)
+        counts = counts[pairs]
+    else:
+        pairs, counts = np.unique(pairs, return_counts=True)
+    rows, cols = np.divmod(pairs, nlabels)
+    return labels, rows, cols, counts
+
+
+def _topConfusedPairs(rows: np.ndarray, cols: np.ndarray, counts: np.ndarray, labels: np.ndarray,
+                      top_k: int) -> 'pd.DataFrame':
+    import pandas as pd  # noqa: PLC0415
+    offDiagonal = rows != cols
+    rows, cols, counts = rows[offDiagonal], cols[offDiagonal], counts[offDiagonal]
+    if len(counts) > top_k:
+        selected = np.argpartition(-counts, top_k - 1)[:top_k]
+        rows, cols, counts = rows[selected], cols[selected], counts[selected]
+    # sort by decreasing count, ties by actual and predicted class
+    order = np.lexsort((cols, rows, -counts))
+    return pd.DataFrame({'actual': labels[rows[order]], 'predicted': labels[cols[order]],
+                         'count': counts[order]})
+
+
+def _printConfusionMatrix(confusionMatrix: Any, accuracy: float, class_names: Optional[List[str]]) -> None:
     print(f'Confusion Matrix (Accuracy {accuracy:.4f})\n')
 
     # Pretty-print confusion matrix
@@ -147,3 +498,51 @@ def classificationSummary(y_true: Vector, y_pred: Vector, class_names: Optional[
     for cls, row in zip(labels, cm):
         print(fmt1.format(cls), end='')
         print(fmt2.format(*row))
+
+
+class ClassificationMetricsAccumulator:
+    """ Accumulate the confusion matrix over chunks of data
+
+    Use update for each chunk of actual and predicted values. Accumulators of chunks processed
+    separately, e.g. in worker processes, are combined using merge. The result is identical to
+    classificationSummary on the complete data.
+    """
+    def __init__(self) -> None:
+        self.counts: Counter = Counter()
+
+    def update(self, y_true: Vector, y_pred: Vector) -> 'ClassificationMetricsAccumulator':
+        """ Add a chunk of actual and predicted classes """
+        labels, rows, cols, counts = _confusionCounts(y_true, y_pred)
+        labels = labels.tolist()
+        for actual, predicted, count in zip(rows.tolist(), cols.tolist(), counts.tolist()):
+            self.counts[labels[actual], labels[predicted]] += count
+        return self
+
+    def merge(self, other: 'ClassificationMetricsAccumulator') -> 'ClassificationMetricsAccumulator':
+        """ Add the results of another accumulator """
+        self.counts.update(other.counts)
+        return self
+
+    def confusion_matrix(self) -> 'pd.DataFrame':
+        """ Returns the confusion matrix with actual classes as rows and predicted classes as columns """
+        import pandas as pd  # noqa: PLC0415
+        labels = sorted({label for pair in self.counts for label in pair})
+        index = {label: i for i, label in enumerate(labels)}
+        cm = np.zeros((len(labels), len(labels)), dtype=np.int64)
+        for (actual, predicted), count in self.counts.items():
+            cm[index[actual], index[predicted]] = count
+        return pd.DataFrame(cm, index=labels, columns=labels)
+
+    def metrics(self) -> Dict[str, Any]:
+        """ Returns a dictionary with the number of records, the accuracy, and the confusion matrix """
+        n = sum(self.counts.values())
+        if n == 0:
+            raise ValueError('No data accumulated')
+        correct = sum(count for (actual, predicted), count in self.counts.items() if actual == predicted)
+        return {'n': n, 'accuracy': correct / n, 'confusion_matrix': self.confusion_matrix()}
+
+    def summary(self, class_names: Optional[List[str]] = None) -> Dict[str, Any]:
+        """ Print the confusion matrix like classificationSummary and return the metrics """
+        metrics = self.metrics()
+        _printConfusionMatrix(metrics['confusion_matrix'].to_numpy(), metrics['accuracy'], class_names)
+        return metrics
@@ -0,0 +1,41 @@
+'''
+Utility functions for "Data Mining for Business Analytics: Concepts, Techniques, and
+Applications in Python"
+
+(c) 2019-2023 Galit Shmueli, Peter C. Bruce, Peter Gedeck
+'''
+import os
+from concurrent.futures import Executor
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+
+def n_workers(n_jobs: Optional[int]) -> int:
+    """ Number of workers for n_jobs
+
+    None means a single worker; negative values count back from the number of processors, so that
+    -1 uses all processors and -2 all but one.
+    """
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        return max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+    return max(1, n_jobs)
+
+
+@contextmanager
+def worker_executor(n_jobs: Optional[int], executor: Optional[Executor],
+                    pool: Callable[..., Executor]) -> Iterator[Optional[Executor]]:
+    """ Yields the executor for n_jobs or executor; None means serial evaluation
+
+    A user supplied executor is used as is and not shut down. Otherwise, a pool with n_workers(n_jobs)
+    workers is created using pool, e.g. ThreadPoolExecutor or ProcessPoolExecutor, and shut down on exit.
+    """
+    if executor is not None:
+        yield executor
+        return
+    if n_workers(n_jobs) == 1:
+        yield None
+        return
+    with pool(max_workers=n_workers(n_jobs)) as workers:
+        yield workers
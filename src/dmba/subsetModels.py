@@ -0,0 +1,425 @@
+'''
+Utility functions for "Data Mining for Business Analytics: Concepts, Techniques, and
+Applications in Python"
+
+(c) 2019-2023 Galit Shmueli, Peter C. Bruce, Peter Gedeck
+'''
+import copy
+import shutil
+import tempfile
+import weakref
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import lru_cache, partial
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .metric import information_criteria
+
+Matrix = Any
+Vector = Any
+
+SCORES = ('AIC', 'BIC', 'adjusted_r2')
+# sums of squared errors below this fraction of the total sum of squares are rounding errors of the
+# normal equations; flooring them keeps AIC and BIC finite for outcomes that are exact linear combinations
+SSE_TOLERANCE = 1e-12
+# row samples of CrossValidatedSubsetModel.score_subsets have at least this many rows per fold on average
+MIN_FOLD_ROWS = 20
+
+
+class LinearSubsetFit:
+    """ Linear regression model fitted by LinearSubsetModel on a subset of the variables
+
+    The attributes coef_ and intercept_ follow the scikit-learn conventions, so that the model
+    can be used with the functions in dmba.metric.
+    """
+    def __init__(self, variables: List[str], coef: np.ndarray, intercept: float, sse: float) -> None:
+        self.variables = list(variables)
+        self.coef_ = coef
+        self.intercept_ = intercept
+        self.sse = sse
+
+    def predict(self, X: Matrix) -> np.ndarray:
+        """ Predict the outcome; X is either a data frame or a matrix with the columns in the order of variables """
+        if hasattr(X, 'columns'):
+            X = X[self.variables]
+        return np.asarray(X, dtype=float) @ self.coef_ + self.intercept_
+
+    def __repr__(self) -> str:
+        return f'LinearSubsetFit(variables={self.variables})'
+
+
+class LinearSubsetModel:
+    """ Linear regression backend for the variable selection functions in dmba.featureSelection
+
+    The centered Gram matrix X'X and X'y are computed once. Models for subsets of the variables are
+    then derived from these matrices without revisiting the data. Instances are used in place of
+    train_model; without a score_model, subsets are scored using the criterion given by score.
+    In stepwise selection, the candidates of a step are scored using updates of the Cholesky
+    factorization of the current model at O(p^2) cost each, independent of the number of rows.
+
+    Input:
+        X: data frame or matrix with the predictors
+        y: outcome
+        score (optional): selection criterion, one of 'AIC' (default), 'BIC', or 'adjusted_r2'
+        feature_names (optional): variable names if X is not a data frame
+    """
+    def __init__(self, X: Matrix, y: Vector, *, score: str = 'AIC',
+                 feature_names: Optional[Sequence[str]] = None) -> None:
+        if score not in SCORES:
+            raise ValueError(f'score must be one of {", ".join(SCORES)}')
+        if feature_names is None:
+            feature_names = list(X.columns) if hasattr(X, 'columns') else [f'x{i}' for i in range(X.shape[1])]
+        self.feature_names = [str(name) for name in feature_names]
+        self.score_name = score
+
+        X = np.asarray(X, dtype=float)
+        y = np.asarray(y, dtype=float).ravel()
+        if X.ndim != 2 or X.shape[1] != len(self.feature_names):
+            raise ValueError('X must be a matrix with one column per variable')
+        if X.shape[0] != len(y):
+            raise ValueError('X and y must have the same number of rows')
+        self.n_samples = len(y)
+        self._x_mean = X.mean(axis=0)
+        self._y_mean = float(y.mean())
+        Xc = X - self._x_mean
+        yc = y - self._y_mean
+        self.gram = Xc.T @ Xc
+        self.xy = Xc.T @ yc
+        self.yy = float(yc @ yc)
+        self._min_sse = max(SSE_TOLERANCE * self.yy, np.finfo(float).tiny)
+        self._index = {name: i for i, name in enumerate(self.feature_names)}
+
+    def __call__(self, variables: List[str]) -> LinearSubsetFit:
+        """ Returns the linear regression model for the subset of variables (train_model interface) """
+        idx = self._indices(variables)
+        coef, sse = self._solve(idx)
+        intercept = self._y_mean - float(self._x_mean[idx] @ coef)
+        return LinearSubsetFit(variables, coef, intercept, sse)
+
+    def score(self, model: LinearSubsetFit, variables: List[str]) -> float:
+        """ Returns the score of a model; better models have lower scores (score_model interface) """
+        return self.criterion(model.sse, len(variables))
+
+    def criterion(self, sse: float, nvariables: int) -> float:
+        """ Selection criterion for a model with nvariables predictors and the given sum of squared errors
+
+        The values agree with AIC_score, BIC_score, and the negative adjusted_r2_score.
+        """
+        n = self.n_samples
+        if self.score_name == 'adjusted_r2':
+            if nvariables >= n - 1:
+                return 0
+            if self.yy == 0:
+                # constant outcome; same convention as sklearn.metrics.r2_score for perfect predictions
+                return -1
+            return (sse / self.yy) * (n - 1) / (n - nvariables - 1) - 1
+        # the degrees of freedom include the intercept
+        return information_criteria(sse=sse, n=n, df=nvariables + 1)[self.score_name]
+
+    def sse(self, variables: List[str]) -> float:
+        """ Sum of squared errors of the linear regression model for the subset of variables """
+        return self._solve(self._indices(variables))[1]
+
+    def score_step(self, variables: List[str], add: List[str],
+                   remove: List[str]) -> Tuple[List[float], List[float]]:
+        """ Scores of the models that add or remove a single variable from the current variables
+
+        Input:
+            variables: variables of the current model
+            add: score the models variables + [v] for each v in add
+            remove: score the models variables - [v] for each v in remove
+
+        Returns:
+            (scores of the added variables, scores of the removed variables)
+        """
+        idx = self._indices(variables)
+        addIdx = self._indices(add)
+        k = len(idx)
+        try:
+            addSSE, removeSSE = self._step_sse(idx, addIdx, self._indices(remove))
+        except np.linalg.LinAlgError:
+            # the current model is rank deficient; fall back to solving each candidate
+            addSSE = np.array([self._solve(np.append(idx, i))[1] for i in addIdx])
+            removeSSE = np.array([self._solve(idx[idx != self._index[v]])[1] for v in remove])
+        return ([self.criterion(sse, k + 1) for sse in addSSE],
+                [self.criterion(sse, k - 1) for sse in removeSSE])
+
+    def best_subsets(self, variables: List[str]) -> List[List[str]]:
+        """ Best subset of variables for each number of variables using leaps and bounds
+
+        Subsets are enumerated as a tree where each child removes one more variable. As the sum of
+        squared errors of a subset is never smaller than that of a superset, a subtree is pruned if
+        its root is already worse than the best subsets found for all the sizes within the subtree.
+        For each size, the best model is identical to the one found by an exhaustive search;
+        ties are broken in favor of the first combination in the order of variables.
+
+        Returns:
+            List of best subsets for increasing number of variables
+        """
+        if not variables:
+            return []
+        positions = self._indices(variables)
+        nvariables = len(variables)
+        # order the variables by decreasing importance in the full model; the least important
+        # variables are removed first, which finds good subsets early and increases pruning
+        coef, _ = self._solve(positions)
+        importance = coef ** 2 * np.diag(self.gram)[positions]
+        order = tuple(sorted(range(nvariables), key=lambda i: (-importance[i], i)))
+
+        best: Dict[int, Tuple[float, Tuple[int, ...]]] = {}
+
+        def update(subset: Tuple[int, ...], sse: float) -> None:
+            key = (sse, tuple(sorted(subset)))
+            if len(subset) not in best or key < best[len(subset)]:
+                best[len(subset)] = key
+
+        def subsetSSE(subset: Tuple[int, ...]) -> float:
+            return self._solve(positions[list(subset)])[1]
+
+        def visit(subset: Tuple[int, ...], start: int) -> None:
+            # remove the least important variables first
+            for i in reversed(range(start, len(subset))):
+                child = subset[:i] + subset[i + 1:]
+                if not child:
+                    continue
+                childSSE = subsetSSE(child)
+                update(child, childSSE)
+                # descendants remove variables after position i; their sizes are i, ..., len(child) - 1
+                sizes = range(max(i, 1), len(child))
+                if any(size not in best or childSSE <= best[size][0] for size in sizes):
+                    visit(child, i)
+
+        update(order, subsetSSE(order))
+        visit(order, 0)
+        return [[variables[i] for i in best[size][1]] for size in range(1, nvariables + 1)]
+
+    def _indices(self, variables: List[str]) -> np.ndarray:
+        try:
+            return np.array([self._index[v] for v in variables], dtype=int)
+        except KeyError as e:
+            raise ValueError(f'Unknown variable {e}') from None
+
+    def _step_sse(self, idx: np.ndarray, addIdx: np.ndarray, removeIdx: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """ Sum of squared errors after adding or removing single variables using the Cholesky factor L of X_S'X_S
+
+        Adding v: with r = L^-1 X_S'x_v and z = L^-1 X_S'y, the SSE decreases by
+        (x_v'y - r'z)^2 / (x_v'x_v - r'r). Removing variable j increases the SSE by coef_j^2 / (X_S'X_S)^-1_jj.
+        """
+        from scipy.linalg import cho_solve, cholesky, solve_triangular  # noqa: PLC0415
+        if len(idx) == 0:
+            diag = np.diag(self.gram)[addIdx]
+            gain = np.divide(self.xy[addIdx] ** 2, diag, out=np.zeros(len(addIdx)), where=diag > 0)
+            return np.maximum(self.yy - gain, self._min_sse), np.zeros(0)
+        factor = cholesky(self.gram[np.ix_(idx, idx)], lower=True)
+        z = solve_triangular(factor, self.xy[idx], lower=True)
+        sse = self.yy - float(z @ z)
+
+        r = solve_triangular(factor, self.gram[np.ix_(idx, addIdx)], lower=True)
+        denominator = np.diag(self.gram)[addIdx] - np.sum(r ** 2, axis=0)
+        numerator = self.xy[addIdx] - r.T @ z
+        # variables that are collinear with the current model don't reduce the SSE
+        collinear = denominator <= 1e-12 * np.diag(self.gram)[addIdx]
+        gain = np.divide(numerator ** 2, denominator, out=np.zeros(len(addIdx)), where=~collinear)
+        addSSE = np.maximum(sse - gain, self._min_sse)
+
+        positions = [int(np.flatnonzero(idx == i)[0]) for i in removeIdx]
+        if not positions:
+            return addSSE, np.zeros(0)
+        coef = cho_solve((factor, True), self.xy[idx])
+        inverseDiag = np.diag(cho_solve((factor, True), np.eye(len(idx))))
+        removeSSE = np.maximum(sse + coef[positions] ** 2 / inverseDiag[positions], self._min_sse)
+        return addSSE, removeSSE
+
+    def _solve(self, idx: np.ndarray) -> Tuple[np.ndarray, float]:
+        """ Regression coefficients and sum of squared errors for the variables with the given indices """
+        if len(idx) == 0:
+            return np.zeros(0), max(self.yy, self._min_sse)
+        xy = self.xy[idx]
+        coef = np.linalg.lstsq(self.gram[np.ix_(idx, idx)], xy, rcond=None)[0]
+        return coef, max(self.yy - float(xy @ coef), self._min_sse)
+
+
+class CrossValidatedSubsetModel:
+    """ Cross-validation backend for the variable selection functions in dmba.featureSelection
+
+    The folds are determined once and every subset is scored on the same folds. Instances are used
+    in place of train_model; with score_model='cv' or unset, the candidates of a selection step are
+    scored by fitting a clone of the estimator on each training fold. The fits of all candidates
+    and folds of a step are evaluated in parallel if the selection function uses n_jobs or an
+    executor. For a ProcessPoolExecutor, the data are written once to a temporary directory and
+    memory-mapped by the worker processes instead of being sent with each task.
+
+    Input:
+        estimator: scikit-learn estimator, e.g. LinearRegression() or DecisionTreeClassifier()
+        X: data frame or matrix with the predictors
+        y: outcome
+        cv (optional): number of folds (default 5) or a scikit-learn splitter, e.g. StratifiedKFold(5)
+            or TimeSeriesSplit(5); the test sets of the splits must not overlap
+        scoring (optional): scikit-learn scoring, e.g. 'neg_mean_squared_error'; default is the score
+            method of the estimator. The selection minimizes the negative mean score over the folds.
+        random_state (optional): seed used to shuffle the rows if cv is a number of folds and to
+            draw the row samples used by score_subsets(..., nrows=)
+        feature_names (optional): variable names if X is not a data frame
+    """
+    def __init__(self, estimator: Any, X: Matrix, y: Vector, *, cv: Any = 5, scoring: Any = None,
+                 random_state: Optional[int] = 0, feature_names: Optional[Sequence[str]] = None) -> None:
+        from sklearn.model_selection import KFold  # noqa: PLC0415
+        if feature_names is None:
+            feature_names = list(X.columns) if hasattr(X, 'columns') else [f'x{i}' for i in range(X.shape[1])]
+        self.feature_names = [str(name) for name in feature_names]
+        self.estimator = estimator
+        self.scoring = scoring
+        self._frame = hasattr(X, 'columns')
+        self._X = np.asarray(X, dtype=float)
+        self._y = np.asarray(y).ravel()
+        if self._X.ndim != 2 or self._X.shape[1] != len(self.feature_names):
+            raise ValueError('X must be a matrix with one column per variable')
+        if self._X.shape[0] != len(self._y):
+            raise ValueError('X and y must have the same number of rows')
+        self._index = {name: i for i, name in enumerate(self.feature_names)}
+
+        if isinstance(cv, int):
+            cv = KFold(n_splits=cv, shuffle=random_state is not None, random_state=random_state)
+        # a fold number per row instead of index arrays per fold keeps the folds small for many rows
+        self._fold = np.full(len(self._y), -1, dtype=np.int32)
+        trainSets = []
+        complement = True
+        for k, (train, test) in enumerate(cv.split(self._X, self._y)):
+            if np.any(self._fold[test] >= 0):
+                raise ValueError('The test sets of the cross-validation splits must not overlap')
+            self._fold[test] = k
+            trainSets.append(train)
+            complement = complement and len(train) + len(test) == len(self._y)
+        self.n_splits = int(self._fold.max()) + 1
+        # splits that don't train on all other rows, e.g. TimeSeriesSplit, need a training mask per split
+        self._trainMask: Optional[np.ndarray] = None
+        if not complement:
+            self._trainMask = np.zeros((self.n_splits, len(self._y)), dtype=bool)
+            for k, train in enumerate(trainSets):
+                self._trainMask[k, train] = True
+        self.n_samples = len(self._y)
+        # smallest sample used by score_subsets(..., nrows=)
+        self.min_sample_rows = MIN_FOLD_ROWS * self.n_splits
+        # rows with a random key below a threshold form a sample; samples of increasing size are nested
+        self._key = np.random.default_rng(random_state).integers(0, 2 ** 32, size=self.n_samples, dtype=np.uint32)
+        # data files of the copy that is sent to worker processes, see _shared_for_workers
+        self._shared: Optional[Dict[str, str]] = None
+        self._workerCopy: Optional[CrossValidatedSubsetModel] = None
+
+    def __call__(self, variables: List[str]) -> Any:
+        """ Returns the estimator fitted on all rows for the subset of variables (train_model interface) """
+        return self._fit(self._indices(variables), slice(None), frame=self._frame)
+
+    def score(self, _model: Any, variables: List[str]) -> float:
+        """ Returns the cross-validated score of the variables; better models have lower scores (score_model interface) """
+        return self.score_subsets([variables])[0]
+
+    def score_subsets(self, subsets: List[List[str]], executor: Optional[Executor] = None, *,
+                      nrows: Optional[int] = None) -> List[float]:
+        """ Cross-validated scores of the subsets; the folds of all subsets are evaluated using the executor
+
+        Input:
+            subsets: list of variable subsets
+            executor (optional): concurrent.futures executor used to fit the folds
+            nrows (optional): score the subsets on a random sample of about nrows rows, at least
+                min_sample_rows; all subsets use the same sample and smaller samples are contained in larger ones
+        """
+        threshold = None
+        if nrows is not None:
+            nrows = max(nrows, self.min_sample_rows)
+        if nrows is not None and nrows < self.n_samples:
+            threshold = int(2 ** 32 * nrows / self.n_samples)
+        tasks = [(tuple(self._indices(subset)), k, threshold) for subset in subsets for k in range(self.n_splits)]
+        if executor is None:
+            foldScores = [self._scoreFold(task) for task in tasks]
+        elif isinstance(executor, ThreadPoolExecutor):
+            foldScores = list(executor.map(self._scoreFold, tasks))
+        else:
+            foldScores = list(executor.map(partial(_scoreFold, self._shared_for_workers()), tasks))
+        scores = np.array(foldScores, dtype=float).reshape(len(subsets), self.n_splits)
+        return [-float(score) for score in scores.mean(axis=1)]
+
+    def _scoreFold(self, task: Tuple[Tuple[int, ...], int, Optional[int]]) -> float:
+        from sklearn.metrics import check_scoring  # noqa: PLC0415
+        columns, k, threshold = task
+        idx = np.array(columns, dtype=int)
+        train = self._fold != k if self._trainMask is None else np.array(self._trainMask[k])
+        test = self._fold == k
+        if threshold is not None:
+            sample = self._key < threshold
+            # the sample contains MIN_FOLD_ROWS rows of the fold on average; use the full fold if a split is empty
+            if np.any(train & sample) and np.any(test & sample):
+                train &= sample
+                test &= sample
+        model = self._fit(idx, train)
+        return float(check_scoring(model, scoring=self.scoring)(model, self._design(idx, test), self._y[test]))
+
+    def _fit(self, idx: np.ndarray, rows: Any, *, frame: bool = False) -> Any:
+        """ Fit a clone of the estimator on the rows; models without variables predict the mean or majority class """
+        from sklearn.base import clone, is_classifier  # noqa: PLC0415
+        from sklearn.dummy import DummyClassifier, DummyRegressor  # noqa: PLC0415
+        if len(idx) == 0:
+            estimator = DummyClassifier(strategy='prior') if is_classifier(self.estimator) else DummyRegressor()
+        else:
+            estimator = clone(self.estimator)
+        return estimator.fit(self._design(idx, rows, frame=frame), self._y[rows])
+
+    def _design(self, idx: np.ndarray, rows: Any, *, frame: bool = False) -> Any:
+        """ Predictors of the variables with indices idx for the selected rows; the folds use matrices """
+        if len(idx) == 0:
+            return np.zeros((len(self._y[rows]), 1))
+        X = self._X[rows][:, idx] if isinstance(rows, slice) else self._X[np.ix_(rows, idx)]
+        if not frame:
+            return X
+        import pandas as pd  # noqa: PLC0415
+        return pd.DataFrame(X, columns=[self.feature_names[i] for i in idx])
+
+    def _indices(self, variables: List[str]) -> np.ndarray:
+        try:
+            return np.array([self._index[v] for v in variables], dtype=int)
+        except KeyError as e:
+            raise ValueError(f'Unknown variable {e}') from None
+
+    def _shared_for_workers(self) -> 'CrossValidatedSubsetModel':
+        """ Copy of the model that is pickled without its data for worker processes
+
+        The data are written once to a temporary directory, which is removed together with this
+        model; the workers memory-map the files. Pickles of the model itself contain the data.
+        """
+        if self._workerCopy is None:
+            directory = tempfile.mkdtemp(prefix='dmba-cv-')
+            weakref.finalize(self, shutil.rmtree, directory, ignore_errors=True)
+            shared = {}
+            # object arrays, e.g. string class labels from a data frame, cannot be memory-mapped
+            arrays = {name: getattr(self, name) for name in ('_X', '_y', '_fold', '_key', '_trainMask')}
+            for name in (name for name, array in arrays.items() if array is not None and array.dtype != object):
+                shared[name] = str(Path(directory) / f'{name[1:]}.npy')
+                np.save(shared[name], getattr(self, name), allow_pickle=False)
+            workerCopy = copy.copy(self)
+            workerCopy._shared = shared
+            self._workerCopy = workerCopy
+        return self._workerCopy
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state['_workerCopy'] = None
+        for name in self._shared or {}:
+            state[name] = None
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        for name, path in (self._shared or {}).items():
+            setattr(self, name, _loadShared(path))
+
+
+def _scoreFold(model: CrossValidatedSubsetModel, task: Tuple[Tuple[int, ...], int, Optional[int]]) -> float:
+    return model._scoreFold(task)
+
+
+@lru_cache(maxsize=16)
+def _loadShared(path: str) -> np.ndarray:
+    """ Memory-map the data once per worker process """
+    return np.load(path, mmap_mode='r')
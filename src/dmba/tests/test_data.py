@@ -4,13 +4,19 @@ Applications in Python"
 
 (c) 2019-2023 Galit Shmueli, Peter C. Bruce, Peter Gedeck
 '''
+import os
+import shutil
 import unittest
 from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, Dict, List
+from unittest.mock import patch
 
 import pandas as pd
 import pytest
 
 import dmba
+from dmba import data as dmbaData
 from dmba.data import DATA_DIR
 
 
@@ -45,3 +51,114 @@ class TestData(unittest.TestCase):
         assert dmba.get_data_file('AutoAndElectronics.zip').exists()
         assert dmba.get_data_file('gdp.csv').exists()
         assert dmba.get_data_file('gdp.csv.gz').exists()
+
+    def test_cache(self) -> None:
+        with TemporaryDirectory() as cache_dir:
+            dmbaData.set_cache_dir(cache_dir)
+            try:
+                options: List[Dict[str, Any]] = [{}, {'nrows': 10}]
+                for name in ('FlightDelays', 'Fundraising', 'gdp', 'AustralianWines'):
+                    for kwargs in options:
+                        expected = pd.read_csv(dmba.get_data_file(name), **kwargs)
+                        for _ in range(2):
+                            data = dmba.load_data(name, **kwargs)
+                            if isinstance(data, pd.Series):
+                                pd.testing.assert_series_equal(data, expected[expected.columns[0]])
+                            else:
+                                pd.testing.assert_frame_equal(data, expected)
+                assert len(list(Path(cache_dir).glob('*.dmbacache'))) == 8
+
+                # modifications of the returned data are not written back to the cache
+                data = dmba.load_data('Fundraising')
+                data.loc[0, 'TARGET_B'] = 99
+                assert dmba.load_data('Fundraising').loc[0, 'TARGET_B'] != 99
+
+                # keyword arguments that cannot be represented in the key are not cached
+                dmba.load_data('gdp', converters={'Country Code': str.lower})
+                assert len(list(Path(cache_dir).glob('*.dmbacache'))) == 8
+
+                dmbaData.clear_cache()
+                assert not list(Path(cache_dir).glob('*.dmbacache'))
+            finally:
+                dmbaData.set_cache_dir(None)
+
+    def test_cache_validation(self) -> None:
+        with TemporaryDirectory() as data_dir, TemporaryDirectory() as cache_dir, \
+                patch.object(dmbaData, 'DATA_DIR', Path(data_dir)):
+            dmbaData.set_cache_dir(cache_dir)
+            try:
+                source = Path(data_dir) / 'TinyData.csv.gz'
+                shutil.copy(DATA_DIR / 'TinyData.csv.gz', source)
+                expected: Any = dmba.load_data('TinyData')
+
+                # changed modification time, but identical content
+                os.utime(source, ns=(0, 0))
+                data: Any = dmba.load_data('TinyData')
+                pd.testing.assert_frame_equal(data, expected)
+
+                shutil.copy(DATA_DIR / 'gdp.csv.gz', source)
+                data = dmba.load_data('TinyData')
+                pd.testing.assert_frame_equal(data, pd.read_csv(source))
+            finally:
+                dmbaData.set_cache_dir(None)
+
+    def test_memory_cache(self) -> None:
+        dmbaData.clear_cache()
+        try:
+            first: Any = dmba.load_data('Fundraising')
+            second: Any = dmba.load_data('Fundraising')
+            info = dmbaData.cache_info()
+            assert (info.hits, info.misses, info.currsize) == (1, 1, 1)
+            assert 0 < info.nbytes <= info.maxbytes
+            assert first is not second
+            pd.testing.assert_frame_equal(first, second)
+
+            # modifications of the returned data are not visible to other callers
+            first.loc[0, 'TARGET_B'] = 99
+            assert dmba.load_data('Fundraising').loc[0, 'TARGET_B'] != 99
+
+            # different keyword arguments are cached separately
+            assert len(dmba.load_data('Fundraising', nrows=10)) == 10
+            assert dmbaData.cache_info().currsize == 2
+
+            # least recently used data frames are removed to stay within the limit
+            dmbaData.set_memory_cache_size(dmbaData.cache_info().nbytes - 1)
+            assert dmbaData.cache_info().currsize == 1
+            dmbaData.set_memory_cache_size(0)
+            assert dmbaData.cache_info().currsize == 0
+            dmba.load_data('Fundraising')
+            assert dmbaData.cache_info().currsize == 0
+        finally:
+            dmbaData.set_memory_cache_size(256 * 1024 ** 2)
+            dmbaData.clear_cache()
+
+    def test_load_data_iter(self) -> None:
+        expected = pd.read_csv(dmba.get_data_file('FlightDelays'))
+        chunks = list(dmba.load_data_iter('FlightDelays', chunksize=500))
+        assert [len(chunk) for chunk in chunks[:-1]] == [500] * (len(chunks) - 1)
+        pd.testing.assert_frame_equal(pd.concat(chunks), expected)
+
+        chunks = list(dmba.load_data_iter('FlightDelays', chunksize=1000, columns=['DISTANCE', 'Weather'],
+                                          dtypes={'DISTANCE': 'float32', 'Weather': 'int8'}))
+        data = pd.concat(chunks)
+        assert list(data.columns) == ['DISTANCE', 'Weather']
+        assert list(data.dtypes) == ['float32', 'int8']
+        assert (data['DISTANCE'].to_numpy() == expected['DISTANCE'].to_numpy()).all()
+
+        with pytest.raises(ValueError):
+            next(dmba.load_data_iter('unknown data file'))
+        with pytest.raises(ValueError):
+            next(dmba.load_data_iter('FlightDelays', chunksize=0))
+
+    def test_load_data_iter_zip(self) -> None:
+        chunks = list(dmba.load_data_iter('AutoAndElectronics.zip', chunksize=300))
+        assert [len(chunk) for chunk in chunks] == [300] * 6 + [200]
+        data = pd.concat(chunks, ignore_index=True)
+        assert list(data.columns) == ['member', 'text']
+        assert data['member'].str.startswith('AutoAndElectronics/rec.autos/').sum() == 1000
+        assert data['text'].str.contains('Subject:').all()
+
+        chunks = list(dmba.load_data_iter('AutoAndElectronics.zip', chunksize=1000, columns=['member']))
+        assert [list(chunk.columns) for chunk in chunks] == [['member'], ['member']]
+        with pytest.raises(ValueError):
+            next(dmba.load_data_iter('AutoAndElectronics.zip', columns=['category']))
@@ -4,13 +4,33 @@ Applications in Python"
 
 (c) 2019-2023 Galit Shmueli, Peter C. Bruce, Peter Gedeck
 '''
+import itertools
+import json
 import unittest
+import weakref
+from concurrent.futures import ProcessPoolExecutor
 from math import prod
+from pathlib import Path
+from tempfile import TemporaryDirectory
 from typing import Any, List
+from unittest.mock import patch
 
+import pytest
+
+from dmba import SubsetCache, featureSelection
 from dmba.featureSelection import Model, backward_elimination, exhaustive_search, forward_selection, stepwise_selection
 
 
+def _train_model(variables: List[str]) -> Any:
+    return f'Model-{"".join(variables)}'
+
+
+def _score_model(_model: Model, variables: List[str]) -> float:
+    # 'd' and 'e' have identical contributions to test deterministic tie breaking
+    maps = {'a': -4, 'b': -2, 'c': 3, 'd': -1, 'e': -1, 'f': 0}
+    return sum(maps[v] for v in variables) - 0.1 * prod(maps[v] for v in variables)
+
+
 class TestFeatureSelection(unittest.TestCase):
     def test_exhaustiveSearch(self) -> None:
         variables = ['a', 'b', 'c']
@@ -78,3 +98,204 @@ class TestFeatureSelection(unittest.TestCase):
         result = stepwise_selection(variables, train_model, score_model,
                                     direction='backward', verbose=False)
         assert result[1] == ['a', 'b']
+
+    def test_parallel_selection(self) -> None:
+        variables = ['a', 'b', 'c', 'd', 'e', 'f']
+        for selection in (forward_selection, backward_elimination, stepwise_selection):
+            expected: Any = selection(variables, _train_model, _score_model, verbose=False)
+            assert selection(variables, _train_model, _score_model, verbose=False, n_jobs=4) == expected
+            assert selection(variables, _train_model, _score_model, verbose=False, n_jobs=-1) == expected
+            with ProcessPoolExecutor(max_workers=2) as executor:
+                result: Any = selection(variables, _train_model, _score_model, verbose=False, executor=executor)
+            assert result == expected
+
+        for direction in ('forward', 'backward'):
+            expected = stepwise_selection(variables, _train_model, _score_model, direction=direction,
+                                          verbose=False)
+            result = stepwise_selection(variables, _train_model, _score_model, direction=direction,
+                                        verbose=False, n_jobs=3)
+            assert result == expected
+
+    def test_subset_cache(self) -> None:
+        variables = ['a', 'b', 'c', 'd', 'e', 'f']
+        trained: List[List[str]] = []
+
+        def train_model(variables: List[str]) -> Any:
+            trained.append(list(variables))
+            return _train_model(variables)
+
+        expected: Any = stepwise_selection(variables, _train_model, _score_model, verbose=False)
+        cache = SubsetCache()
+        result: Any = stepwise_selection(variables, train_model, _score_model, verbose=False, cache=cache)
+        assert result == expected
+        assert len({frozenset(v) for v in trained}) == len(trained)
+        info = cache.cache_info()
+        assert info.hits > 0
+        assert info.misses == len(trained)
+        assert info.currsize == len(cache) == len(trained)
+
+        # subsets evaluated by stepwise selection are not refitted
+        ntrained = len(trained)
+        result = forward_selection(variables, train_model, _score_model, cache=cache)
+        assert result == forward_selection(variables, _train_model, _score_model)
+        assert len(trained) == ntrained
+        result = exhaustive_search(variables, train_model, _score_model, cache=cache)
+        assert result == exhaustive_search(variables, _train_model, _score_model)
+        assert len({frozenset(v) for v in trained}) == len(trained)
+
+        # models are refitted if a cached subset is selected in a different order
+        cache = SubsetCache()
+        backward_elimination(['b', 'a', 'c'], train_model, _score_model, cache=cache)
+        result = backward_elimination(['a', 'b', 'c'], train_model, _score_model, cache=cache)
+        assert result == ('Model-ab', ['a', 'b'])
+
+        cache = SubsetCache(maxsize=2)
+        forward_selection(variables, _train_model, _score_model, cache=cache)
+        assert len(cache) == 2
+        cache.clear()
+        assert cache.cache_info() == (0, 0, 2, 0)
+
+    def test_checkpoint(self) -> None:
+        variables = ['a', 'b', 'c', 'd', 'e', 'f']
+        trained: List[List[str]] = []
+
+        class Preempted(Exception):
+            pass
+
+        def train_model(variables: List[str], limit: int = 10 ** 6) -> Any:
+            if len(trained) >= limit:
+                raise Preempted
+            trained.append(list(variables))
+            return _train_model(variables)
+
+        expected: Any = stepwise_selection(variables, train_model, _score_model, verbose=False)
+        ntrained = len(trained)
+        with TemporaryDirectory() as tempdir:
+            checkpoint = Path(tempdir) / 'stepwise.json'
+            trained.clear()
+            with pytest.raises(Preempted):
+                stepwise_selection(variables, lambda v: train_model(v, limit=15), _score_model, verbose=False,
+                                   checkpoint=checkpoint)
+            state = json.loads(checkpoint.read_text())['state']
+            assert not state['done']
+            assert len(state['scores']) > 0
+
+            trained.clear()
+            result: Any = stepwise_selection(variables, train_model, _score_model, verbose=False, checkpoint=checkpoint)
+            assert result == expected
+            assert len(trained) < ntrained - 10
+            assert json.loads(checkpoint.read_text())['state']['done']
+
+            # a completed run only refits the selected model
+            trained.clear()
+            assert stepwise_selection(variables, train_model, _score_model, verbose=False,
+                                      checkpoint=checkpoint) == expected
+            assert trained == [expected[1]]
+
+            with pytest.raises(ValueError):
+                stepwise_selection(variables, train_model, _score_model, direction='forward', checkpoint=checkpoint)
+
+        expected = exhaustive_search(variables, _train_model, _score_model)
+        with TemporaryDirectory() as tempdir, patch.object(featureSelection, 'CHECKPOINT_INTERVAL', 0), \
+                patch.object(featureSelection, 'COMBINATIONS_PER_TASK', 1):
+            checkpoint = Path(tempdir) / 'exhaustive.json'
+            trained.clear()
+            with pytest.raises(Preempted):
+                exhaustive_search(variables, lambda v: train_model(v, limit=30), _score_model, checkpoint=checkpoint)
+            state = json.loads(checkpoint.read_text())['state']
+            assert len(state['results']) == 2
+            assert state['position'] == 30 - 6 - 15
+
+            trained.clear()
+            assert exhaustive_search(variables, train_model, _score_model, checkpoint=checkpoint) == expected
+            # the remaining combinations and the best models found before the interruption are fitted
+            assert len(trained) == 2 ** len(variables) - 1 - 30 + 3
+
+            with pytest.raises(ValueError):
+                exhaustive_search(variables[:3], train_model, _score_model, checkpoint=checkpoint)
+
+    def test_checkpoint_models(self) -> None:
+        variables = [f'x{i}' for i in range(12)]
+        alive: List[Any] = []
+        maxAlive = [0]
+
+        class Fitted:
+            pass
+
+        def train_model(_variables: List[str]) -> Any:
+            model = Fitted()
+            alive.append(weakref.ref(model))
+            maxAlive[0] = max(maxAlive[0], sum(ref() is not None for ref in alive))
+            return model
+
+        def score_model(_model: Any, variables: List[str]) -> float:
+            # the first eight variables improve the model
+            return sum(int(v[1:]) - 8 for v in variables)
+
+        with TemporaryDirectory() as tempdir:
+            checkpoint = Path(tempdir) / 'stepwise.json'
+            progress = featureSelection._Checkpoint(checkpoint, 'stepwise_selection', variables, direction='both')
+            progress.save(variables=[], score=0, scores=[], done=False)
+
+            # resuming keeps the models of at most two steps, not of all evaluated subsets
+            result: Any = stepwise_selection(variables, train_model, score_model, verbose=False, checkpoint=checkpoint)
+            assert sorted(result[1]) == variables[:8]
+            assert maxAlive[0] <= 2 * (len(variables) + 1)
+
+    def test_exhaustive_search_top_k(self) -> None:
+        variables = ['a', 'b', 'c', 'd', 'e', 'f']
+        trained: List[List[str]] = []
+
+        def train_model(variables: List[str]) -> Any:
+            trained.append(list(variables))
+            return _train_model(variables)
+
+        result = exhaustive_search(variables, train_model, _score_model, top_k=3)
+        expected: List[List[str]] = []
+        for n in range(1, len(variables) + 1):
+            # stable sort keeps the first of subsets with equal scores
+            subsets = sorted(itertools.combinations(variables, n), key=lambda subset: _score_model(None, list(subset)))
+            expected.extend(list(subset) for subset in subsets[:3])
+        assert [r['variables'] for r in result] == expected
+        assert [r['n'] for r in result] == [1, 1, 1, 2, 2, 2, 3, 3, 3, 4, 4, 4, 5, 5, 5, 6]
+        assert all(r['model'] == _train_model(r['variables']) for r in result)
+        assert len(trained) == 2 ** len(variables) - 1
+        best = exhaustive_search(variables, _train_model, _score_model)
+        assert [r for r in result if r['variables'] in [b['variables'] for b in best]] == best
+
+        trained.clear()
+        assert exhaustive_search(variables, train_model, _score_model, top_k=3, models='refit') == result
+        assert len(trained) == 2 ** len(variables) - 1 + len(result)
+
+        result = exhaustive_search(variables, _train_model, _score_model, top_k=3, models='none')
+        assert [r['variables'] for r in result] == expected
+        assert all(r['model'] is None for r in result)
+
+        with pytest.raises(ValueError):
+            exhaustive_search(variables, _train_model, _score_model, top_k=0)
+        with pytest.raises(ValueError):
+            exhaustive_search(variables, _train_model, _score_model, models='all')
+
+    def test_exhaustive_search_parallel(self) -> None:
+        for n, k in ((6, 1), (6, 3), (9, 4), (12, 6), (5, 5)):
+            combinations = list(itertools.combinations(range(n), k))
+            assert [tuple(featureSelection._unrank_combination(rank, n, k))
+                    for rank in range(len(combinations))] == combinations
+            for start in (0, 7, len(combinations) - 1):
+                assert list(featureSelection._combination_range(n, k, start, 10)) == combinations[start:start + 10]
+
+        variables = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
+        expected = exhaustive_search(variables, _train_model, _score_model_g, top_k=2)
+        with patch.object(featureSelection, 'COMBINATIONS_PER_TASK', 7):
+            assert exhaustive_search(variables, _train_model, _score_model_g, top_k=2) == expected
+            assert exhaustive_search(variables, _train_model, _score_model_g, top_k=2, n_jobs=3) == expected
+            with ProcessPoolExecutor(max_workers=2) as executor:
+                result = exhaustive_search(variables, _train_model, _score_model_g, top_k=2, executor=executor)
+            assert result == expected
+            result = exhaustive_search(variables, _train_model, _score_model_g, top_k=2, models='refit', n_jobs=2)
+            assert result == expected
+
+
+def _score_model_g(model: Model, variables: List[str]) -> float:
+    # many ties between subsets test the deterministic merge of the ranges
+    return round(_score_model(model, [v for v in variables if v not in 'gh']))
@@ -4,17 +4,23 @@ Applications in Python"
 
 (c) 2019-2023 Galit Shmueli, Peter C. Bruce, Peter Gedeck
 '''
+import io
 import unittest
 from pathlib import Path
 from tempfile import TemporaryDirectory
+from typing import Any, Optional
+from unittest.mock import patch
 
+import numpy as np
 import pandas as pd
+import pytest
 from sklearn.datasets import load_iris
+from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.tree import DecisionTreeClassifier
 
-from dmba import gainsChart, liftChart, textDecisionTree
-from dmba.graphs import plotDecisionTree
+from dmba import gainsChart, graphs, liftChart, textDecisionTree
+from dmba.graphs import GainsSketch, _maxDepthForNodes, _nodeDepth, plotDecisionTree
 
 try:
     from IPython.display import Image
@@ -35,6 +41,76 @@ class TestGraphs(unittest.TestCase):
         ax = gainsChart(data)
         assert ax is not None
 
+    def test_liftChart_compute_only(self) -> None:
+        data = pd.Series([7] * 10 + [2.5] * 10 + [0.5] * 10 + [0.25] * 20 + [0.1] * 50)
+        lift = liftChart(data, compute_only=True)
+        assert list(lift.index) == [10, 20, 30, 40, 50, 60, 70, 80, 90, 100]
+        assert lift[10] == pytest.approx(7 / data.mean())
+        assert lift[50] == pytest.approx(0.25 / data.mean())
+
+        # fewer records than deciles
+        lift = liftChart(pd.Series([3, 2, 1]), compute_only=True)
+        assert list(lift.index) == [10, 40, 70]
+        assert list(lift) == pytest.approx([1.5, 1, 0.5])
+
+    def test_gainsChart_compute_only(self) -> None:
+        data = pd.Series([1, 1, 0, 1, 0, 0])
+        curve = gainsChart(data, compute_only=True)
+        assert list(curve['records']) == [0, 1, 2, 3, 4, 5, 6]
+        assert list(curve['cumGains']) == [0, 1, 2, 2, 3, 3, 3]
+
+        rng = np.random.default_rng(0)
+        gains = pd.Series(rng.random(100_000) < np.linspace(0.9, 0.1, 100_000)).astype(int)
+        curve = gainsChart(gains, resolution=100, compute_only=True)
+        assert len(curve) == 101
+        assert curve['records'].iloc[-1] == len(gains)
+        assert curve['cumGains'].iloc[-1] == gains.sum()
+        exact = np.concatenate([[0], np.cumsum(gains)])
+        interpolated = np.interp(np.arange(len(exact)), curve['records'], curve['cumGains'])
+        assert np.abs(interpolated - exact).max() <= len(gains) / 100
+
+        ax = gainsChart(gains, resolution=100)
+        assert len(ax.lines[0].get_xdata()) == 101
+
+    def test_unsorted_scores(self) -> None:
+        rng = np.random.default_rng(0)
+        scores = rng.random(1000)
+        actual = (rng.random(1000) < scores).astype(int)
+        order = np.argsort(-scores)
+        expected = liftChart(pd.Series(actual[order]), compute_only=True)
+        pd.testing.assert_series_equal(liftChart(actual, scores=scores, compute_only=True), expected)
+        for resolution in (10, None):
+            expected = gainsChart(actual[order], resolution=resolution, compute_only=True)
+            result = gainsChart(actual, scores=scores, resolution=resolution, compute_only=True)
+            pd.testing.assert_frame_equal(result, expected)
+        with pytest.raises(ValueError):
+            liftChart(actual, scores=scores[:10])
+
+    def test_gainsSketch(self) -> None:
+        rng = np.random.default_rng(0)
+        scores = rng.random(100_000)
+        actual = (rng.random(100_000) < scores).astype(int)
+        exact = gainsChart(actual, scores=scores, resolution=None, compute_only=True)
+
+        # sketches of parts of the data are merged
+        sketches = [GainsSketch(size=100), GainsSketch(size=100)]
+        for i, start in enumerate(range(0, len(scores), 5000)):
+            sketches[i % 2].update(scores[start:start + 5000], actual[start:start + 5000])
+        sketch = sketches[0].merge(sketches[1])
+        assert sketch.n == len(scores)
+        assert len(sketch._counts) <= 3 * sketch.size
+        assert sketch._counts.max() <= 2 * len(scores) / sketch.size
+
+        curve = gainsChart(sketch, resolution=None, compute_only=True)
+        assert list(curve['records']) == list(exact['records'])
+        assert curve['cumGains'].iloc[-1] == pytest.approx(actual.sum())
+        assert np.abs(curve['cumGains'] - exact['cumGains']).max() <= 2 * len(scores) / sketch.size
+
+        lift = liftChart(sketch, compute_only=True)
+        expected = liftChart(actual, scores=scores, compute_only=True)
+        assert np.abs(lift - expected).max() < 0.05
+        assert liftChart(sketch) is not None
+
     def test_textDecisionTree(self) -> None:
         iris = load_iris()
         X = iris.data
@@ -52,6 +128,24 @@ class TestGraphs(unittest.TestCase):
         assert 'node=3 leaf node' in representation
         assert 'node=4 leaf node' in representation
 
+    def test_textDecisionTree_ensemble(self) -> None:
+        iris = load_iris()
+        forest = RandomForestClassifier(n_estimators=3, max_leaf_nodes=5, random_state=0)
+        forest.fit(iris.data, iris.target)
+
+        representation = textDecisionTree(forest)
+        sections = representation.split('tree=')[1:]
+        assert len(sections) == 3
+        for i, (section, estimator) in enumerate(zip(sections, forest.estimators_)):
+            assert section == f'{i}\n{textDecisionTree(estimator)}' + ('\n' if i < 2 else '')
+        # leaf compositions are plain numbers
+        assert 'np.float64' not in representation
+
+        assert textDecisionTree(forest, n_jobs=2) == representation
+        stream = io.StringIO()
+        assert textDecisionTree(forest, file=stream) is None
+        assert stream.getvalue() == representation + '\n'
+
     def test_plotDecisionTree(self) -> None:
         iris = load_iris()
         X = iris.data
@@ -73,3 +167,52 @@ class TestGraphs(unittest.TestCase):
             representation = plotDecisionTree(estimator, pdfFile=pdfFile)
             assert pdfFile.exists()
             assert b'PDF' in pdfFile.read_bytes()
+
+            # repeated plots are served from the cache without running graphviz
+            pdfFile.unlink()
+            with patch('graphviz.Source.pipe', side_effect=AssertionError('graphviz called')):
+                plotDecisionTree(estimator, pdfFile=pdfFile)
+            assert b'PDF' in pdfFile.read_bytes()
+
+    def test_plotDecisionTree_cache(self) -> None:
+        iris = load_iris()
+        estimator = DecisionTreeClassifier(random_state=0).fit(iris.data, iris.target)
+        calls = []
+
+        # graphviz.Source.pipe with its signature, without running the dot executable
+        def pipe(source: Any, format: str, *, encoding: Optional[str] = None, **kwargs: Any) -> Any:  # noqa: A002
+            calls.append((format, kwargs))
+            return source.source if encoding else b'%PDF-' + format.encode()
+
+        with TemporaryDirectory() as tempdir, patch.dict(graphs._renderCache, clear=True), \
+                patch('graphviz.Source.pipe', autospec=True, side_effect=pipe):
+            pdfFile = Path(tempdir) / 'tree.pdf'
+            plotDecisionTree(estimator, pdfFile=pdfFile, max_nodes=7)
+            assert b'PDF' in pdfFile.read_bytes()
+            ncalls = len(calls)
+            assert ncalls > 0
+            if hasImage:
+                # the layout is computed once and rendered without a new layout for each format
+                assert calls[0][0] == 'dot'
+                assert all(kwargs == {'neato_no_op': 2} for _, kwargs in calls[1:])
+
+            # a repeated call is served from the cache; other options are rendered again
+            pdfFile.unlink()
+            plotDecisionTree(estimator, pdfFile=pdfFile, max_nodes=7)
+            assert pdfFile.exists()
+            assert len(calls) == ncalls
+            plotDecisionTree(estimator, pdfFile=pdfFile, max_nodes=3)
+            assert len(calls) == 2 * ncalls
+            assert len(graphs._renderCache) == 2
+
+    def test_maxDepthForNodes(self) -> None:
+        iris = load_iris()
+        estimator = DecisionTreeClassifier(random_state=0).fit(iris.data, iris.target)
+        depth = _nodeDepth(estimator.tree_.children_left, estimator.tree_.children_right)
+        assert _maxDepthForNodes(estimator.tree_, estimator.tree_.node_count) == depth.max()
+        for max_nodes in (1, 3, 7, 10):
+            max_depth = _maxDepthForNodes(estimator.tree_, max_nodes)
+            # nodes up to max_depth and the collapsed subtrees below them
+            shown = (depth <= max_depth + 1).sum()
+            assert shown <= max_nodes or max_depth == 0
+            assert (depth <= max_depth + 2).sum() > max_nodes
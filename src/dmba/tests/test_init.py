@@ -0,0 +1,63 @@
+'''
+Utility functions for "Data Mining for Business Analytics: Concepts, Techniques, and
+Applications in Python"
+
+(c) 2019-2023 Galit Shmueli, Peter C. Bruce, Peter Gedeck
+'''
+import json
+import os
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+
+import pytest
+
+import dmba
+
+HEAVY_MODULES = ('matplotlib', 'sklearn', 'scipy', 'graphviz', 'IPython')
+
+
+def _imported_modules(code: str, modules: tuple = HEAVY_MODULES) -> dict:
+    """ Run the code in a new interpreter and return the heavy modules it imported and its output """
+    script = (f'import sys\n{code}\n'
+              f'print(__import__("json").dumps([m for m in {modules!r} if m in sys.modules]))')
+    # make sure the interpreter imports this copy of dmba
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(Path(dmba.__file__).parents[1]),
+                                                       os.environ.get('PYTHONPATH', '')]))
+    result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True,  # noqa: S603
+                            check=True, env=env)
+    lines = result.stdout.strip().splitlines()
+    return {'modules': json.loads(lines[-1]), 'output': lines[:-1]}
+
+
+class TestInit(unittest.TestCase):
+    def test_import_is_lazy(self) -> None:
+        result = _imported_modules('import dmba')
+        assert result['modules'] == []
+        assert result['output'] == []
+
+        # the metrics don't require pandas, scikit-learn, scipy, or matplotlib
+        result = _imported_modules('import dmba\ndmba.regressionSummary([1, 2, 3], [1, 2, 4])\n'
+                                   'dmba.classificationSummary([0, 1, 1], [0, 1, 0])', (*HEAVY_MODULES, 'pandas'))
+        assert result['modules'] == []
+
+        result = _imported_modules('import dmba\ndmba.load_data("Amtrak")')
+        assert result['modules'] == []
+
+        # the selection functions only import scipy and scikit-learn when a model needs them
+        result = _imported_modules('import dmba\ndmba.exhaustive_search, dmba.stepwise_selection, dmba.SubsetCache\n'
+                                   'dmba.LinearSubsetModel, dmba.CrossValidatedSubsetModel')
+        assert result['modules'] == []
+
+    def test_lazy_attributes(self) -> None:
+        for name in dmba.__all__:
+            assert getattr(dmba, name) is not None
+            assert name in dir(dmba)
+        assert dmba.metric.regressionSummary is dmba.regressionSummary
+        for name in ('regression_metrics', 'RegressionMetricsAccumulator', 'ClassificationMetricsAccumulator',
+                     'sparse_confusion_matrix', 'top_confused_pairs', 'per_class_metrics'):
+            assert name in dmba.__all__
+            assert getattr(dmba, name) is getattr(dmba.metric, name)
+        with pytest.raises(AttributeError):
+            dmba.unknown_function  # noqa: B018
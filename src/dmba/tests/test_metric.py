@@ -4,15 +4,36 @@ Applications in Python"
 
 (c) 2019-2023 Galit Shmueli, Peter C. Bruce, Peter Gedeck
 '''
+import tracemalloc
 import unittest
 from collections import namedtuple
 from contextlib import redirect_stdout
 from io import StringIO
 
+import numpy as np
 import pytest
-from sklearn.metrics import r2_score
+from sklearn.metrics import confusion_matrix, precision_score, r2_score, recall_score
 
-from dmba import AIC_score, BIC_score, adjusted_r2_score, classificationSummary, regressionSummary
+from dmba import (
+    AIC_score,
+    AIC_scores,
+    BIC_score,
+    BIC_scores,
+    adjusted_r2_score,
+    adjusted_r2_scores,
+    classificationSummary,
+    information_criteria,
+    regressionSummary,
+)
+from dmba.metric import (
+    ClassificationMetricsAccumulator,
+    RegressionMetricsAccumulator,
+    _columnSSE,
+    per_class_metrics,
+    regression_metrics,
+    sparse_confusion_matrix,
+    top_confused_pairs,
+)
 
 MockModel = namedtuple('MockModel', 'coef_')  # noqa: PYI024
 
@@ -63,6 +84,59 @@ class TestMetric(unittest.TestCase):
 
         assert BIC_score(y_true, y_pred, df=3) > BIC_score(y_true, y_pred, df=2)
 
+    def test_information_criteria(self) -> None:
+        y_true = [1, 2, 3, 4, 5]
+        y_pred = [1, 3, 2, 5, 4]
+        criteria = information_criteria(y_true, y_pred, df=3)
+        assert criteria['sse'] == 4
+        assert criteria['AIC'] == pytest.approx(21.0736675)
+        assert criteria['BIC'] == pytest.approx(19.51141)
+        assert AIC_score(sse=4, n=5, df=3) == pytest.approx(21.0736675)
+        assert BIC_score(y_pred=y_pred, sse=4, df=3) == pytest.approx(19.51141)
+        with pytest.raises(ValueError):
+            AIC_score(sse=4, df=3)
+        with pytest.raises(ValueError):
+            AIC_score(y_pred=y_pred, df=3)
+
+        # float32 data are not converted to float64 and the errors are summed in chunks
+        rng = np.random.default_rng(0)
+        y_true32 = rng.normal(size=2_000_000).astype(np.float32)
+        y_pred32 = (y_true32 + rng.normal(size=2_000_000)).astype(np.float32)
+        expected = float(np.sum((y_true32.astype(float) - y_pred32.astype(float)) ** 2))
+        tracemalloc.start()
+        try:
+            sse = information_criteria(y_true32, y_pred32, df=2)['sse']
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        assert sse == pytest.approx(expected, rel=1e-6)
+        assert peak < 0.5 * y_true32.nbytes
+
+    def test_batch_scores(self) -> None:
+        rng = np.random.default_rng(0)
+        y_true = rng.normal(size=200)
+        y_pred = y_true[:, np.newaxis] + rng.normal(size=(200, 6)) * np.arange(1, 7)
+        df = np.arange(2, 8)
+
+        aic = AIC_scores(y_true, y_pred, df)
+        bic = BIC_scores(y_true, y_pred, df)
+        adjusted = adjusted_r2_scores(y_true, y_pred, df - 1)
+        for i in range(y_pred.shape[1]):
+            assert aic[i] == pytest.approx(AIC_score(y_true, y_pred[:, i], df=df[i]))
+            assert bic[i] == pytest.approx(BIC_score(y_true, y_pred[:, i], df=df[i]))
+            model = MockModel(coef_=[1] * (df[i] - 1))
+            assert adjusted[i] == pytest.approx(adjusted_r2_score(y_true, y_pred[:, i], model))
+
+        # one value for all models and chunked computation of the errors
+        assert AIC_scores(y_true, y_pred, 3) == pytest.approx([AIC_score(y_true, y_pred[:, i], df=3) for i in range(6)])
+        assert _columnSSE(y_true, y_pred, chunksize=7) == pytest.approx(((y_pred.T - y_true) ** 2).sum(axis=1))
+
+        # too many coefficients
+        small = np.column_stack([[1, 3, 2, 5, 4]] * 3)
+        assert list(adjusted_r2_scores([1, 2, 3, 4, 5], small, [1, 4, 5])) == pytest.approx([0.4666667, 0, 0])
+        with pytest.raises(ValueError):
+            AIC_scores([1, 2, 3, 4, 5], small[:3], 2)
+
     def test_regressionSummary(self) -> None:
         y_true = [1, 2, 3, 4, 5]
         y_pred = [1, 3, 2, 5, 4]
@@ -107,6 +181,30 @@ class TestMetric(unittest.TestCase):
         assert '(MPE) : -4.3333' in s
         assert '(MAPE) : 25.6667' in s
 
+    def test_regression_metrics(self) -> None:
+        y_true = [1, 2, 3, 4, 5]
+        y_pred = [1, 3, 2, 5, 4]
+        metrics = regression_metrics(y_true, y_pred)
+        assert metrics == pytest.approx({'ME': 0, 'RMSE': 0.894427, 'MAE': 0.8, 'MPE': -4.333333, 'MAPE': 25.666667})
+        assert regression_metrics(y_true, y_pred, sample_weight=[1] * 5) == pytest.approx(metrics)
+
+        # integer weights are equivalent to repeating records
+        weights = [1, 2, 0, 1, 3]
+        repeated = regression_metrics(np.repeat(y_true, weights), np.repeat(y_pred, weights))
+        assert regression_metrics(y_true, y_pred, sample_weight=weights) == pytest.approx(repeated)
+
+        metrics = regression_metrics([0, 1, 2, 3, 4], [0, 2, 1, 4, 3])
+        assert list(metrics) == ['ME', 'RMSE', 'MAE']
+
+        rng = np.random.default_rng(0)
+        y_true64 = rng.uniform(1, 10, size=10_000)
+        y_pred64 = y_true64 + rng.normal(size=10_000)
+        metrics = regression_metrics(y_true64.astype(np.float32), y_pred64.astype(np.float32))
+        assert metrics == pytest.approx(regression_metrics(y_true64, y_pred64), rel=1e-5)
+
+        with pytest.raises(ValueError):
+            regression_metrics(y_true, y_pred, sample_weight=[1, 2])
+
     def test_classificationSummary(self) -> None:
         y_true = [1, 0, 0, 1, 1, 1]
         y_pred = [1, 0, 1, 1, 0, 0]
@@ -125,3 +223,95 @@ class TestMetric(unittest.TestCase):
         assert lines[0] == 'Confusion Matrix (Accuracy 0.5000)'
         assert lines[3] == 'Actual a b'
         assert lines[4] == '     a 1 1'
+
+    def test_sparse_confusion_matrix(self) -> None:
+        rng = np.random.default_rng(0)
+        for nclasses in (5, 3000):
+            y_true = rng.integers(nclasses, size=20_000)
+            y_pred = np.where(rng.uniform(size=20_000) < 0.7, y_true, rng.integers(nclasses, size=20_000))
+            labels, cm = sparse_confusion_matrix(y_true, y_pred)
+            assert (labels == np.unique(np.concatenate([y_true, y_pred]))).all()
+            assert cm.nnz <= 20_000
+            assert (cm.toarray() == confusion_matrix(y_true, y_pred)).all()
+
+            metrics = per_class_metrics(y_true, y_pred)
+            assert metrics['precision'].to_numpy() == pytest.approx(
+                precision_score(y_true, y_pred, average=None, zero_division=0))
+            assert metrics['recall'].to_numpy() == pytest.approx(
+                recall_score(y_true, y_pred, average=None, zero_division=0))
+            assert metrics['support'].sum() == 20_000
+
+        actual = ['a', 'a', 'a', 'b', 'b', 'c', 'c', 'c']
+        predicted = ['b', 'b', 'a', 'a', 'c', 'a', 'a', 'b']
+        confused = top_confused_pairs(actual, predicted, top_k=3)
+        assert confused.to_numpy().tolist() == [['a', 'b', 2], ['c', 'a', 2], ['b', 'a', 1]]
+
+        out = StringIO()
+        with redirect_stdout(out):
+            classificationSummary(actual, predicted, top_k=2)
+        lines = out.getvalue().split('\n')
+        assert lines[0] == 'Confusion Matrix (Accuracy 0.1250, 3 classes)'
+        assert lines[2] == 'Most confused pairs of classes'
+        assert lines[4].split() == ['actual', 'predicted', 'count']
+        assert lines[5].split() == ['a', 'b', '2']
+        assert lines[7] == ''
+
+        # the confusion matrix is printed unless the pairs are requested
+        out = StringIO()
+        with redirect_stdout(out):
+            classificationSummary(actual, predicted)
+        assert out.getvalue().startswith('Confusion Matrix (Accuracy 0.1250)\n')
+        out = StringIO()
+        with redirect_stdout(out):
+            classificationSummary(actual, predicted, max_classes=2)
+        assert out.getvalue().split('\n')[5].split() == ['a', 'b', '2']
+
+    def test_RegressionMetricsAccumulator(self) -> None:
+        rng = np.random.default_rng(0)
+        y_true = rng.uniform(1, 10, size=1000)
+        y_pred = y_true + rng.normal(size=1000)
+
+        out = StringIO()
+        with redirect_stdout(out):
+            regressionSummary(y_true, y_pred)
+        expected = out.getvalue()
+
+        acc = RegressionMetricsAccumulator()
+        for start in range(0, 600, 100):
+            acc.update(y_true[start:start + 100], y_pred[start:start + 100])
+        other = RegressionMetricsAccumulator().update(y_true[600:], y_pred[600:])
+        acc.merge(other)
+        out = StringIO()
+        with redirect_stdout(out):
+            metrics = acc.summary()
+        assert out.getvalue() == expected
+        assert list(metrics) == ['ME', 'RMSE', 'MAE', 'MPE', 'MAPE']
+        assert metrics['MAE'] == pytest.approx(np.mean(np.abs(y_true - y_pred)))
+
+        acc.update([0, 1], [1, 1])
+        assert list(acc.metrics()) == ['ME', 'RMSE', 'MAE']
+
+        with pytest.raises(ValueError):
+            RegressionMetricsAccumulator().metrics()
+
+    def test_ClassificationMetricsAccumulator(self) -> None:
+        y_true = [1, 0, 0, 1, 1, 1]
+        y_pred = [1, 0, 1, 1, 0, 0]
+
+        out = StringIO()
+        with redirect_stdout(out):
+            classificationSummary(y_true, y_pred, class_names=['a', 'b'])
+        expected = out.getvalue()
+
+        acc = ClassificationMetricsAccumulator().update(y_true[:3], y_pred[:3])
+        acc.merge(ClassificationMetricsAccumulator().update(y_true[3:], y_pred[3:]))
+        out = StringIO()
+        with redirect_stdout(out):
+            metrics = acc.summary(class_names=['a', 'b'])
+        assert out.getvalue() == expected
+        assert metrics['n'] == 6
+        assert metrics['accuracy'] == pytest.approx(0.5)
+        assert metrics['confusion_matrix'].loc[1, 0] == 2
+
+        acc = ClassificationMetricsAccumulator().update(['x', 'y'], ['y', 'y']).update(['z'], ['x'])
+        assert list(acc.confusion_matrix().columns) == ['x', 'y', 'z']
@@ -0,0 +1,37 @@
+'''
+Utility functions for "Data Mining for Business Analytics: Concepts, Techniques, and
+Applications in Python"
+
+(c) 2019-2023 Galit Shmueli, Peter C. Bruce, Peter Gedeck
+'''
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from dmba.parallel import n_workers, worker_executor
+
+
+class TestParallel(unittest.TestCase):
+    def test_n_workers(self) -> None:
+        with patch('os.cpu_count', return_value=8):
+            assert n_workers(None) == 1
+            assert n_workers(1) == 1
+            assert n_workers(3) == 3
+            assert n_workers(-1) == 8
+            assert n_workers(-2) == 7
+            assert n_workers(-20) == 1
+        with patch('os.cpu_count', return_value=None):
+            assert n_workers(-1) == 1
+
+    def test_worker_executor(self) -> None:
+        with worker_executor(None, None, ThreadPoolExecutor) as pool:
+            assert pool is None
+        with worker_executor(2, None, ThreadPoolExecutor) as pool:
+            assert isinstance(pool, ThreadPoolExecutor)
+            assert list(pool.map(abs, [-1, 2])) == [1, 2]
+
+        # a user supplied executor is not shut down
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            with worker_executor(4, executor, ThreadPoolExecutor) as pool:
+                assert pool is executor
+            assert executor.submit(abs, -3).result() == 3
@@ -0,0 +1,357 @@
+'''
+Utility functions for "Data Mining for Business Analytics: Concepts, Techniques, and
+Applications in Python"
+
+(c) 2019-2023 Galit Shmueli, Peter C. Bruce, Peter Gedeck
+'''
+import copy
+import gc
+import json
+import math
+import pickle
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LinearRegression, LogisticRegression
+from sklearn.model_selection import KFold, ShuffleSplit, TimeSeriesSplit, cross_val_score
+
+from dmba import AIC_score, BIC_score, CrossValidatedSubsetModel, LinearSubsetModel, adjusted_r2_score
+from dmba.featureSelection import (
+    SubsetCache,
+    _halving_survivors,
+    backward_elimination,
+    exhaustive_search,
+    forward_selection,
+    stepwise_selection,
+)
+from dmba.subsetModels import SCORES
+
+
+def _example_data(nvariables: int = 6, nrows: int = 200) -> Tuple[pd.DataFrame, np.ndarray]:
+    rng = np.random.default_rng(123)
+    X = pd.DataFrame(rng.normal(size=(nrows, nvariables)), columns=[f'x{i}' for i in range(nvariables)])
+    X['x1'] = X['x0'] + 0.2 * rng.normal(size=nrows)
+    y = X.to_numpy()[:, :3] @ np.array([2.0, 1.0, -1.5]) + rng.normal(size=nrows)
+    return X, y
+
+
+class TestLinearSubsetModel(unittest.TestCase):
+    def test_fit(self) -> None:
+        X, y = _example_data()
+        model = LinearSubsetModel(X, y)
+        variables = ['x0', 'x2', 'x4']
+        fit = model(variables)
+        reference = LinearRegression().fit(X[variables], y)
+        assert fit.coef_ == pytest.approx(reference.coef_)
+        assert fit.intercept_ == pytest.approx(reference.intercept_)
+        assert fit.predict(X) == pytest.approx(reference.predict(X[variables]))
+        assert model.sse(variables) == pytest.approx(np.sum((y - reference.predict(X[variables])) ** 2))
+
+        assert model([]).predict(X) == pytest.approx(np.full(len(y), y.mean()))
+
+        with pytest.raises(ValueError):
+            model(['unknown'])
+        with pytest.raises(ValueError):
+            LinearSubsetModel(X, y, score='R2')
+
+    def test_score(self) -> None:
+        X, y = _example_data()
+        variables = ['x0', 'x3']
+        reference = LinearRegression().fit(X[variables], y)
+        pred = reference.predict(X[variables])
+        expected = {
+            'AIC': AIC_score(y, pred, reference),
+            'BIC': BIC_score(y, pred, reference),
+            'adjusted_r2': -adjusted_r2_score(y, pred, reference),
+        }
+        for score, value in expected.items():
+            model = LinearSubsetModel(X, y, score=score)
+            assert model.score(model(variables), variables) == pytest.approx(value), score
+
+        model = LinearSubsetModel(X.to_numpy(), y, feature_names=list(X.columns))
+        assert model.score(model(variables), variables) == pytest.approx(expected['AIC'])
+
+    def test_exact_fit(self) -> None:
+        X, _ = _example_data(nvariables=3)
+        X.columns = ['a', 'b', 'c']
+        for score in SCORES:
+            model = LinearSubsetModel(X, 2 * X['a'] + X['b'], score=score)
+            assert forward_selection(['a', 'b', 'c'], model)[1] == ['a', 'b']
+            assert stepwise_selection(['a', 'b', 'c'], model, verbose=False)[1] == ['a', 'b']
+            assert [r['variables'] for r in exhaustive_search(['a', 'b', 'c'], model)][1] == ['a', 'b']
+            assert 0 < model.sse(['a', 'b']) <= 1e-9 * model.yy
+
+            # constant outcome
+            model = LinearSubsetModel(X, np.full(len(X), 3.0), score=score)
+            assert np.isfinite(model.score(model(['a']), ['a']))
+            assert forward_selection(['a', 'b', 'c'], model)[1] == []
+
+    def test_exhaustive_search(self) -> None:
+        X, y = _example_data(nvariables=8)
+        variables = list(X.columns)
+
+        def train_model(variables: List[str]) -> Any:
+            return LinearRegression().fit(X[variables], y)
+
+        for score in ('AIC', 'BIC', 'adjusted_r2'):
+            model = LinearSubsetModel(X, y, score=score)
+
+            def score_model(fitted: Any, variables: List[str], model: LinearSubsetModel = model) -> float:
+                return model.criterion(np.sum((y - fitted.predict(X[variables])) ** 2), len(variables))
+
+            expected = exhaustive_search(variables, train_model, score_model)
+            result = exhaustive_search(variables, model)
+            assert [r['variables'] for r in result] == [r['variables'] for r in expected]
+            assert [r['n'] for r in result] == list(range(1, len(variables) + 1))
+            for r, e in zip(result, expected):
+                assert r['score'] == pytest.approx(e['score'])
+                assert r['model'].coef_ == pytest.approx(e['model'].coef_)
+
+        # opaque score_model or top_k fall back to brute force
+        model = LinearSubsetModel(X, y)
+        result = exhaustive_search(variables[:5], model, top_k=2)
+        assert [r['variables'] for r in result[::2]] == [r['variables'] for r in exhaustive_search(variables[:5], model)]
+        assert len(result) == 9
+        result = exhaustive_search(variables[:3], model, model.score)
+        assert [r['variables'] for r in result] == [r['variables'] for r in exhaustive_search(variables[:3], model)]
+
+        with pytest.raises(ValueError):
+            exhaustive_search(variables, train_model)
+
+    def test_exhaustive_search_options(self) -> None:
+        X, y = _example_data(nvariables=8)
+        variables = list(X.columns)
+        model = LinearSubsetModel(X, y)
+        expected = exhaustive_search(variables, model)
+        with TemporaryDirectory() as tempdir:
+            checkpoint = Path(tempdir) / 'exhaustive.json'
+            result = exhaustive_search(variables, model, checkpoint=checkpoint)
+            assert json.loads(checkpoint.read_text())['state']['size'] == len(variables) + 1
+            # a completed search is restored and its models are refitted
+            resumed = exhaustive_search(variables, model, checkpoint=checkpoint)
+            for r, e in zip([result, resumed], [expected, expected]):
+                assert [x['variables'] for x in r] == [x['variables'] for x in e]
+                assert [x['score'] for x in r] == pytest.approx([x['score'] for x in e])
+            assert resumed[2]['model'].coef_ == pytest.approx(expected[2]['model'].coef_)
+
+        assert [r['model'].variables for r in exhaustive_search(variables, model, models='refit')] == \
+            [r['variables'] for r in expected]
+        assert all(r['model'] is None for r in exhaustive_search(variables, model, models='none'))
+
+        cache = SubsetCache()
+        exhaustive_search(variables, model, cache=cache)
+        assert len(cache) == len(variables)
+        assert cache.lookup(expected[2]['variables']) is not None
+
+        with pytest.warns(UserWarning, match='leaps and bounds'):
+            result = exhaustive_search(variables, model, n_jobs=2)
+        assert [r['variables'] for r in result] == [r['variables'] for r in expected]
+
+    def test_score_step(self) -> None:
+        X, y = _example_data(nvariables=8)
+        X['x7'] = X['x2'] - X['x3']  # collinear with the current model
+        model = LinearSubsetModel(X, y, score='BIC')
+        for variables in ([], ['x2', 'x3', 'x5'], ['x0', 'x1', 'x2', 'x3', 'x4', 'x5', 'x6']):
+            add = [v for v in X.columns if v not in variables]
+            addScores, removeScores = model.score_step(variables, add, variables)
+            for v, score in zip(add, addScores):
+                assert score == pytest.approx(model.score(model([*variables, v]), [*variables, v]))
+            for v, score in zip(variables, removeScores):
+                subset = [x for x in variables if x != v]
+                assert score == pytest.approx(model.score(model(subset), subset))
+
+    def test_stepwise_selection(self) -> None:
+        X, y = _example_data(nvariables=8)
+        variables = list(X.columns)
+        model = LinearSubsetModel(X, y)
+
+        def train_model(variables: List[str]) -> Any:
+            if not variables:
+                return None
+            return LinearRegression().fit(X[variables], y)
+
+        def score_model(fitted: Any, variables: List[str]) -> float:
+            if not variables:
+                return AIC_score(y, [y.mean()] * len(y), fitted, df=1)
+            return AIC_score(y, fitted.predict(X[variables]), fitted)
+
+        for selection in (forward_selection, backward_elimination):
+            expected: Any = selection(variables, train_model, score_model)
+            result: Any = selection(variables, model)
+            assert result[1] == expected[1]
+            assert result[0].coef_ == pytest.approx(expected[0].coef_)
+
+        for direction in ('both', 'forward', 'backward'):
+            expected = stepwise_selection(variables, train_model, score_model, direction=direction, verbose=False)
+            result = stepwise_selection(variables, model, direction=direction, verbose=False)
+            assert result[1] == expected[1]
+            assert result[0].variables == expected[1]
+
+        with pytest.raises(ValueError):
+            forward_selection(variables, train_model)
+
+
+class TestCrossValidatedSubsetModel(unittest.TestCase):
+    def test_score(self) -> None:
+        X, y = _example_data()
+        model = CrossValidatedSubsetModel(LinearRegression(), X, y, scoring='neg_mean_squared_error')
+        variables = ['x0', 'x2']
+        folds = KFold(n_splits=5, shuffle=True, random_state=0)
+        expected = cross_val_score(LinearRegression(), X[variables], y, cv=folds, scoring='neg_mean_squared_error')
+        assert model.score(None, variables) == pytest.approx(-expected.mean())
+        assert model.score_subsets([variables, ['x1']]) == pytest.approx(
+            [model.score(None, variables), model.score(None, ['x1'])])
+        # without variables, the model predicts the mean of the training folds
+        assert model.score(None, []) == pytest.approx(np.var(y), rel=0.1)
+
+        fitted = model(variables)
+        assert fitted.coef_ == pytest.approx(LinearRegression().fit(X[variables], y).coef_)
+
+        with pytest.raises(ValueError):
+            model(['unknown'])
+        with pytest.raises(ValueError):
+            CrossValidatedSubsetModel(LinearRegression(), X, y, cv=ShuffleSplit(n_splits=5, random_state=0))
+
+    def test_time_series_split(self) -> None:
+        X, y = _example_data()
+        variables = ['x0', 'x2']
+        folds = TimeSeriesSplit(n_splits=5)
+        model = CrossValidatedSubsetModel(LinearRegression(), X, y, cv=folds, scoring='neg_mean_squared_error')
+        # the training sets only contain the rows before the test set
+        expected = cross_val_score(LinearRegression(), X[variables], y, cv=folds, scoring='neg_mean_squared_error')
+        assert model.score(None, variables) == pytest.approx(-expected.mean())
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            assert model.score_subsets([variables], executor) == pytest.approx([-expected.mean()])
+
+    def test_pickle(self) -> None:
+        X, y = _example_data()
+        model: Any = CrossValidatedSubsetModel(LinearRegression(), X, y, scoring='neg_mean_squared_error')
+        expected = model.score(None, ['x0', 'x2'])
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            assert model.score_subsets([['x0', 'x2']], executor) == pytest.approx([expected])
+        directory = Path(model._workerCopy._shared['_X']).parent
+        assert directory.exists()
+
+        # pickles and copies contain the data, independent of the files shared with worker processes
+        pickled = pickle.dumps(model)
+        copied = copy.deepcopy(model)
+        del model
+        gc.collect()
+        assert not directory.exists()
+        assert pickle.loads(pickled).score(None, ['x0', 'x2']) == pytest.approx(expected)  # noqa: S301
+        assert copied.score(None, ['x0', 'x2']) == pytest.approx(expected)
+
+    def test_selection(self) -> None:
+        X, y = _example_data(nvariables=8)
+        variables = list(X.columns)
+        model = CrossValidatedSubsetModel(LinearRegression(), X, y, scoring='neg_mean_squared_error')
+
+        def train_model(_variables: List[str]) -> Any:
+            return None
+
+        def score_model(_fitted: Any, variables: List[str]) -> float:
+            return model.score(None, variables)
+
+        for selection in (forward_selection, backward_elimination, stepwise_selection):
+            expected: Any = selection(variables, train_model, score_model, verbose=False)
+            result: Any = selection(variables, model, 'cv', verbose=False)
+            assert result[1] == expected[1]
+            assert result[0].coef_ == pytest.approx(model(expected[1]).coef_)
+            assert selection(variables, model, verbose=False, n_jobs=2)[1] == expected[1]
+        assert set(expected[1]) >= {'x2'}
+
+        # worker processes memory-map the data; class labels
+        labels = np.where(y > np.median(y), 'high', 'low')
+        classifier = CrossValidatedSubsetModel(LogisticRegression(), X, labels)
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            result = forward_selection(variables, classifier, executor=executor)
+        assert result[1] == forward_selection(variables, classifier)[1]
+        assert set(result[0].classes_) == {'high', 'low'}
+
+        # exhaustive search scores the subsets by cross-validation and only fits the returned subsets
+        fitted: List[List[str]] = []
+
+        class CountingModel(CrossValidatedSubsetModel):
+            def __call__(self, variables: List[str]) -> Any:
+                fitted.append(variables)
+                return super().__call__(variables)
+
+        counting = CountingModel(LinearRegression(), X[variables[:5]], y, scoring='neg_mean_squared_error')
+        expected = exhaustive_search(variables[:5], train_model, score_model)
+        result = exhaustive_search(variables[:5], counting)
+        assert [r['variables'] for r in result] == [r['variables'] for r in expected]
+        assert sorted(fitted) == sorted(r['variables'] for r in result)
+        assert [r['variables'] for r in exhaustive_search(variables[:5], counting, n_jobs=2)] == \
+            [r['variables'] for r in expected]
+
+        with pytest.raises(ValueError):
+            forward_selection(variables, train_model, 'cv')
+        with pytest.raises(ValueError):
+            forward_selection(variables, model, 'AIC')
+
+    def test_halving(self) -> None:
+        X, y = _example_data(nvariables=12, nrows=3000)
+        variables = list(X.columns)
+        fullRows: List[int] = []
+
+        class CountingModel(CrossValidatedSubsetModel):
+            def score_subsets(self, subsets: List[List[str]], executor: Any = None, *,
+                              nrows: Optional[int] = None) -> List[float]:
+                if nrows is None:
+                    fullRows.append(len(subsets))
+                return super().score_subsets(subsets, executor, nrows=nrows)
+
+        model = CountingModel(LinearRegression(), X, y, scoring='neg_mean_squared_error')
+        assert model.score_subsets([['x0']], nrows=300) != model.score_subsets([['x0']])
+        assert model.score_subsets([['x0']], nrows=5000) == model.score_subsets([['x0']])
+
+        traces = []
+        for halving in (None, 100):
+            fullRows.clear()
+            out = StringIO()
+            with redirect_stdout(out):
+                result: Any = stepwise_selection(variables, model, halving=halving)
+            traces.append(out.getvalue())
+            assert result[1][:3] == ['x0', 'x2', 'x1']
+            if halving is None:
+                assert max(fullRows) == len(variables)
+            else:
+                assert max(fullRows) <= 2
+        assert traces[0] == traces[1]
+
+        with pytest.raises(ValueError):
+            stepwise_selection(variables, LinearSubsetModel(X, y), halving=100)
+        with pytest.raises(ValueError):
+            stepwise_selection(variables, model, halving=0)
+
+    def test_halving_small_samples(self) -> None:
+        X, y = _example_data(nvariables=12, nrows=2000)
+        variables = list(X.columns)
+        # samples are clamped to min_sample_rows, so that no split is empty; R2 scores are defined
+        model = CrossValidatedSubsetModel(LinearRegression(), X, y)
+        assert model.min_sample_rows == 100
+        assert model.score_subsets([['x0']], nrows=2) == model.score_subsets([['x0']], nrows=100)
+        expected = stepwise_selection(variables, model, verbose=False)[1]
+        for halving in (2, 5):
+            assert stepwise_selection(variables, model, halving=halving, verbose=False)[1] == expected
+
+        # undefined scores on a sample rank last
+        class NaNModel(CrossValidatedSubsetModel):
+            def score_subsets(self, subsets: List[List[str]], executor: Any = None, *,
+                              nrows: Optional[int] = None) -> List[float]:
+                scores = super().score_subsets(subsets, executor, nrows=nrows)
+                return [math.nan if subset == ['x0'] and nrows is not None else score
+                        for subset, score in zip(subsets, scores)]
+
+        candidates = [[v] for v in variables]
+        nanModel = NaNModel(LinearRegression(), X, y)
+        survivors = _halving_survivors(candidates, nanModel, None, 100)
+        assert 0 not in survivors
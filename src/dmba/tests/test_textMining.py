@@ -5,13 +5,18 @@ Applications in Python"
 (c) 2019-2023 Galit Shmueli, Peter C. Bruce, Peter Gedeck
 '''
 import unittest
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
 from contextlib import redirect_stdout
 from io import StringIO
+from typing import Any
 
 import pandas as pd
+import pytest
+import scipy.sparse as sp
 from sklearn.feature_extraction.text import CountVectorizer
 
-from dmba import printTermDocumentMatrix
+from dmba import CorpusVectorizer, get_data_file, printTermDocumentMatrix, termDocumentMatrix, textMining
 
 
 class TestTextMining(unittest.TestCase):
@@ -32,3 +37,82 @@ class TestTextMining(unittest.TestCase):
         assert 'S1  S2  S3' in s
         assert 'first      1   0   0' in s
         assert 'the        1   0   1' in s
+
+    def test_termDocumentMatrix_selection(self) -> None:
+        text = ['this is the first sentence.',
+                'this is a second sentence.',
+                'the third sentence is here.']
+        count_vect = CountVectorizer()
+        counts = count_vect.fit_transform(text)
+
+        df: Any = termDocumentMatrix(count_vect, counts)
+        assert isinstance(df.dtypes.iloc[0], pd.SparseDtype)
+        expected = pd.DataFrame(counts.toarray().transpose(), index=count_vect.get_feature_names_out(),
+                                columns=['S1', 'S2', 'S3'])
+        pd.testing.assert_frame_equal(df.sparse.to_dense(), expected, check_dtype=False)
+
+        df = termDocumentMatrix(count_vect, counts, top_n=2)
+        assert list(df.index) == ['is', 'sentence']
+        df = termDocumentMatrix(count_vect, counts, top_n=2, documents=[0, 2])
+        assert list(df.index) == ['is', 'sentence']
+        assert list(df.columns) == ['S1', 'S3']
+        df = termDocumentMatrix(count_vect, counts, terms=['third', 'first'], documents=slice(1, 3))
+        assert list(df.index) == ['third', 'first']
+        assert df.sparse.to_dense().to_numpy().tolist() == [[0, 1], [0, 0]]
+        df = termDocumentMatrix(count_vect, counts, terms=slice(0, 3))
+        assert list(df.index) == ['first', 'here', 'is']
+
+        out = StringIO()
+        with redirect_stdout(out):
+            printTermDocumentMatrix(count_vect, counts, top_n=1, documents=slice(0, 2))
+        assert out.getvalue().split() == ['S1', 'S2', 'is', '1', '1']
+
+    def test_printTermDocumentMatrix_large(self) -> None:
+        counts = sp.random(2000, 1000, density=0.001, format='csr', random_state=0)
+        count_vect = CountVectorizer().fit([' '.join(f'term{i:04d}' for i in range(1000))])
+        # without a selection, the output is truncated
+        out = StringIO()
+        with redirect_stdout(out):
+            printTermDocumentMatrix(count_vect, counts)
+        lines = out.getvalue().splitlines()
+        assert lines[0].startswith('The term-document matrix has 1000 terms and 2000 documents')
+        assert 'truncated' in lines[0]
+        assert lines[2].split()[0] == 'S1'
+        assert len(lines) == 3 + textMining.PRINT_TERMS
+        with pytest.raises(ValueError):
+            printTermDocumentMatrix(count_vect, counts, documents=slice(0, 1500))
+
+        out = StringIO()
+        with redirect_stdout(out):
+            printTermDocumentMatrix(count_vect, counts, top_n=5, documents=slice(0, 10))
+        assert len(out.getvalue().splitlines()) == 6
+        assert textMining.MAX_PRINT_CELLS < 2000 * 1000
+
+    def test_CorpusVectorizer(self) -> None:
+        corpus = CorpusVectorizer(batch_size=300, n_features=2 ** 12)
+        batches = list(corpus)
+        assert [counts.shape for _, counts in batches] == [(300, 2 ** 12)] * 6 + [(200, 2 ** 12)]
+        members = [member for batch, _ in batches for member in batch]
+        assert len(members) == 2000
+        assert members[0].startswith('AutoAndElectronics/rec.autos/')
+
+        # counts are raw term frequencies
+        counts = sp.vstack([counts for _, counts in batches])
+        assert counts.min() == 0
+        assert counts[0].sum() == len(corpus.vectorizer.build_analyzer()(_read_member(members[0])))
+
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            parallel = list(CorpusVectorizer(batch_size=300, n_features=2 ** 12, executor=executor))
+        assert [batch for batch, _ in parallel] == [batch for batch, _ in batches]
+        assert all((a != b).nnz == 0 for (_, a), (_, b) in zip(parallel, batches))
+
+        out = StringIO()
+        with redirect_stdout(out):
+            printTermDocumentMatrix(corpus.vectorizer, batches[0][1], top_n=3, documents=slice(0, 2))
+        assert out.getvalue().split()[:2] == ['S1', 'S2']
+        assert out.getvalue().split()[2].startswith('hash')
+
+
+def _read_member(member: str) -> str:
+    with zipfile.ZipFile(get_data_file('AutoAndElectronics.zip')) as archive:
+        return archive.read(member).decode('latin-1')
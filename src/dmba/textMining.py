@@ -4,18 +4,181 @@ Applications in Python"
 
 (c) 2019-2023 Galit Shmueli, Peter C. Bruce, Peter Gedeck
 '''
+import os
+import zipfile
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from functools import partial
+from typing import TYPE_CHECKING, Any, Callable, Deque, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
 import pandas as pd
-import scipy.sparse as sp
-from sklearn.feature_extraction.text import CountVectorizer
+
+from .data import _iter_zip_members, get_data_file
+from .parallel import n_workers, worker_executor
+
+if TYPE_CHECKING:
+    import scipy.sparse as sp
+    from sklearn.feature_extraction.text import CountVectorizer
+
+# term-document matrices with more cells are only printed for a selection of terms or documents; without
+# a selection, the most frequent terms of the first documents are printed
+MAX_PRINT_CELLS = 1_000_000
+PRINT_TERMS = 20
+PRINT_DOCUMENTS = 10
+
+Selection = Union[slice, Sequence[int], Sequence[str], None]
 
 
-def printTermDocumentMatrix(count_vect: CountVectorizer, counts: sp.spmatrix) -> None:
+def printTermDocumentMatrix(count_vect: 'CountVectorizer', counts: 'sp.spmatrix', *, top_n: Optional[int] = None,
+                            terms: Selection = None, documents: Selection = None) -> None:
     """ Print term-document matrix created by the CountVectorizer
+
+    Only the selected part of the matrix is converted to a dense table. Without a selection, matrices with
+    more than MAX_PRINT_CELLS cells are truncated to the PRINT_TERMS most frequent terms of the first
+    PRINT_DOCUMENTS documents.
+
+    Input:
+        count_vect: scikit-learn Count vectorizer
+        counts: term-document matrix returned by transform method of counter vectorizer
+        top_n (optional): only print the top_n most frequent terms of the selected documents
+        terms (optional): slice, term indices, or terms to print, e.g. slice(0, 50) for the first page
+        documents (optional): slice or indices of the documents to print
+    """
+    termNames, documentNames, matrix = _selectTermDocumentMatrix(count_vect, counts, top_n, terms, documents)
+    if matrix.shape[0] * matrix.shape[1] > MAX_PRINT_CELLS:
+        if top_n is not None or terms is not None or documents is not None:
+            raise ValueError(f'The selection has {matrix.shape[0]} terms and {matrix.shape[1]} documents; '
+                             'select a smaller part of the term-document matrix using top_n, terms, or documents')
+        print(f'The term-document matrix has {matrix.shape[0]} terms and {matrix.shape[1]} documents; the output is '
+              f'truncated to the {PRINT_TERMS} most frequent terms of the first {PRINT_DOCUMENTS} documents '
+              '(select a part using top_n, terms, or documents)\n')
+        termNames, documentNames, matrix = _selectTermDocumentMatrix(count_vect, counts, PRINT_TERMS, None,
+                                                                     slice(0, PRINT_DOCUMENTS))
+    print(pd.DataFrame(data=matrix.toarray(), index=termNames, columns=documentNames))
+
+
+def termDocumentMatrix(count_vect: 'CountVectorizer', counts: 'sp.spmatrix', *, top_n: Optional[int] = None,
+                       terms: Selection = None, documents: Selection = None) -> pd.DataFrame:
+    """ Term-document matrix as a data frame with sparse columns
+
     Input:
         count_vect: scikit-learn Count vectorizer
         counts: term-document matrix returned by transform method of counter vectorizer
+        top_n (optional): only include the top_n most frequent terms of the selected documents
+        terms (optional): slice, term indices, or terms to include
+        documents (optional): slice or indices of the documents to include
+
+    Returns:
+        data frame with the terms as rows and the documents S1, S2, ... as columns
     """
-    shape = counts.shape
-    columns = [f'S{i}' for i in range(1, shape[0] + 1)]
-    print(pd.DataFrame(data=counts.toarray().transpose(),
-                       index=count_vect.get_feature_names_out(), columns=columns))
+    termNames, documentNames, matrix = _selectTermDocumentMatrix(count_vect, counts, top_n, terms, documents)
+    return pd.DataFrame.sparse.from_spmatrix(matrix, index=termNames, columns=documentNames)  # type: ignore
+
+
+def _selectTermDocumentMatrix(count_vect: 'CountVectorizer', counts: 'sp.spmatrix', top_n: Optional[int],
+                              terms: Selection, documents: Selection) -> Tuple[List[str], List[str], 'sp.csr_matrix']:
+    """ Select documents (rows of counts) and terms (columns) without converting to a dense matrix
+
+    Returns:
+        (term names, document names, sparse matrix with terms as rows and documents as columns)
+    """
+    import scipy.sparse as sp  # noqa: PLC0415
+    counts = sp.csr_matrix(counts)
+
+    documentIdx = np.arange(counts.shape[0])
+    if documents is not None:
+        documentIdx = documentIdx[documents] if isinstance(documents, slice) else np.asarray(documents, dtype=int)
+        counts = counts[documentIdx]
+
+    termIdx = np.arange(counts.shape[1])
+    if terms is not None:
+        if isinstance(terms, slice):
+            termIdx = termIdx[terms]
+        else:
+            vocabulary = {name: i for i, name in enumerate(_featureNames(count_vect, np.arange(counts.shape[1])))}
+            termIdx = np.array([vocabulary[t] if isinstance(t, str) else t for t in terms], dtype=int)
+    if top_n is not None:
+        # most frequent terms first; ties in the order of the terms
+        frequency = np.asarray(counts.sum(axis=0)).ravel()[termIdx]
+        termIdx = termIdx[np.argsort(-frequency, kind='stable')[:top_n]]
+    if terms is not None or top_n is not None:
+        counts = counts.tocsc()[:, termIdx]
+    return _featureNames(count_vect, termIdx), [f'S{i + 1}' for i in documentIdx], counts.transpose().tocsr()
+
+
+def _featureNames(count_vect: Any, termIdx: np.ndarray) -> List[str]:
+    """ Names of the selected terms; without vocabulary, e.g. for a HashingVectorizer, terms are named hash<index> """
+    if not hasattr(count_vect, 'get_feature_names_out'):
+        return [f'hash{i}' for i in termIdx]
+    return list(np.asarray(count_vect.get_feature_names_out(), dtype=object)[termIdx])
+
+
+class CorpusVectorizer:
+    """ Term-document matrices of a zipped text corpus, e.g. AutoAndElectronics.zip, computed in batches
+
+    The documents are read directly from the zip archive and converted to term counts using a
+    scikit-learn HashingVectorizer. As the HashingVectorizer has no vocabulary, batches are
+    vectorized independently, optionally in parallel processes, and only a limited number of
+    batches is held in memory. The matrices can be printed with printTermDocumentMatrix(corpus.vectorizer, counts).
+
+    Example:
+        corpus = CorpusVectorizer('AutoAndElectronics.zip', n_jobs=-1)
+        for members, counts in corpus:
+            ...
+
+    Input:
+        name (optional): name of the zipped corpus (default AutoAndElectronics.zip)
+        batch_size (optional): number of documents per term-document matrix
+        n_jobs (optional): number of processes; -1 uses all processors
+        executor (optional): concurrent.futures executor used instead of n_jobs
+        encoding (optional): encoding of the documents (default latin-1)
+        vectorizer_kwargs: keyword arguments of HashingVectorizer; by default, the matrices
+                           contain raw counts (alternate_sign=False, norm=None)
+    """
+    def __init__(self, name: str = 'AutoAndElectronics.zip', *, batch_size: int = 500, n_jobs: Optional[int] = None,
+                 executor: Optional[Executor] = None, encoding: str = 'latin-1', **vectorizer_kwargs: Any) -> None:
+        from sklearn.feature_extraction.text import HashingVectorizer  # noqa: PLC0415
+        self.data_file = get_data_file(name)
+        if not self.data_file.exists():
+            raise ValueError(f'Data file {name} not found')
+        if batch_size < 1:
+            raise ValueError('batch_size must be a positive integer')
+        self.batch_size = batch_size
+        self.n_jobs = n_jobs
+        self.executor = executor
+        self.encoding = encoding
+        self.vectorizer = HashingVectorizer(**{'alternate_sign': False, 'norm': None, **vectorizer_kwargs})
+
+    def __iter__(self) -> Iterator[Tuple[List[str], 'sp.csr_matrix']]:
+        """ Returns an iterator over (member names, term-document matrix) for the batches of documents """
+        batches = ([member for member, _ in batch]
+                   for batch in _iter_zip_members(self.data_file, self.batch_size, read=False))
+        work = partial(_vectorizeMembers, data_file=str(self.data_file), vectorizer=self.vectorizer,
+                       encoding=self.encoding)
+        nWorkers = (os.cpu_count() or 1) if self.executor is not None else n_workers(self.n_jobs)
+        with worker_executor(self.n_jobs, self.executor, ProcessPoolExecutor) as pool:
+            if pool is None:
+                yield from map(work, batches)
+            else:
+                yield from _boundedMap(pool, work, batches, window=2 * nWorkers)
+
+
+def _vectorizeMembers(members: List[str], *, data_file: str, vectorizer: Any,
+                      encoding: str) -> Tuple[List[str], 'sp.csr_matrix']:
+    """ Read the members from the archive and convert them to a term-document matrix """
+    with zipfile.ZipFile(data_file) as archive:
+        texts = [archive.read(member).decode(encoding) for member in members]
+    return members, vectorizer.transform(texts).tocsr()
+
+
+def _boundedMap(executor: Executor, function: Callable[[Any], Any], items: Iterable[Any],
+                window: int) -> Iterator[Any]:
+    """ Like executor.map, but submits at most window items ahead of the results that were consumed """
+    pending: Deque[Future] = deque()
+    for item in items:
+        pending.append(executor.submit(function, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()